@@ -26,6 +26,7 @@ from ec2api import clients
 from ec2api.db import api as db_api
 from ec2api import exception
 from ec2api.i18n import _
+from ec2api import os_state_cache
 
 CONF = cfg.CONF
 
@@ -121,14 +122,31 @@ class AddressDescriber(common.UniversalDescriber):
                                self.db_instances_dict)
 
     def get_os_items(self):
+        os_floating_ips = self.get_cached_os_items(
+            address_engine.get_cached_os_floating_ips)
+        if os_floating_ips is not None:
+            return os_floating_ips
         return address_engine.get_os_floating_ips(self.context)
 
+    def is_os_items_cache_consistent(self):
+        if not super(AddressDescriber, self).is_os_items_cache_consistent():
+            return False
+        # NOTE(ft): a cached floating IP may not be associated yet, which
+        # must not lead to disassociation of the address
+        os_floating_ips = {f['id']: f for f in self.os_items}
+        return not any(_is_address_association_lost(
+                           item, os_floating_ips[item['os_id']])
+                       for item in (self.items or []))
+
     def auto_update_db(self, item, os_item):
         item = super(AddressDescriber, self).auto_update_db(item, os_item)
-        if (item and 'network_interface_id' in item and
-                (not os_item.get('port_id') or
-                 os_item['fixed_ip_address'] != item['private_ip_address'])):
-            _disassociate_address_item(self.context, item)
+        if item and _is_address_association_lost(item, os_item):
+            if CONF.use_reconciler:
+                self.reconcile(common.RECONCILE_DISASSOCIATE_ADDRESS, item)
+                item.pop('network_interface_id')
+                item.pop('private_ip_address')
+            else:
+                _disassociate_address_item(self.context, item)
         return item
 
     def get_name(self, os_item):
@@ -144,6 +162,13 @@ def describe_addresses(context, public_ip=None, allocation_id=None,
     return {'addressesSet': formatted_addresses}
 
 
+def _is_address_association_lost(address, os_floating_ip):
+    return ('network_interface_id' in address and
+            (not os_floating_ip.get('port_id') or
+             os_floating_ip['fixed_ip_address'] !=
+             address['private_ip_address']))
+
+
 def _format_address(context, address, os_floating_ip, os_ports=[],
                     db_instances_dict=None):
     ec2_address = {'publicIp': os_floating_ip['floating_ip_address']}
@@ -384,6 +409,9 @@ class AddressEngineNeutron(object):
                 neutron.update_floatingip(address['os_id'],
                                           {'floatingip': {'port_id': None}})
 
+    def get_cached_os_floating_ips(self, context):
+        return os_state_cache.get_os_floating_ips(context)
+
     def get_os_floating_ips(self, context):
         neutron = clients.neutron(context)
         return neutron.list_floatingips(
@@ -431,6 +459,9 @@ class AddressEngineNova(object):
             nova.servers.remove_floating_ip(os_instance_id, public_ip)
         return None
 
+    def get_cached_os_floating_ips(self, context):
+        return None
+
     def get_os_floating_ips(self, context):
         nova = clients.nova(context)
         return self.convert_ips_to_neutron_format(context,
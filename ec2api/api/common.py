@@ -33,6 +33,11 @@ ec2_opts = [
     cfg.BoolOpt('full_vpc_support',
                 default=True,
                 help='True if server supports Neutron for full VPC access'),
+    cfg.BoolOpt('use_reconciler',
+                default=False,
+                help='Do not repair DB in describe operations, but register '
+                     'found inconsistencies to be repaired by '
+                     'ec2-api-reconciler service'),
 ]
 
 CONF = cfg.CONF
@@ -283,6 +288,13 @@ class Validator(object):
 VPC_KINDS = ['vpc', 'igw', 'subnet', 'eni', 'dopt', 'eipalloc', 'rtb',
              'vgw', 'cgw', 'vpn']
 
+# NOTE(ft): actions of the reconciler to repair DB inconsistencies found by
+# describers
+RECONCILE_DELETE_OBSOLETE_ITEM = 'delete_obsolete_item'
+RECONCILE_CREATE_DEFAULT_SECURITY_GROUP = 'create_default_security_group'
+RECONCILE_UPDATE_IMAGE_VISIBILITY = 'update_image_visibility'
+RECONCILE_DISASSOCIATE_ADDRESS = 'disassociate_address'
+
 
 class UniversalDescriber(object):
     """Abstract Describer class for various Describe implementations."""
@@ -291,6 +303,10 @@ class UniversalDescriber(object):
     SORT_KEY = ''
     FILTER_MAP = {}
 
+    reconciliations = None
+    use_os_state_cache = True
+    os_items_cached = False
+
     def format(self, item=None, os_item=None):
         pass
 
@@ -303,6 +319,18 @@ class UniversalDescriber(object):
     def get_os_items(self):
         return []
 
+    def get_cached_os_items(self, get_os_states, *args):
+        if not self.use_os_state_cache:
+            return None
+        os_items = get_os_states(self.context, *args)
+        if os_items is not None:
+            self.os_items_cached = True
+        return os_items
+
+    def is_os_items_cache_consistent(self):
+        os_ids = set(self.get_id(os_item) for os_item in self.os_items)
+        return all(item['os_id'] in os_ids for item in (self.items or []))
+
     def auto_update_db(self, item, os_item):
         if item is None and self.KIND not in VPC_KINDS:
             item = ec2utils.auto_create_db_item(self.context, self.KIND,
@@ -385,7 +413,23 @@ class UniversalDescriber(object):
         return formatted_items
 
     def handle_unpaired_item(self, item):
-        self.delete_obsolete_item(item)
+        if CONF.use_reconciler:
+            self.reconcile(RECONCILE_DELETE_OBSOLETE_ITEM, item)
+        else:
+            self.delete_obsolete_item(item)
+
+    def reconcile(self, action, item):
+        """Register DB inconsistency to be repaired by the reconciler."""
+        if self.reconciliations is None:
+            self.reconciliations = []
+        self.reconciliations.append({'item_id': item['id'],
+                                     'action': action,
+                                     'data': {'os_id': item.get('os_id')}})
+
+    def flush_reconciliations(self):
+        if self.reconciliations:
+            db_api.add_reconciliations(self.context, self.reconciliations)
+            self.reconciliations = None
 
     def describe(self, context, ids=None, names=None, filter=None,
                  max_results=None, next_token=None):
@@ -400,6 +444,13 @@ class UniversalDescriber(object):
         self.names = set(names or [])
         self.items = self.get_db_items()
         self.os_items = self.get_os_items()
+        if self.os_items_cached and not self.is_os_items_cache_consistent():
+            # NOTE(ft): the cache may not have caught up on notifications
+            # yet, so absence of an item in it doesn't mean the item is
+            # deleted. OpenStack items are listed live to not lose DB items
+            self.use_os_state_cache = False
+            self.os_items_cached = False
+            self.os_items = self.get_os_items()
         formatted_items = []
 
         self.items_dict = {i['os_id']: i for i in (self.items or [])}
@@ -440,6 +491,7 @@ class UniversalDescriber(object):
                     formatted_items.append(formatted_item)
                 if item['id'] in self.ids:
                     self.ids.remove(item['id'])
+        self.flush_reconciliations()
         # NOTE(Alex): some requested items are not found
         if self.ids or self.names:
             params = {'id': next(iter(self.ids or self.names))}
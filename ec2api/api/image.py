@@ -14,19 +14,18 @@
 
 import base64
 import binascii
+import collections
 import json
 import os
-import shutil
 import tarfile
-import tempfile
 import time
 
 import boto.s3.connection
 from cinderclient import exceptions as cinder_exception
 import eventlet
+from eventlet.green import subprocess
 from glanceclient.common import exceptions as glance_exception
 from lxml import etree
-from oslo_concurrency import processutils
 from oslo_config import cfg
 from oslo_log import log as logging
 
@@ -37,15 +36,18 @@ from ec2api import clients
 from ec2api.db import api as db_api
 from ec2api import exception
 from ec2api.i18n import _, _LE, _LI, _LW
+from ec2api import image_worker
 from ec2api.openstack.common import timeutils
+from ec2api import utils
 
 
 LOG = logging.getLogger(__name__)
 
 s3_opts = [
-    cfg.StrOpt('image_decryption_dir',
-               default='/tmp',
-               help='Parent directory for tempdir used for image decryption'),
+    cfg.IntOpt('image_download_concurrency',
+               default=4,
+               help='Number of image bundle parts to download from S3 at '
+                    'the same time'),
     cfg.StrOpt('s3_host',
                default='$my_ip',
                help='Hostname or IP for OpenStack to use when accessing '
@@ -73,6 +75,21 @@ rpcapi_opts = [
 
 CONF.register_opts(rpcapi_opts)
 
+ec2_opts = [
+    cfg.IntOpt('image_catalog_ttl',
+               default=60,
+               help='Time in seconds to keep Glance images visible to a '
+                    'project in the cache of an API worker. Meanwhile only '
+                    'images changed since the last request are requested '
+                    'from Glance. 0 disables the cache'),
+    cfg.IntOpt('image_catalog_cache_size',
+               default=100,
+               help='Maximum number of projects, which Glance images are '
+                    'cached by an API worker'),
+]
+
+CONF.register_opts(ec2_opts)
+
 
 """Images related API implementation
 """
@@ -88,6 +105,7 @@ CONTAINER_TO_KIND = {'aki': 'aki',
                      # There is no idea about its actuality
                      'kernel': 'aki',
                      'ramdisk': 'ari'}
+IMAGE_KINDS = ('ami', 'ari', 'aki')
 IMAGE_TYPES = {'aki': 'kernel',
                'ari': 'ramdisk',
                'ami': 'machine'}
@@ -132,48 +150,6 @@ def create_image(context, instance_id, name=None, description=None,
     name_map = dict(instance=instance['os_id'], now=timeutils.isotime())
     name = name or _('image of %(instance)s at %(now)s') % name_map
 
-    def delayed_create(context, image, name, os_instance):
-        try:
-            os_instance.stop()
-
-            # wait instance for really stopped
-            start_time = time.time()
-            while os_instance.status != 'SHUTOFF':
-                time.sleep(1)
-                os_instance.get()
-                # NOTE(yamahata): timeout and error. 1 hour for now for safety.
-                #                 Is it too short/long?
-                #                 Or is there any better way?
-                timeout = 1 * 60 * 60
-                if time.time() > start_time + timeout:
-                    err = (_("Couldn't stop instance within %d sec") % timeout)
-                    raise exception.EC2Exception(message=err)
-
-            # NOTE(ft): create an image with ec2_id metadata to let other code
-            # link os and db objects in race conditions
-            os_image_id = os_instance.create_image(
-                name, metadata={'ec2_id': image['id']})
-            image['os_id'] = os_image_id
-            db_api.update_item(context, image)
-        except Exception:
-            LOG.exception(_LE('Failed to complete image %s creation'),
-                          image.id)
-            try:
-                image['state'] = 'failed'
-                db_api.update_item(context, image)
-            except Exception:
-                LOG.warning(_LW("Couldn't set 'failed' state for db image %s"),
-                            image.id, exc_info=True)
-
-        try:
-            os_instance.start()
-        except Exception:
-            LOG.warning(_LW('Failed to start instance %(i_id)s after '
-                            'completed creation of image %(image_id)s'),
-                        {'i_id': instance['id'],
-                         'image_id': image['id']},
-                        exc_info=True)
-
     image = {'is_public': False,
              'description': description}
     if restart_instance:
@@ -181,7 +157,11 @@ def create_image(context, instance_id, name=None, description=None,
         # but cannot change it later. But Nova doesn't specify container format
         # for snapshots of volume backed instances, so that it is 'ami' in fact
         image = db_api.add_item(context, 'ami', image)
-        eventlet.spawn_n(delayed_create, context, image, name, os_instance)
+        image_worker.add_job(context, image_worker.ACTION_CREATE_IMAGE,
+                             {'image_id': image['id'],
+                              'instance_id': instance['id'],
+                              'os_instance_id': instance['os_id'],
+                              'name': name})
     else:
         glance = clients.glance(context)
         with common.OnCrashCleaner() as cleaner:
@@ -193,9 +173,67 @@ def create_image(context, instance_id, name=None, description=None,
             image['os_id'] = os_image_id
             image = db_api.add_item(context, _get_os_image_kind(os_image),
                                     image)
+        _invalidate_image_catalog(context)
     return {'imageId': image['id']}
 
 
+def _create_image_job(context, data):
+    image = db_api.get_item_by_id(context, data['image_id'])
+    if not image:
+        return
+    os_instance = None
+    try:
+        os_instance = clients.nova(context).servers.get(
+            data['os_instance_id'])
+        if context.is_os_admin:
+            # NOTE(ft): the job is resumed after a death of the API worker,
+            # but the image must be created with user credentials to belong
+            # to the user's project
+            raise exception.EC2Exception(
+                message=_('Image creation was interrupted'))
+        os_instance.stop()
+
+        # wait instance for really stopped
+        start_time = time.time()
+        while os_instance.status != 'SHUTOFF':
+            time.sleep(1)
+            os_instance.get()
+            # NOTE(yamahata): timeout and error. 1 hour for now for safety.
+            #                 Is it too short/long?
+            #                 Or is there any better way?
+            timeout = 1 * 60 * 60
+            if time.time() > start_time + timeout:
+                err = (_("Couldn't stop instance within %d sec") % timeout)
+                raise exception.EC2Exception(message=err)
+
+        # NOTE(ft): create an image with ec2_id metadata to let other code
+        # link os and db objects in race conditions
+        os_image_id = os_instance.create_image(
+            data['name'], metadata={'ec2_id': image['id']})
+        image['os_id'] = os_image_id
+        db_api.update_item(context, image)
+    except Exception:
+        LOG.exception(_LE('Failed to complete image %s creation'),
+                      image['id'])
+        try:
+            image['state'] = 'failed'
+            db_api.update_item(context, image)
+        except Exception:
+            LOG.warning(_LW("Couldn't set 'failed' state for db image %s"),
+                        image['id'], exc_info=True)
+
+    if not os_instance:
+        return
+    try:
+        os_instance.start()
+    except Exception:
+        LOG.warning(_LW('Failed to start instance %(i_id)s after '
+                        'completed creation of image %(image_id)s'),
+                    {'i_id': data['instance_id'],
+                     'image_id': image['id']},
+                    exc_info=True)
+
+
 def register_image(context, name=None, image_location=None,
                    description=None, architecture=None,
                    root_device_name=None, block_device_mapping=None,
@@ -271,6 +309,7 @@ def register_image(context, name=None, image_location=None,
         image = db_api.add_item(context, kind, {'os_id': os_image.id,
                                                 'is_public': False,
                                                 'description': description})
+    _invalidate_image_catalog(context)
     return {'imageId': image['id']}
 
 
@@ -290,6 +329,7 @@ def deregister_image(context, image_id):
             glance.images.delete(os_image.id)
         except glance_exception.HTTPNotFound:
             pass
+        _invalidate_image_catalog(context)
     db_api.delete_item(context, image_id)
     return True
 
@@ -322,25 +362,19 @@ class ImageDescriber(common.TaggableItemsDescriber):
                              self.ids_dict, self.snapshot_ids)
 
     def get_db_items(self):
-        # TODO(ft): we can't get all images from DB per one request due
-        # different kinds. It's need to refactor DB API and ec2utils functions
-        # to work with kind smarter
         if self.ids:
             local_images = db_api.get_items_by_ids(self.context, self.ids)
         else:
-            local_images = sum((db_api.get_items(self.context, kind)
-                                for kind in ('ami', 'ari', 'aki')), [])
-        public_images = sum((db_api.get_public_items(self.context, kind,
-                                                     self.ids)
-                             for kind in ('ami', 'ari', 'aki')), [])
+            local_images = db_api.get_items(self.context, IMAGE_KINDS)
+        public_images = db_api.get_public_items(self.context, IMAGE_KINDS,
+                                                self.ids)
 
         mapped_ids = []
         if self.ids:
             mapped_ids = [{'id': item_id,
                            'os_id': os_id}
-                          for kind in ('ami', 'ari', 'aki')
                           for item_id, os_id in db_api.get_items_ids(
-                              self.context, kind, item_ids=self.ids)]
+                              self.context, IMAGE_KINDS, item_ids=self.ids)]
 
         # NOTE(ft): mapped_ids must be the first to let complete items from
         # next lists to override mappings, which do not have item body data
@@ -364,14 +398,34 @@ class ImageDescriber(common.TaggableItemsDescriber):
         return images
 
     def get_os_items(self):
-        os_images = list(clients.glance(self.context).images.list())
-        self.ec2_created_os_images = {
-            os_image.properties['ec2_id']: os_image
-            for os_image in os_images
-            if (os_image.properties.get('ec2_id') and
-                self.context.project_id == os_image.owner)}
+        os_images = _get_os_images(self.context)
+        if not self.selective_describe:
+            self._map_other_project_images(os_images)
+        self.ec2_created_os_images = {}
+        if self.pending_images:
+            self.ec2_created_os_images = {
+                os_image.properties['ec2_id']: os_image
+                for os_image in os_images
+                if (os_image.properties.get('ec2_id') and
+                    self.context.project_id == os_image.owner)}
         return os_images
 
+    def _map_other_project_images(self, os_images):
+        # NOTE(ft): ids of images of other projects are mapped in bulk instead
+        # of one by one in auto_update_db
+        known_os_ids = set(i['os_id'] for i in self.items)
+        os_ids_by_kind = collections.defaultdict(list)
+        for os_image in os_images:
+            if (os_image.owner != self.context.project_id and
+                    os_image.id not in known_os_ids):
+                os_ids_by_kind[_get_os_image_kind(os_image)].append(
+                    os_image.id)
+        for kind, os_ids in os_ids_by_kind.items():
+            self.ids_dict.update(
+                (os_id, item_id)
+                for item_id, os_id in db_api.ensure_item_ids(
+                    self.context, kind, os_ids))
+
     def auto_update_db(self, image, os_image):
         if not image:
             kind = _get_os_image_kind(os_image)
@@ -396,7 +450,10 @@ class ImageDescriber(common.TaggableItemsDescriber):
         elif (self.context.project_id == os_image.owner and
                 image.get('is_public') != os_image.is_public):
             image['is_public'] = os_image.is_public
-            if image['id'] in self.local_images_os_ids:
+            if CONF.use_reconciler:
+                self.reconcile(common.RECONCILE_UPDATE_IMAGE_VISIBILITY,
+                               image)
+            elif image['id'] in self.local_images_os_ids:
                 db_api.update_item(self.context, image)
             else:
                 # TODO(ft): currently update_item can not update id mapping,
@@ -415,7 +472,7 @@ class ImageDescriber(common.TaggableItemsDescriber):
             db_api.delete_item(self.context, image['id'])
 
     def get_tags(self):
-        return db_api.get_tags(self.context, ('ami', 'ari', 'aki'), self.ids)
+        return db_api.get_tags(self.context, IMAGE_KINDS, self.ids)
 
     def handle_unpaired_item(self, item):
         if item['os_id']:
@@ -449,6 +506,64 @@ class ImageDescriber(common.TaggableItemsDescriber):
         return image
 
 
+# NOTE(ft): Glance images visible to projects by project ids
+_image_catalogs = None
+_GLANCE_PAGE_SIZE = 1000
+
+
+class _ImageCatalog(object):
+
+    def __init__(self):
+        self.images = {}
+        self.changes_since = None
+
+    def update(self, os_images):
+        for os_image in os_images:
+            if (getattr(os_image, 'deleted', False) or
+                    os_image.status == 'deleted'):
+                self.images.pop(os_image.id, None)
+            else:
+                self.images[os_image.id] = os_image
+            updated_at = getattr(os_image, 'updated_at', None)
+            if updated_at and (not self.changes_since or
+                               updated_at > self.changes_since):
+                self.changes_since = updated_at
+
+
+def _get_os_images(context):
+    glance = clients.glance(context)
+    if not CONF.image_catalog_ttl:
+        return list(glance.images.list())
+    image_catalogs = _get_image_catalogs()
+    catalog = image_catalogs.get(context.project_id)
+    if catalog and catalog.changes_since:
+        # NOTE(ft): Glance returns deleted images as well in this case
+        os_images = glance.images.list(
+            page_size=_GLANCE_PAGE_SIZE,
+            filters={'changes-since': catalog.changes_since})
+        catalog.update(os_images)
+    else:
+        # NOTE(ft): a catalog is stored only when it's fully listed, so it's
+        # fully relisted after the expiration
+        catalog = _ImageCatalog()
+        catalog.update(glance.images.list(page_size=_GLANCE_PAGE_SIZE))
+        image_catalogs.set(context.project_id, catalog)
+    return list(catalog.images.values())
+
+
+def _get_image_catalogs():
+    global _image_catalogs
+    if _image_catalogs is None:
+        _image_catalogs = utils.ExpiringCache(CONF.image_catalog_cache_size,
+                                              CONF.image_catalog_ttl)
+    return _image_catalogs
+
+
+def _invalidate_image_catalog(context):
+    if _image_catalogs is not None:
+        _image_catalogs.pop(context.project_id)
+
+
 def describe_images(context, executable_by=None, image_id=None,
                     owner=None, filter=None):
     formatted_images = ImageDescriber().describe(
@@ -590,6 +705,7 @@ def modify_image_attribute(context, image_id, attribute=None,
 
         _check_owner(context, os_image)
         os_image.update(is_public=(operation_type == 'add'))
+        _invalidate_image_catalog(context)
         return True
 
     if 'description' in attributes:
@@ -612,6 +728,7 @@ def reset_image_attribute(context, image_id, attribute):
     _check_owner(context, os_image)
 
     os_image.update(is_public=False)
+    _invalidate_image_catalog(context)
     return True
 
 
@@ -796,6 +913,8 @@ ec2utils.register_auto_create_db_item_extension(
 
 # NOTE(ft): following functions are copied from various parts of Nova
 
+_S3_CHUNK_SIZE = 64 * 1024
+
 # translate our internal state to states valid by the EC2 API documentation
 _s3_image_state_map = {'downloading': 'pending',
                        'failed_download': 'failed',
@@ -833,79 +952,49 @@ def _s3_create(context, metadata):
     glance = clients.glance(context)
     image = glance.images.create(**metadata)
 
-    def _update_image_state(image_state):
-        image.update(properties={'image_state': image_state})
-
-    def delayed_create():
-        """This handles the fetching and decrypting of the part files."""
-        context.update_store()
-        try:
-            image_path = tempfile.mkdtemp(dir=CONF.image_decryption_dir)
-            log_vars = {'image_location': image_location,
-                        'image_path': image_path}
-
-            _update_image_state('downloading')
-            try:
-                parts = []
-                for part_name in image_parts:
-                    part = _s3_download_file(bucket, part_name, image_path)
-                    parts.append(part)
-
-                # NOTE(vish): this may be suboptimal, should we use cat?
-                enc_filename = os.path.join(image_path, 'image.encrypted')
-                with open(enc_filename, 'w') as combined:
-                    for filename in parts:
-                        with open(filename) as part:
-                            shutil.copyfileobj(part, combined)
-
-            except Exception:
-                LOG.exception(_LE('Failed to download %(image_location)s '
-                                  'to %(image_path)s'), log_vars)
-                _update_image_state('failed_download')
-                return
+    image_worker.add_job(context, image_worker.ACTION_S3_IMPORT,
+                         {'os_image_id': image.id,
+                          'image_location': image_location,
+                          'image_parts': image_parts,
+                          'encrypted_key': encrypted_key,
+                          'encrypted_iv': encrypted_iv})
 
-            _update_image_state('decrypting')
-            try:
-                dec_filename = os.path.join(image_path, 'image.tar.gz')
-                _s3_decrypt_image(context, enc_filename, encrypted_key,
-                                  encrypted_iv, dec_filename)
-            except Exception:
-                LOG.exception(_LE('Failed to decrypt %(image_location)s '
-                                  'to %(image_path)s'), log_vars)
-                _update_image_state('failed_decrypt')
-                return
+    return image
 
-            _update_image_state('untarring')
-            try:
-                unz_filename = _s3_untarzip_image(image_path, dec_filename)
-            except Exception:
-                LOG.exception(_LE('Failed to untar %(image_location)s '
-                                  'to %(image_path)s'), log_vars)
-                _update_image_state('failed_untar')
-                return
 
-            _update_image_state('uploading')
-            try:
-                with open(unz_filename) as image_file:
-                    image.update(data=image_file)
-            except Exception:
-                LOG.exception(_LE('Failed to upload %(image_location)s '
-                                  'to %(image_path)s'), log_vars)
-                _update_image_state('failed_upload')
-                return
+def _s3_import_job(context, data):
+    """This handles the fetching and decrypting of the part files."""
+    image_location = data['image_location']
+    log_vars = {'image_location': image_location}
+    image = clients.glance(context).images.get(data['os_image_id'])
 
-            _update_image_state('available')
+    def _update_image_state(image_state):
+        image.update(properties={'image_state': image_state})
 
-            shutil.rmtree(image_path)
-        except glance_exception.HTTPNotFound:
-            LOG.info(_LI('Image %swas deleted underneath us'), image.id)
+    try:
+        _update_image_state('downloading')
+        try:
+            bucket = _s3_conn(context).get_bucket(
+                image_location.split('/')[0])
         except Exception:
-            LOG.exception(_LE('Failed to complete image %s creation'),
-                          image.id)
-
-    eventlet.spawn_n(delayed_create)
+            LOG.exception(_LE('Failed to download %(image_location)s'),
+                          log_vars)
+            _update_image_state('failed_download')
+            return
+        try:
+            key, iv = _s3_decrypt_key(context, data['encrypted_key'],
+                                      data['encrypted_iv'])
+        except Exception:
+            LOG.exception(_LE('Failed to decrypt %(image_location)s'),
+                          log_vars)
+            _update_image_state('failed_decrypt')
+            return
 
-    return image
+        image_state = _s3_import_image(bucket, data['image_parts'], key, iv,
+                                       image, _update_image_state, log_vars)
+        _update_image_state(image_state)
+    except glance_exception.HTTPNotFound:
+        LOG.info(_LI('Image %swas deleted underneath us'), image.id)
 
 
 def _s3_parse_manifest(context, manifest):
@@ -962,15 +1051,90 @@ def _s3_parse_manifest(context, manifest):
     return metadata, image_parts, encrypted_key, encrypted_iv
 
 
-def _s3_download_file(bucket, filename, local_dir):
-    key = bucket.get_key(filename)
-    local_filename = os.path.join(local_dir, os.path.basename(filename))
-    key.get_contents_to_filename(local_filename)
-    return local_filename
+def _s3_import_image(bucket, image_parts, key, iv, image,
+                     update_image_state, log_vars):
+    """Stream image parts through decryption and untar to Glance.
+
+    Parts are downloaded concurrently and piped to openssl in their order,
+    the decrypted stream is untarred on the fly, and the image file is
+    uploaded to Glance while the rest of the bundle is being downloaded.
+    Returns the final image state.
+    """
+    failures = set()
+    decryptor = subprocess.Popen(['openssl', 'enc', '-d', '-aes-128-cbc',
+                                  '-K', key, '-iv', iv],
+                                 stdin=subprocess.PIPE,
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+    feeder = eventlet.spawn(_s3_feed_decryptor, decryptor,
+                            _s3_download_parts(bucket, image_parts),
+                            failures, log_vars)
+    stage = 'untar'
+    try:
+        # NOTE(ft): download, decryption and untar run at the same time, so
+        # the image is 'downloading' until the image file is found in the
+        # tarball and its upload starts
+        tar_file = tarfile.open(fileobj=decryptor.stdout, mode='r|gz')
+        image_file, image_size = _s3_untarzip_image(tar_file)
+        stage = 'upload'
+        update_image_state('uploading')
+        image.update(data=_S3ImageFile(image_file), size=image_size)
+        stage = None
+        # NOTE(ft): read the tarball tail to let the decryptor check padding
+        # of the last block
+        while decryptor.stdout.read(_S3_CHUNK_SIZE):
+            pass
+    except Exception:
+        LOG.exception(_LE('Failed to %(stage)s %(image_location)s'),
+                      dict(log_vars, stage=stage))
+        failures.add(stage)
+        try:
+            decryptor.kill()
+        except OSError:
+            pass
+    feeder.wait()
+    error = decryptor.stderr.read()
+    if decryptor.wait() and not failures:
+        LOG.error(_LE('Failed to decrypt %(image_location)s: %(err)s'),
+                  dict(log_vars, err=error))
+        failures.add('decrypt')
+
+    # NOTE(ft): a failure breaks next stages of the pipeline as well,
+    # so the earliest failed stage is reported
+    for stage in ('download', 'decrypt', 'untar', 'upload'):
+        if stage in failures:
+            return 'failed_' + stage
+    return 'available'
+
+
+def _s3_download_parts(bucket, image_parts):
+    """Download image parts concurrently, yield their contents in order."""
+    pool = eventlet.GreenPool(CONF.image_download_concurrency)
+    return pool.imap(
+        lambda filename: bucket.get_key(filename).get_contents_as_string(),
+        image_parts)
+
+
+def _s3_feed_decryptor(decryptor, parts, failures, log_vars):
+    try:
+        for data in parts:
+            try:
+                decryptor.stdin.write(data)
+            except (IOError, OSError):
+                # NOTE(ft): the decryptor is stopped by a failure of a next
+                # stage, which is reported there
+                return
+    except Exception:
+        LOG.exception(_LE('Failed to download %(image_location)s'), log_vars)
+        failures.add('download')
+    finally:
+        try:
+            decryptor.stdin.close()
+        except (IOError, OSError):
+            pass
 
 
-def _s3_decrypt_image(context, encrypted_filename, encrypted_key,
-                      encrypted_iv, decrypted_filename):
+def _s3_decrypt_key(context, encrypted_key, encrypted_iv):
     encrypted_key = binascii.a2b_hex(encrypted_key)
     encrypted_iv = binascii.a2b_hex(encrypted_iv)
     cert_client = clients.nova_cert(context)
@@ -984,39 +1148,42 @@ def _s3_decrypt_image(context, encrypted_filename, encrypted_key,
     except Exception as exc:
         msg = _('Failed to decrypt initialization vector: %s') % exc
         raise exception.EC2Exception(msg)
+    return key, iv
 
-    try:
-        processutils.execute('openssl', 'enc',
-                             '-d', '-aes-128-cbc',
-                             '-in', '%s' % (encrypted_filename,),
-                             '-K', '%s' % (key,),
-                             '-iv', '%s' % (iv,),
-                             '-out', '%s' % (decrypted_filename,))
-    except processutils.ProcessExecutionError as exc:
-        raise exception.EC2Exception(_('Failed to decrypt image file '
-                                       '%(image_file)s: %(err)s') %
-                                     {'image_file': encrypted_filename,
-                                      'err': exc.stdout})
-
-
-def _s3_untarzip_image(path, filename):
-    _s3_test_for_malicious_tarball(path, filename)
-    tar_file = tarfile.open(filename, 'r|gz')
-    tar_file.extractall(path)
-    image_file = tar_file.getnames()[0]
-    tar_file.close()
-    return os.path.join(path, image_file)
-
-
-def _s3_test_for_malicious_tarball(path, filename):
-    """Raises exception if extracting tarball would escape extract path."""
-    tar_file = tarfile.open(filename, 'r|gz')
-    for n in tar_file.getnames():
-        if not os.path.abspath(os.path.join(path, n)).startswith(path):
-            tar_file.close()
-            # TODO(ft): figure out actual AWS exception
-            raise exception.EC2InvalidException(_('Unsafe filenames in image'))
-    tar_file.close()
+
+def _s3_untarzip_image(tar_file):
+    """Find the image file in a tarball stream.
+
+    Returns the file object to read the image and the image size.
+    """
+    for member in tar_file:
+        _s3_test_for_malicious_tarball(member.name)
+        if member.isfile():
+            return tar_file.extractfile(member), member.size
+    raise exception.EC2InvalidException(_('Image file is absent in bundle'))
+
+
+def _s3_test_for_malicious_tarball(filename):
+    """Raises exception if extracting the file would escape extract path."""
+    path = '/image'
+    if not os.path.abspath(os.path.join(path, filename)).startswith(
+            path + '/'):
+        # TODO(ft): figure out actual AWS exception
+        raise exception.EC2InvalidException(_('Unsafe filenames in image'))
+
+
+class _S3ImageFile(object):
+    """Read-only wrapper of an image file of a tarball stream.
+
+    Glance client gets size of file objects by seeking them, but stream
+    tarball members can not be sought back.
+    """
+
+    def __init__(self, image_file):
+        self._image_file = image_file
+
+    def read(self, size=-1):
+        return self._image_file.read(size)
 
 
 def _s3_conn(context):
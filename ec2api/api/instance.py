@@ -19,6 +19,7 @@ import itertools
 import random
 import time
 
+import eventlet
 from novaclient import exceptions as nova_exception
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -34,6 +35,8 @@ from ec2api import context as ec2_context
 from ec2api.db import api as db_api
 from ec2api import exception
 from ec2api.i18n import _, _LE
+from ec2api import os_state_cache
+from ec2api import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -44,7 +47,11 @@ ec2_opts = [
                      'describe instances'),
     cfg.StrOpt('default_flavor',
                default='m1.small',
-               help='A flavor to use as a default instance type')
+               help='A flavor to use as a default instance type'),
+    cfg.BoolOpt('prebuild_instance_metadata',
+                default=False,
+                help='Build and store static metadata of instances at '
+                     'launch to serve their first metadata requests faster'),
 ]
 
 CONF = cfg.CONF
@@ -122,7 +129,7 @@ def run_instances(context, image_id, min_count, max_count,
         multiple_instances=max_count > 1)
 
     ec2_reservation_id = _generate_reservation_id()
-    instance_ids = []
+    instances = []
     with common.OnCrashCleaner() as cleaner:
         # NOTE(ft): create Neutron's ports manually and run instances one
         # by one to have a chance to:
@@ -166,13 +173,16 @@ def run_instances(context, image_id, min_count, max_count,
 
             instance = db_api.add_item(context, 'i', instance)
             cleaner.addCleanup(db_api.delete_item, context, instance['id'])
-            instance_ids.append(instance['id'])
+            instances.append(instance)
 
             nova.servers.update(os_instance, name=instance['id'])
 
             instance_engine.post_launch_action(
                 context, cleaner, launch_context, instance['id'])
 
+    if CONF.prebuild_instance_metadata:
+        _prebuild_metadata(context, instances)
+    instance_ids = [i['id'] for i in instances]
     ec2_reservations = describe_instances(context, instance_ids)
     reservation_count = len(ec2_reservations['reservationSet'])
     if reservation_count != 1:
@@ -189,22 +199,25 @@ def terminate_instances(context, instance_id):
     instances = ec2utils.get_db_items(context, 'i', instance_ids)
 
     nova = clients.nova(context)
-    state_changes = []
     for instance in instances:
         if instance.get('disable_api_termination'):
             message = _("The instance '%s' may not be terminated. Modify its "
                         "'disableApiTermination' instance attribute and try "
                         "again.") % instance['id']
             raise exception.OperationNotPermitted(message=message)
-    for instance in instances:
+
+    def terminate(instance):
         try:
             os_instance = nova.servers.get(instance['os_id'])
         except nova_exception.NotFound:
             os_instance = None
         else:
             os_instance.delete()
-        state_change = _format_state_change(instance, os_instance)
-        state_changes.append(state_change)
+        return _format_state_change(instance, os_instance)
+
+    results = utils.execute_concurrently(terminate, instances)
+    _raise_first_error(instances, results)
+    state_changes = [state_change for state_change, _error in results]
 
     # NOTE(ft): don't delete items from DB until they disappear from OS.
     # They will be auto deleted by a describe operation
@@ -331,15 +344,25 @@ class InstanceDescriber(common.TaggableItemsDescriber):
         self.groups_name_to_id = _get_groups_name_to_id(self.context)
         self.volumes = {v['os_id']: v
                         for v in db_api.get_items(self.context, 'vol')}
-        self.image_ids = {i['os_id']: i['id']
-                          for i in itertools.chain(
-                              db_api.get_items(self.context, 'ami'),
-                              db_api.get_public_items(self.context, 'ami'))}
         return instances
 
     def get_os_items(self):
-        self.os_volumes = _get_os_volumes(self.context)
+        self.os_volumes = _get_os_volumes(
+            self.context, use_os_state_cache=self.use_os_state_cache)
         self.os_flavors = _get_os_flavors(self.context)
+        os_instances = self._get_os_instances()
+        # NOTE(ft): map ids of used images only instead of all known ones
+        os_image_ids = set(os_instance.image['id']
+                           for os_instance in os_instances
+                           if os_instance.image)
+        self.image_ids = (
+            dict((os_id, item_id)
+                 for item_id, os_id in db_api.get_items_ids(
+                     self.context, 'ami', item_os_ids=os_image_ids))
+            if os_image_ids else {})
+        return os_instances
+
+    def _get_os_instances(self):
         nova = clients.nova(ec2_context.get_os_admin_context())
         if len(self.ids) == 1 and len(self.items) == 1:
             try:
@@ -347,6 +370,10 @@ class InstanceDescriber(common.TaggableItemsDescriber):
             except nova_exception.NotFound:
                 return []
         else:
+            os_instances = self.get_cached_os_items(
+                os_state_cache.get_os_servers, nova)
+            if os_instances is not None:
+                return os_instances
             return nova.servers.list(
                 search_opts={'all_tenants': True,
                              'project_id': self.context.project_id})
@@ -705,6 +732,9 @@ def _modify_instance_type(context, instance, instance_type):
         if vm_state != vm_states_RESIZED:
             break
         time.sleep(1)
+    if CONF.prebuild_instance_metadata:
+        # NOTE(ft): the instance type is a part of prebuilt metadata
+        db_api.delete_instance_metadata(context, [instance['os_id']])
 
 
 def reset_instance_attribute(context, instance_id, attribute):
@@ -861,7 +891,17 @@ def _remove_instances(context, instances):
             if delete_on_termination:
                 network_interface_api.delete_network_interface(context,
                                                                eni['id'])
-        db_api.delete_item(context, instance_id)
+    db_api.delete_items(context, ids)
+    if CONF.prebuild_instance_metadata:
+        db_api.delete_instance_metadata(context,
+                                        [i['os_id'] for i in instances])
+
+
+def _prebuild_metadata(context, instances):
+    # NOTE(ft): metadata API module imports this one
+    from ec2api.metadata import api as metadata_api
+
+    eventlet.spawn_n(metadata_api.prebuild_metadata, context, instances)
 
 
 def _check_min_max_count(min_count, max_count):
@@ -1070,42 +1110,70 @@ def _foreach_instance(context, instance_ids, valid_states, func):
             raise exception.IncorrectInstanceState(
                 instance_id=next(inst['id'] for inst in instances
                                  if inst['os_id'] == os_instance.id))
-    for os_instance in os_instances:
-        func(os_instance)
+    results = utils.execute_concurrently(func, os_instances)
+    _raise_first_error(os_instances, results)
     return True
 
 
 def _get_os_instances_by_instances(context, instances, exactly=False,
                                    nova=None):
     nova = nova or clients.nova(context)
-    os_instances = []
-    obsolete_instances = []
-    for instance in instances:
+
+    def get_os_instance(instance):
         try:
-            os_instances.append(nova.servers.get(instance['os_id']))
+            return nova.servers.get(instance['os_id'])
         except nova_exception.NotFound:
+            return None
+
+    results = utils.execute_concurrently(get_os_instance, instances)
+    os_instances = []
+    obsolete_instances = []
+    for instance, (os_instance, error) in zip(instances, results):
+        if error:
+            continue
+        if os_instance:
+            os_instances.append(os_instance)
+        else:
             obsolete_instances.append(instance)
     if obsolete_instances:
         _remove_instances(context, obsolete_instances)
-        if exactly:
-            raise exception.InvalidInstanceIDNotFound(
-                                id=obsolete_instances[0]['id'])
+    _raise_first_error(instances, results)
+    if obsolete_instances and exactly:
+        raise exception.InvalidInstanceIDNotFound(
+                            id=obsolete_instances[0]['id'])
 
     return os_instances
 
 
+def _raise_first_error(items, results):
+    errors = [(item, error)
+              for item, (_result, error) in zip(items, results)
+              if error]
+    if not errors:
+        return
+    for item, error in errors[1:]:
+        LOG.error(_LE('Operation on %(item)s failed: %(error)s'),
+                  {'item': getattr(item, 'id', None) or item['id'],
+                   'error': error})
+    raise errors[0][1]
+
+
 def _get_os_flavors(context):
     os_flavors = clients.nova(context).flavors.list()
     return dict((f.id, f.name) for f in os_flavors)
 
 
-def _get_os_volumes(context):
+def _get_os_volumes(context, use_os_state_cache=False):
     search_opts = ({'all_tenants': True,
                     'project_id': context.project_id}
                    if context.is_os_admin else None)
     os_volumes = collections.defaultdict(list)
     cinder = clients.cinder(context)
-    for os_volume in cinder.volumes.list(search_opts=search_opts):
+    os_volume_list = (os_state_cache.get_os_volumes(context, cinder)
+                      if use_os_state_cache else None)
+    if os_volume_list is None:
+        os_volume_list = cinder.volumes.list(search_opts=search_opts)
+    for os_volume in os_volume_list:
         os_attachment = next(iter(os_volume.attachments), {})
         os_instance_id = os_attachment.get('server_id')
         if os_instance_id:
@@ -30,6 +30,7 @@ from ec2api.db import api as db_api
 from ec2api import exception
 from ec2api.i18n import _
 from ec2api.openstack.common import timeutils
+from ec2api import os_state_cache
 
 
 CONF = cfg.CONF
@@ -237,6 +238,9 @@ class NetworkInterfaceDescriber(common.TaggableItemsDescriber):
                         address['networkInterfaceId']].append(address)
         self.security_groups = (
             security_group_api._format_security_groups_ids_names(self.context))
+        os_ports = self.get_cached_os_items(os_state_cache.get_os_ports)
+        if os_ports is not None:
+            return os_ports
         neutron = clients.neutron(self.context)
         return neutron.list_ports(tenant_id=self.context.project_id)['ports']
 
@@ -32,6 +32,7 @@ def list_opts():
              ec2api.api.common.ec2_opts,
              ec2api.api.dhcp_options.ec2_opts,
              ec2api.api.ec2utils.ec2_opts,
+             ec2api.api.image.ec2_opts,
              ec2api.api.image.s3_opts,
              ec2api.api.image.rpcapi_opts,
              ec2api.api.instance.ec2_opts,
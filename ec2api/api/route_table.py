@@ -26,6 +26,7 @@ from ec2api import clients
 from ec2api.db import api as db_api
 from ec2api import exception
 from ec2api.i18n import _
+from ec2api import utils
 
 
 HOST_TARGET = 'host'
@@ -268,7 +269,8 @@ class RouteTableDescriber(common.TaggableItemsDescriber,
                      route_table['id']),
             gateways=self.gateways,
             network_interfaces=self.network_interfaces,
-            vpn_connections_by_gateway_id=self.vpn_connections_by_gateway_id)
+            vpn_connections_by_gateway_id=self.vpn_connections_by_gateway_id,
+            instance_states=self.instance_states)
 
     def get_db_items(self):
         associations = collections.defaultdict(list)
@@ -292,7 +294,10 @@ class RouteTableDescriber(common.TaggableItemsDescriber,
             vpns = vpns_by_gateway_id.setdefault(vpn['vpn_gateway_id'], [])
             vpns.append(vpn)
         self.vpn_connections_by_gateway_id = vpns_by_gateway_id
-        return super(RouteTableDescriber, self).get_db_items()
+        route_tables = super(RouteTableDescriber, self).get_db_items()
+        self.instance_states = _get_route_instances_states(
+            self.context, route_tables, self.network_interfaces)
+        return route_tables
 
 
 def describe_route_tables(context, route_table_id=None, filter=None):
@@ -445,7 +450,8 @@ def _format_route_table(context, route_table, is_main=False,
                         associated_subnet_ids=[],
                         gateways={},
                         network_interfaces={},
-                        vpn_connections_by_gateway_id={}):
+                        vpn_connections_by_gateway_id={},
+                        instance_states=None):
     vpc_id = route_table['vpc_id']
     ec2_route_table = {
         'routeTableId': route_table['id'],
@@ -458,8 +464,9 @@ def _format_route_table(context, route_table, is_main=False,
         # if no tag exists
         'tagSet': [],
     }
-    # TODO(ft): refactor to get Nova instances outside of this function
-    nova = clients.nova(context)
+    if instance_states is None:
+        instance_states = _get_route_instances_states(
+            context, [route_table], network_interfaces)
     for route in route_table['routes']:
         origin = ('CreateRouteTable'
                   if route.get('gateway_id', 0) is None else
@@ -487,14 +494,7 @@ def _format_route_table(context, route_table, is_main=False,
                            None)
             state = 'blackhole'
             if instance_id:
-                instance = db_api.get_item_by_id(context, instance_id)
-                if instance:
-                    try:
-                        os_instance = nova.servers.get(instance['os_id'])
-                        if os_instance and os_instance.status == 'ACTIVE':
-                            state = 'active'
-                    except nova_exception.NotFound:
-                        pass
+                state = instance_states.get(instance_id, 'blackhole')
                 ec2_route.update({'instanceId': instance_id,
                                   'instanceOwnerId': context.project_id})
             ec2_route.update({'networkInterfaceId': network_interface_id,
@@ -567,19 +567,78 @@ def _update_subnet_routes(context, cleaner, subnet, route_table):
 
 
 def _update_host_routes(context, neutron, cleaner, route_table, subnets):
+    if not subnets:
+        return
     destinations = _get_active_route_destinations(context, route_table)
-    for subnet in subnets:
-        # TODO(ft): do list subnet w/ filters instead of show one by one
-        os_subnet = neutron.show_subnet(subnet['os_id'])['subnet']
+    os_subnets = neutron.list_subnets(
+        id=[subnet['os_id'] for subnet in subnets])['subnets']
+    updates = []
+    for os_subnet in os_subnets:
         host_routes, gateway_ip = _get_subnet_host_routes_and_gateway_ip(
             context, route_table, os_subnet['cidr'], destinations)
-        neutron.update_subnet(subnet['os_id'],
-                              {'subnet': {'host_routes': host_routes,
-                                          'gateway_ip': gateway_ip}})
+        if (gateway_ip == os_subnet['gateway_ip'] and
+                _are_same_host_routes(host_routes, os_subnet['host_routes'])):
+            continue
+        updates.append((os_subnet, {'host_routes': host_routes,
+                                    'gateway_ip': gateway_ip}))
+
+    def update_subnet(update):
+        os_subnet, subnet_body = update
+        neutron.update_subnet(os_subnet['id'], {'subnet': subnet_body})
+
+    results = utils.execute_concurrently(update_subnet, updates)
+    # NOTE(ft): rollback of all successfully updated subnets is registered
+    # before an error of others is raised
+    errors = []
+    for (os_subnet, _subnet_body), (_result, error) in zip(updates, results):
+        if error:
+            errors.append(error)
+            continue
         cleaner.addCleanup(
-            neutron.update_subnet, subnet['os_id'],
+            neutron.update_subnet, os_subnet['id'],
             {'subnet': {'host_routes': os_subnet['host_routes'],
                         'gateway_ip': os_subnet['gateway_ip']}})
+    if errors:
+        raise errors[0]
+
+
+def _are_same_host_routes(host_routes, os_host_routes):
+    def get_key(host_route):
+        return (host_route['destination'], host_route['nexthop'])
+
+    return (sorted(get_key(r) for r in host_routes) ==
+            sorted(get_key(r) for r in os_host_routes))
+
+
+def _get_route_instances_states(context, route_tables, network_interfaces):
+    """Get states of routes to instances of route tables by instance ids."""
+    instance_ids = set()
+    for route_table in route_tables:
+        for route in route_table['routes']:
+            network_interface = network_interfaces.get(
+                route.get('network_interface_id'))
+            if network_interface and network_interface.get('instance_id'):
+                instance_ids.add(network_interface['instance_id'])
+    if not instance_ids:
+        return {}
+    instances = db_api.get_items_ids(context, 'i', item_ids=instance_ids)
+    nova = clients.nova(context)
+
+    def get_os_instance_status(os_id):
+        try:
+            return nova.servers.get(os_id).status
+        except nova_exception.NotFound:
+            return None
+
+    results = utils.execute_concurrently(
+        get_os_instance_status, [os_id for _id, os_id in instances])
+    instance_states = {}
+    for (instance_id, _os_id), (status, error) in zip(instances, results):
+        if error:
+            raise error
+        instance_states[instance_id] = ('active' if status == 'ACTIVE' else
+                                        'blackhole')
+    return instance_states
 
 
 def _get_active_route_destinations(context, route_table):
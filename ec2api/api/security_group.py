@@ -30,6 +30,7 @@ from ec2api import clients
 from ec2api.db import api as db_api
 from ec2api import exception
 from ec2api.i18n import _
+from ec2api import utils
 
 
 CONF = cfg.CONF
@@ -159,42 +160,85 @@ class SecurityGroupDescriber(common.TaggableItemsDescriber):
     def __init__(self):
         super(SecurityGroupDescriber, self).__init__()
         self.all_db_items = None
+        self.vpcs = None
+        self.db_groups_by_os_id = None
+        self.os_groups_by_id = None
 
     def format(self, item=None, os_item=None):
         return _format_security_group(item, os_item,
-                                      self.all_db_items, self.os_items)
+                                      self.db_groups_by_os_id,
+                                      self.os_groups_by_id)
+
+    def get_db_items(self):
+        # NOTE(ft): VPCs are loaded together with groups to check default
+        # groups of VPCs which are not verified yet
+        db_items = db_api.get_items(self.context, ('sg', 'vpc'))
+        self.all_db_items = [i for i in db_items
+                             if ec2utils.get_ec2_id_kind(i['id']) == 'sg']
+        self.vpcs = [i for i in db_items
+                     if ec2utils.get_ec2_id_kind(i['id']) == 'vpc']
+        if self.ids:
+            return ec2utils.get_db_items(self.context, 'sg', self.ids)
+        return self.all_db_items
 
     def get_os_items(self):
-        if self.all_db_items is None:
-            self.all_db_items = db_api.get_items(self.context, 'sg')
         os_groups = security_group_engine.get_os_groups(self.context)
         if self.check_and_repair_default_groups(os_groups, self.all_db_items):
-            self.all_db_items = db_api.get_items(self.context, 'sg')
             self.items = self.get_db_items()
             os_groups = security_group_engine.get_os_groups(self.context)
+        # NOTE(ft): groups are indexed once to not scan them for each group
+        # and each rule at formatting
+        self.db_groups_by_os_id = {g['os_id']: g for g in self.all_db_items}
+        self.os_groups_by_id = {g['id']: g for g in os_groups}
         for os_group in os_groups:
             os_group['name'] = _translate_group_name(self.context,
                                                      os_group,
-                                                     self.all_db_items)
+                                                     self.db_groups_by_os_id)
         return os_groups
 
     def check_and_repair_default_groups(self, os_groups, db_groups):
-        vpcs = ec2utils.get_db_items(self.context, 'vpc', None)
-        os_groups_dict = {g['name']: g['id'] for g in os_groups}
-        db_groups_dict = {g['os_id']: g['vpc_id'] for g in db_groups}
+        # NOTE(ft): a default group of a VPC is checked only once, after
+        # that the VPC is marked as verified
+        vpcs = [vpc for vpc in self.vpcs
+                if not vpc.get('default_group_verified')]
+        if not vpcs:
+            return False
+        missed_vpc_ids = set(
+            vpc['id'] for vpc in _get_vpcs_without_default_group(
+                vpcs, os_groups, db_groups))
         had_to_repair = False
         for vpc in vpcs:
-            os_group = os_groups_dict.get(vpc['id'])
-            if os_group:
-                db_group = db_groups_dict.get(os_group)
-                if db_group and db_group == vpc['id']:
+            if CONF.use_reconciler:
+                self.reconcile(
+                    common.RECONCILE_CREATE_DEFAULT_SECURITY_GROUP, vpc)
+                continue
+            if vpc['id'] in missed_vpc_ids:
+                if not _create_default_security_group(self.context, vpc):
                     continue
-            result = _create_default_security_group(self.context, vpc)
-            if result:
                 had_to_repair = True
+            _set_default_group_verified(self.context, vpc)
         return had_to_repair
 
 
+def _set_default_group_verified(context, vpc):
+    vpc['default_group_verified'] = True
+    db_api.update_item(context, vpc)
+
+
+def _get_vpcs_without_default_group(vpcs, os_groups, db_groups):
+    os_groups_dict = {g['name']: g['id'] for g in os_groups}
+    db_groups_dict = {g['os_id']: g['vpc_id'] for g in db_groups}
+    missed_vpcs = []
+    for vpc in vpcs:
+        os_group = os_groups_dict.get(vpc['id'])
+        if os_group:
+            db_group = db_groups_dict.get(os_group)
+            if db_group and db_group == vpc['id']:
+                continue
+        missed_vpcs.append(vpc)
+    return missed_vpcs
+
+
 def describe_security_groups(context, group_name=None, group_id=None,
                              filter=None):
     formatted_security_groups = SecurityGroupDescriber().describe(
@@ -227,8 +271,8 @@ def _authorize_security_group(context, group_id, group_name,
                               ip_permissions, direction):
     rules_bodies = _build_rules(context, group_id, group_name,
                                 ip_permissions, direction)
-    for rule_body in rules_bodies:
-        security_group_engine.authorize_security_group(context, rule_body)
+    if rules_bodies:
+        security_group_engine.authorize_security_group(context, rules_bodies)
     return True
 
 
@@ -364,20 +408,18 @@ def _revoke_security_group(context, group_id, group_name, ip_permissions,
         if security_group.get('vpc_id'):
             raise exception.InvalidPermissionNotFound()
         return True
-    for os_rule_id in os_rules_to_delete:
-        security_group_engine.delete_os_group_rule(context, os_rule_id)
+    security_group_engine.delete_os_group_rules(context, os_rules_to_delete)
     return True
 
 
-def _translate_group_name(context, os_group, db_groups):
+def _translate_group_name(context, os_group, db_groups_by_os_id):
     # NOTE(Alex): This function translates VPC default group names
     # from vpc id 'vpc-xxxxxxxx' format to 'default'. It's supposed
     # to be called right after getting security groups from OpenStack
     # in order to avoid problems with incoming 'default' name value
     # in all of the subsequent handling (filtering, using in parameters...)
-    if os_group['name'].startswith('vpc-') and db_groups:
-        db_group = next((g for g in db_groups
-                        if g['os_id'] == os_group['id']), None)
+    if os_group['name'].startswith('vpc-'):
+        db_group = db_groups_by_os_id.get(os_group['id'])
         if db_group and db_group.get('vpc_id'):
             return DEFAULT_GROUP_NAME
     return os_group['name']
@@ -387,11 +429,11 @@ def _format_security_groups_ids_names(context):
     neutron = clients.neutron(context)
     os_security_groups = neutron.list_security_groups(
         tenant_id=context.project_id)['security_groups']
-    security_groups = db_api.get_items(context, 'sg')
+    security_groups = {g['os_id']: g
+                       for g in db_api.get_items(context, 'sg')}
     ec2_security_groups = {}
     for os_security_group in os_security_groups:
-        security_group = next((g for g in security_groups
-                               if g['os_id'] == os_security_group['id']), None)
+        security_group = security_groups.get(os_security_group['id'])
         if security_group is None:
             continue
         ec2_security_groups[os_security_group['id']] = (
@@ -403,7 +445,7 @@ def _format_security_groups_ids_names(context):
 
 
 def _format_security_group(security_group, os_security_group,
-                           security_groups, os_security_groups):
+                           db_groups_by_os_id, os_groups_by_id):
     ec2_security_group = {}
     ec2_security_group['groupId'] = security_group['id']
     if security_group.get('vpc_id'):
@@ -427,15 +469,13 @@ def _format_security_group(security_group, os_security_group,
         remote_group_id = os_rule['remote_group_id']
         if remote_group_id is not None:
             ec2_remote_group = {}
-            db_remote_group = next((g for g in security_groups
-                                    if g['os_id'] == remote_group_id), None)
+            db_remote_group = db_groups_by_os_id.get(remote_group_id)
             if db_remote_group is not None:
                 ec2_remote_group['groupId'] = db_remote_group['id']
             else:
                 # TODO(Alex) Log absence of remote_group
                 pass
-            os_remote_group = next((g for g in os_security_groups
-                                    if g['id'] == remote_group_id), None)
+            os_remote_group = os_groups_by_id.get(remote_group_id)
             if os_remote_group is not None:
                 ec2_remote_group['groupName'] = os_remote_group['name']
                 ec2_remote_group['userId'] = os_remote_group['tenant_id']
@@ -501,14 +541,16 @@ class SecurityGroupEngineNeutron(object):
         return neutron.list_security_groups(
             tenant_id=context.project_id)['security_groups']
 
-    def authorize_security_group(self, context, rule_body):
+    def authorize_security_group(self, context, rules_bodies):
         neutron = clients.neutron(context)
+        # NOTE(ft): Neutron creates bulk rules atomically, so if any of them
+        # is a duplicate, none of them is created
         try:
-            os_security_group_rule = neutron.create_security_group_rule(
-                {'security_group_rule': rule_body})['security_group_rule']
+            neutron.create_security_group_rule(
+                {'security_group_rules': rules_bodies})
         except neutron_exception.OverQuotaClient:
             raise exception.RulesPerSecurityGroupLimitExceeded()
-        except neutron_exception.Conflict as ex:
+        except neutron_exception.Conflict:
             raise exception.InvalidPermissionDuplicate()
 
     def get_os_group_rules(self, context, os_id):
@@ -517,9 +559,15 @@ class SecurityGroupEngineNeutron(object):
             neutron.show_security_group(os_id)['security_group'])
         return os_security_group.get('security_group_rules')
 
-    def delete_os_group_rule(self, context, os_id):
+    def delete_os_group_rules(self, context, os_ids):
+        # NOTE(ft): Neutron has no bulk deletion of rules, so they are
+        # deleted concurrently
         neutron = clients.neutron(context)
-        neutron.delete_security_group_rule(os_id)
+        results = utils.execute_concurrently(
+            neutron.delete_security_group_rule, os_ids)
+        for _result, error in results:
+            if error:
+                raise error
 
     def get_group_os_id(self, context, group_id, group_name):
         if group_name:
@@ -548,20 +596,24 @@ class SecurityGroupEngineNova(object):
                         context,
                         nova.security_groups.list())
 
-    def authorize_security_group(self, context, rule_body):
+    def authorize_security_group(self, context, rules_bodies):
         nova = clients.nova(context)
-        try:
-            os_security_group_rule = nova.security_group_rules.create(
-                rule_body['security_group_id'],
-                rule_body.get('protocol'),
-                rule_body.get('port_range_min', -1),
-                rule_body.get('port_range_max', -1),
-                rule_body.get('remote_ip_prefix'),
-                rule_body.get('remote_group_id'))
-        except nova_exception.Conflict:
-            raise exception.InvalidPermissionDuplicate()
-        except nova_exception.OverLimit:
-            raise exception.RulesPerSecurityGroupLimitExceeded()
+        with common.OnCrashCleaner() as cleaner:
+            for rule_body in rules_bodies:
+                try:
+                    os_security_group_rule = nova.security_group_rules.create(
+                        rule_body['security_group_id'],
+                        rule_body.get('protocol'),
+                        rule_body.get('port_range_min', -1),
+                        rule_body.get('port_range_max', -1),
+                        rule_body.get('remote_ip_prefix'),
+                        rule_body.get('remote_group_id'))
+                except nova_exception.Conflict:
+                    raise exception.InvalidPermissionDuplicate()
+                except nova_exception.OverLimit:
+                    raise exception.RulesPerSecurityGroupLimitExceeded()
+                cleaner.addCleanup(nova.security_group_rules.delete,
+                                   os_security_group_rule.id)
 
     def get_os_group_rules(self, context, os_id):
         nova = clients.nova(context)
@@ -575,9 +627,10 @@ class SecurityGroupEngineNova(object):
                                              nova.security_groups.list()))
         return neutron_rules
 
-    def delete_os_group_rule(self, context, os_id):
+    def delete_os_group_rules(self, context, os_ids):
         nova = clients.nova(context)
-        nova.security_group_rules.delete(os_id)
+        for os_id in os_ids:
+            nova.security_group_rules.delete(os_id)
 
     def convert_groups_to_neutron_format(self, context, nova_security_groups):
         neutron_security_groups = []
@@ -154,7 +154,7 @@ class SubnetDescriber(common.TaggableItemsDescriber):
                            if n['id'] == os_subnet['network_id']),
                           None)
         if not os_network:
-            self.delete_obsolete_item(subnet)
+            self.handle_unpaired_item(subnet)
             return None
         return _format_subnet(self.context, subnet, os_subnet, os_network,
                               self.os_ports)
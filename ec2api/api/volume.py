@@ -23,6 +23,7 @@ from ec2api import context as ec2_context
 from ec2api.db import api as db_api
 from ec2api import exception
 from ec2api.i18n import _
+from ec2api import os_state_cache
 
 
 LOG = logging.getLogger(__name__)
@@ -148,11 +149,19 @@ class VolumeDescriber(common.TaggableItemsDescriber):
 
     def get_os_items(self):
         nova = clients.nova(ec2_context.get_os_admin_context())
-        os_instances = nova.servers.list(
-            search_opts={'all_tenants': True,
-                         'project_id': self.context.project_id})
+        os_instances = self.get_cached_os_items(
+            os_state_cache.get_os_servers, nova)
+        if os_instances is None:
+            os_instances = nova.servers.list(
+                search_opts={'all_tenants': True,
+                             'project_id': self.context.project_id})
         self.os_instances = {i.id: i for i in os_instances}
-        return clients.cinder(self.context).volumes.list()
+        cinder = clients.cinder(self.context)
+        os_volumes = self.get_cached_os_items(
+            os_state_cache.get_os_volumes, cinder)
+        if os_volumes is not None:
+            return os_volumes
+        return cinder.volumes.list()
 
     def get_name(self, os_item):
         return ''
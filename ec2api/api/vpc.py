@@ -58,6 +58,9 @@ def create_vpc(context, cidr_block, instance_tenancy='default'):
         cleaner.addCleanup(route_table_api._delete_route_table,
                            context, route_table['id'])
         vpc['route_table_id'] = route_table['id']
+        # NOTE(ft): the default group is created below, so describe
+        # operations don't need to check it
+        vpc['default_group_verified'] = True
         db_api.update_item(context, vpc)
         neutron.update_router(os_router['id'], {'router': {'name': vpc['id']}})
         security_group_api._create_default_security_group(context, vpc)
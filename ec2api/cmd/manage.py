@@ -26,6 +26,7 @@ from oslo_log import log
 from ec2api import config
 from ec2api.db import migration
 from ec2api.i18n import _
+from ec2api.s3 import s3server
 
 
 CONF = cfg.CONF
@@ -44,6 +45,21 @@ def do_db_sync():
     migration.db_sync(CONF.command.version)
 
 
+def do_s3_rebuild_index():
+    """Rebuild indexes of S3 server buckets from their directories."""
+    application = s3server.S3Application(CONF.buckets_path)
+    bucket_names = CONF.command.bucket or [
+        name for name in os.listdir(application.directory)
+        if not name.startswith('.')]
+    for bucket_name in bucket_names:
+        if not os.path.isdir(os.path.join(application.directory,
+                                          bucket_name)):
+            print(_('Bucket %s does not exist') % bucket_name)
+            continue
+        application.rebuild_bucket_index(bucket_name)
+        print(_('Index of bucket %s is rebuilt') % bucket_name)
+
+
 def add_command_parsers(subparsers):
     parser = subparsers.add_parser('db_version')
     parser.set_defaults(func=do_db_version)
@@ -53,6 +69,10 @@ def add_command_parsers(subparsers):
     parser.add_argument('version', nargs='?')
     parser.add_argument('current_version', nargs='?')
 
+    parser = subparsers.add_parser('s3_rebuild_index')
+    parser.set_defaults(func=do_s3_rebuild_index)
+    parser.add_argument('bucket', nargs='*')
+
 
 command_opt = cfg.SubCommandOpt('command',
                                 title='Commands',
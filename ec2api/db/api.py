@@ -87,6 +87,11 @@ def add_item_id(context, kind, os_id, project_id=None):
     return IMPL.add_item_id(context, kind, os_id, project_id)
 
 
+def ensure_item_ids(context, kind, os_ids):
+    """Get ids of os_ids, adding absent id mappings by one statement."""
+    return IMPL.ensure_item_ids(context, kind, os_ids)
+
+
 def update_item(context, item):
     IMPL.update_item(context, item)
 
@@ -95,11 +100,16 @@ def delete_item(context, item_id):
     IMPL.delete_item(context, item_id)
 
 
+def delete_items(context, item_ids):
+    IMPL.delete_items(context, item_ids)
+
+
 def restore_item(context, kind, data):
     return IMPL.restore_item(context, kind, data)
 
 
 def get_items(context, kind):
+    """Get items of a kind, or of any of kinds if a tuple is passed."""
     return IMPL.get_items(context, kind)
 
 
@@ -130,3 +140,63 @@ def delete_tags(context, item_ids, tag_pairs=None):
 
 def get_tags(context, kinds=None, item_ids=None):
     return IMPL.get_tags(context, kinds, item_ids)
+
+
+def get_os_states(context, kind):
+    return IMPL.get_os_states(context, kind)
+
+
+def get_os_states_sync_time(context, kind):
+    return IMPL.get_os_states_sync_time(context, kind)
+
+
+def update_os_state(context, kind, os_id, project_id, data):
+    IMPL.update_os_state(context, kind, os_id, project_id, data)
+
+
+def delete_os_state(context, kind, os_id):
+    IMPL.delete_os_state(context, kind, os_id)
+
+
+def reset_os_states(context, kind, states):
+    IMPL.reset_os_states(context, kind, states)
+
+
+def add_reconciliations(context, reconciliations):
+    IMPL.add_reconciliations(context, reconciliations)
+
+
+def get_reconciliations(context, limit=None):
+    return IMPL.get_reconciliations(context, limit)
+
+
+def delete_reconciliations(context, reconciliation_ids):
+    IMPL.delete_reconciliations(context, reconciliation_ids)
+
+
+def add_instance_metadata(context, os_instance_id, data):
+    IMPL.add_instance_metadata(context, os_instance_id, data)
+
+
+def get_instance_metadata(context, os_instance_id):
+    return IMPL.get_instance_metadata(context, os_instance_id)
+
+
+def delete_instance_metadata(context, os_instance_ids):
+    IMPL.delete_instance_metadata(context, os_instance_ids)
+
+
+def add_image_job(context, action, data, lease_time=None):
+    return IMPL.add_image_job(context, action, data, lease_time)
+
+
+def claim_image_jobs(context, lease_time, limit):
+    return IMPL.claim_image_jobs(context, lease_time, limit)
+
+
+def renew_image_jobs(context, job_ids, lease_time):
+    IMPL.renew_image_jobs(context, job_ids, lease_time)
+
+
+def delete_image_job(context, job_id):
+    IMPL.delete_image_job(context, job_id)
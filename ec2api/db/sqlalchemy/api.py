@@ -15,6 +15,7 @@
 """Implementation of SQLAlchemy backend."""
 
 import copy
+import datetime
 import functools
 import json
 import random
@@ -23,6 +24,7 @@ import sys
 from oslo_config import cfg
 from oslo_db import exception as db_exception
 from oslo_db.sqlalchemy import session as db_session
+from oslo_utils import timeutils
 from sqlalchemy import and_
 from sqlalchemy import or_
 from sqlalchemy.sql import bindparam
@@ -139,6 +141,34 @@ def add_item_id(context, kind, os_id, project_id=None):
     return item_ref.id
 
 
+@require_context
+def ensure_item_ids(context, kind, os_ids):
+    os_ids = set(os_ids)
+    if not os_ids:
+        return []
+    ids = {item.os_id: item.id
+           for item in (model_query(context, models.Item).
+                        filter(models.Item.os_id.in_(os_ids)).
+                        all())}
+    new_ids = {os_id: _new_id(kind)
+               for os_id in os_ids if os_id not in ids}
+    if new_ids:
+        session = get_session()
+        try:
+            with session.begin():
+                session.execute(
+                    models.Item.__table__.insert(),
+                    [{'id': item_id, 'os_id': os_id}
+                     for os_id, item_id in new_ids.items()])
+        except db_exception.DBDuplicateEntry:
+            # NOTE(ft): some of the ids have been added concurrently,
+            # add_item_id resolves this for every id
+            new_ids = {os_id: add_item_id(context, kind, os_id)
+                       for os_id in new_ids}
+        ids.update(new_ids)
+    return [(item_id, os_id) for os_id, item_id in ids.items()]
+
+
 @require_context
 def update_item(context, item):
     item_ref = (model_query(context, models.Item).
@@ -174,6 +204,22 @@ def delete_item(context, item_id):
         pass
 
 
+@require_context
+def delete_items(context, item_ids):
+    if not item_ids:
+        return
+    session = get_session()
+    with session.begin():
+        (model_query(context, models.Item, session=session).
+         filter_by(project_id=context.project_id).
+         filter(models.Item.id.in_(item_ids)).
+         delete(synchronize_session=False))
+        (model_query(context, models.Tag, session=session).
+         filter_by(project_id=context.project_id).
+         filter(models.Tag.item_id.in_(item_ids)).
+         delete(synchronize_session=False))
+
+
 @require_context
 def restore_item(context, kind, data):
     try:
@@ -194,7 +240,7 @@ def get_items(context, kind):
     return [_unpack_item_data(item)
             for item in (model_query(context, models.Item).
                          filter_by(project_id=context.project_id).
-                         filter(models.Item.id.like('%s-%%' % kind)).
+                         filter(_kinds_filter(models.Item.id, kind)).
                          all())]
 
 
@@ -220,7 +266,7 @@ def get_items_by_ids(context, item_ids):
 @require_context
 def get_public_items(context, kind, item_ids=None):
     query = (model_query(context, models.Item).
-             filter(models.Item.id.like('%s-%%' % kind)).
+             filter(_kinds_filter(models.Item.id, kind)).
              filter(models.Item.data.like('%"is_public": True%')))
     if item_ids:
         query = query.filter(models.Item.id.in_(item_ids))
@@ -231,7 +277,7 @@ def get_public_items(context, kind, item_ids=None):
 @require_context
 def get_items_ids(context, kind, item_ids=None, item_os_ids=None):
     query = (model_query(context, models.Item).
-             filter(models.Item.id.like('%s-%%' % kind)))
+             filter(_kinds_filter(models.Item.id, kind)))
     if item_ids:
         query = query.filter(models.Item.id.in_(item_ids))
     if item_os_ids:
@@ -299,11 +345,7 @@ def get_tags(context, kinds=None, item_ids=None):
     query = (model_query(context, models.Tag).
              filter_by(project_id=context.project_id))
     if kinds:
-        fltr = None
-        for kind in kinds:
-            expr = models.Tag.item_id.like('%s-%%' % kind)
-            fltr = expr if fltr is None else or_(fltr, expr)
-        query = query.filter(fltr)
+        query = query.filter(_kinds_filter(models.Tag.item_id, kinds))
     if item_ids:
         query = query.filter(models.Tag.item_id.in_(item_ids))
     return [dict(item_id=tag.item_id,
@@ -312,6 +354,206 @@ def get_tags(context, kinds=None, item_ids=None):
             for tag in query.all()]
 
 
+@require_context
+def get_os_states(context, kind):
+    return [json.loads(state.data)
+            for state in (model_query(context, models.OSState).
+                          filter_by(project_id=context.project_id,
+                                    kind=kind).
+                          all())]
+
+
+@require_context
+def get_os_states_sync_time(context, kind):
+    sync_ref = (model_query(context, models.OSStateSync).
+                filter_by(kind=kind).
+                first())
+    return sync_ref.synced_at if sync_ref else None
+
+
+@require_context
+def update_os_state(context, kind, os_id, project_id, data):
+    session = get_session()
+    with session.begin():
+        session.merge(models.OSState(kind=kind,
+                                     os_id=os_id,
+                                     project_id=project_id,
+                                     data=json.dumps(data)))
+
+
+@require_context
+def delete_os_state(context, kind, os_id):
+    (model_query(context, models.OSState).
+     filter_by(kind=kind, os_id=os_id).
+     delete(synchronize_session=False))
+
+
+@require_context
+def reset_os_states(context, kind, states):
+    session = get_session()
+    with session.begin():
+        (model_query(context, models.OSState, session=session).
+         filter_by(kind=kind).
+         delete(synchronize_session=False))
+        if states:
+            session.execute(
+                models.OSState.__table__.insert(),
+                [{'kind': kind,
+                  'os_id': os_id,
+                  'project_id': project_id,
+                  'data': json.dumps(data)}
+                 for os_id, project_id, data in states])
+        session.merge(models.OSStateSync(kind=kind,
+                                         synced_at=timeutils.utcnow()))
+
+
+@require_context
+def add_reconciliations(context, reconciliations):
+    session = get_session()
+    with session.begin():
+        for reconciliation in reconciliations:
+            reconciliation_ref = models.Reconciliation(
+                project_id=context.project_id,
+                item_id=reconciliation['item_id'],
+                action=reconciliation['action'],
+                data=json.dumps(reconciliation.get('data', {})),
+                created_at=timeutils.utcnow())
+            try:
+                with session.begin(nested=True):
+                    reconciliation_ref.save(session)
+            except db_exception.DBDuplicateEntry:
+                # NOTE(ft): the inconsistency is already registered
+                pass
+
+
+@require_context
+def get_reconciliations(context, limit=None):
+    query = (model_query(context, models.Reconciliation).
+             order_by(models.Reconciliation.id))
+    if limit:
+        query = query.limit(limit)
+    return [dict(id=reconciliation.id,
+                 project_id=reconciliation.project_id,
+                 item_id=reconciliation.item_id,
+                 action=reconciliation.action,
+                 data=json.loads(reconciliation.data))
+            for reconciliation in query.all()]
+
+
+@require_context
+def delete_reconciliations(context, reconciliation_ids):
+    if not reconciliation_ids:
+        return
+    (model_query(context, models.Reconciliation).
+     filter(models.Reconciliation.id.in_(reconciliation_ids)).
+     delete(synchronize_session=False))
+
+
+@require_context
+def add_instance_metadata(context, os_instance_id, data):
+    session = get_session()
+    with session.begin():
+        session.merge(models.InstanceMetadata(
+            os_instance_id=os_instance_id,
+            project_id=context.project_id,
+            data=json.dumps(data),
+            created_at=timeutils.utcnow()))
+
+
+@require_context
+def get_instance_metadata(context, os_instance_id):
+    metadata_ref = (model_query(context, models.InstanceMetadata).
+                    filter_by(project_id=context.project_id,
+                              os_instance_id=os_instance_id).
+                    first())
+    return json.loads(metadata_ref.data) if metadata_ref else None
+
+
+@require_context
+def delete_instance_metadata(context, os_instance_ids):
+    if not os_instance_ids:
+        return
+    (model_query(context, models.InstanceMetadata).
+     filter_by(project_id=context.project_id).
+     filter(models.InstanceMetadata.os_instance_id.in_(os_instance_ids)).
+     delete(synchronize_session=False))
+
+
+@require_context
+def add_image_job(context, action, data, lease_time=None):
+    job_ref = models.ImageJob(
+        project_id=context.project_id,
+        user_id=context.user_id,
+        action=action,
+        data=json.dumps(data),
+        lease_expires=_get_lease_expiration(lease_time),
+        created_at=timeutils.utcnow())
+    session = get_session()
+    with session.begin():
+        job_ref.save(session)
+    return _unpack_image_job(job_ref)
+
+
+@require_context
+def claim_image_jobs(context, lease_time, limit):
+    now = timeutils.utcnow()
+    lease_expires = _get_lease_expiration(lease_time)
+    query = (model_query(context, models.ImageJob).
+             filter(or_(models.ImageJob.lease_expires.is_(None),
+                        models.ImageJob.lease_expires < now)).
+             order_by(models.ImageJob.id).
+             limit(limit))
+    jobs = []
+    for job_ref in query.all():
+        # NOTE(ft): the job is claimed only if nobody has claimed it
+        # concurrently
+        count = (model_query(context, models.ImageJob).
+                 filter_by(id=job_ref.id,
+                           lease_expires=job_ref.lease_expires).
+                 update({'lease_expires': lease_expires},
+                        synchronize_session=False))
+        if count:
+            job_ref.lease_expires = lease_expires
+            jobs.append(_unpack_image_job(job_ref))
+    return jobs
+
+
+@require_context
+def renew_image_jobs(context, job_ids, lease_time):
+    if not job_ids:
+        return
+    (model_query(context, models.ImageJob).
+     filter(models.ImageJob.id.in_(job_ids)).
+     update({'lease_expires': _get_lease_expiration(lease_time)},
+            synchronize_session=False))
+
+
+@require_context
+def delete_image_job(context, job_id):
+    (model_query(context, models.ImageJob).
+     filter_by(id=job_id).
+     delete(synchronize_session=False))
+
+
+def _get_lease_expiration(lease_time):
+    if not lease_time:
+        return None
+    return timeutils.utcnow() + datetime.timedelta(seconds=lease_time)
+
+
+def _unpack_image_job(job_ref):
+    return dict(id=job_ref.id,
+                project_id=job_ref.project_id,
+                user_id=job_ref.user_id,
+                action=job_ref.action,
+                data=json.loads(job_ref.data))
+
+
+def _kinds_filter(column, kind):
+    kinds = kind if isinstance(kind, (list, tuple, set)) else (kind,)
+    return or_(*[column.like('%s-%%' % k) for k in kinds])
+
+
 def _pack_item_data(item_data):
     data = copy.deepcopy(item_data)
     data.pop("id", None)
@@ -0,0 +1,46 @@
+#    Copyright 2013 Cloudscaling Group, Inc
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, DateTime, Index, MetaData
+from sqlalchemy import PrimaryKeyConstraint, String, Table, Text
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    os_states = Table('os_states', meta,
+        Column("kind", String(length=16)),
+        Column("os_id", String(length=36)),
+        Column("project_id", String(length=64)),
+        Column("data", Text()),
+        PrimaryKeyConstraint('kind', 'os_id'),
+        Index('os_states_project_id_idx', 'project_id', 'kind'),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8"
+    )
+    os_states.create()
+
+    os_state_syncs = Table('os_state_syncs', meta,
+        Column("kind", String(length=16)),
+        Column("synced_at", DateTime()),
+        PrimaryKeyConstraint('kind'),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8"
+    )
+    os_state_syncs.create()
+
+
+def downgrade(migrate_engine):
+    raise NotImplementedError("Downgrade is unsupported.")
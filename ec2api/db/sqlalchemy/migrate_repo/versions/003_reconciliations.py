@@ -0,0 +1,41 @@
+#    Copyright 2013 Cloudscaling Group, Inc
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, DateTime, Integer, MetaData
+from sqlalchemy import PrimaryKeyConstraint, String, Table, Text
+from sqlalchemy import UniqueConstraint
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    reconciliations = Table('reconciliations', meta,
+        Column("id", Integer(), autoincrement=True),
+        Column("project_id", String(length=64)),
+        Column("item_id", String(length=30)),
+        Column("action", String(length=64)),
+        Column("data", Text()),
+        Column("created_at", DateTime()),
+        PrimaryKeyConstraint('id'),
+        UniqueConstraint('project_id', 'item_id', 'action',
+                         name='reconciliations_item_action_idx'),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8"
+    )
+    reconciliations.create()
+
+
+def downgrade(migrate_engine):
+    raise NotImplementedError("Downgrade is unsupported.")
@@ -0,0 +1,36 @@
+#    Copyright 2013 Cloudscaling Group, Inc
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, DateTime, MetaData
+from sqlalchemy import PrimaryKeyConstraint, String, Table, Text
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    instance_metadata = Table('instance_metadata', meta,
+        Column("os_instance_id", String(length=36)),
+        Column("project_id", String(length=64)),
+        Column("data", Text()),
+        Column("created_at", DateTime()),
+        PrimaryKeyConstraint('os_instance_id'),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8"
+    )
+    instance_metadata.create()
+
+
+def downgrade(migrate_engine):
+    raise NotImplementedError("Downgrade is unsupported.")
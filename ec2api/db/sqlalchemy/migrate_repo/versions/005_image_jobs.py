@@ -0,0 +1,40 @@
+#    Copyright 2013 Cloudscaling Group, Inc
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData
+from sqlalchemy import PrimaryKeyConstraint, String, Table, Text
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    image_jobs = Table('image_jobs', meta,
+        Column("id", Integer(), autoincrement=True),
+        Column("project_id", String(length=64)),
+        Column("user_id", String(length=64)),
+        Column("action", String(length=64)),
+        Column("data", Text()),
+        Column("lease_expires", DateTime()),
+        Column("created_at", DateTime()),
+        PrimaryKeyConstraint('id'),
+        Index('image_jobs_lease_expires_idx', 'lease_expires'),
+        mysql_engine="InnoDB",
+        mysql_charset="utf8"
+    )
+    image_jobs.create()
+
+
+def downgrade(migrate_engine):
+    raise NotImplementedError("Downgrade is unsupported.")
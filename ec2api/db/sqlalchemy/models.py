@@ -18,7 +18,9 @@ SQLAlchemy models for ec2api data.
 
 from oslo_db.sqlalchemy import models
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, PrimaryKeyConstraint, String, Text
+from sqlalchemy import Column, DateTime, Index, Integer
+from sqlalchemy import PrimaryKeyConstraint
+from sqlalchemy import String, Text
 from sqlalchemy import UniqueConstraint
 
 BASE = declarative_base()
@@ -60,3 +62,65 @@ class Tag(BASE, EC2Base):
     item_id = Column(String(length=30))
     key = Column(String(length=127))
     value = Column(String(length=255))
+
+
+class OSState(BASE, EC2Base):
+    __tablename__ = 'os_states'
+    __table_args__ = (
+        PrimaryKeyConstraint('kind', 'os_id'),
+        Index('os_states_project_id_idx', 'project_id', 'kind'),
+    )
+    kind = Column(String(length=16))
+    os_id = Column(String(length=36))
+    project_id = Column(String(length=64))
+    data = Column(Text())
+
+
+class OSStateSync(BASE, EC2Base):
+    __tablename__ = 'os_state_syncs'
+    __table_args__ = (
+        PrimaryKeyConstraint('kind'),
+    )
+    kind = Column(String(length=16))
+    synced_at = Column(DateTime())
+
+
+class Reconciliation(BASE, EC2Base):
+    __tablename__ = 'reconciliations'
+    __table_args__ = (
+        PrimaryKeyConstraint('id'),
+        UniqueConstraint('project_id', 'item_id', 'action',
+                         name='reconciliations_item_action_idx'),
+    )
+    id = Column(Integer(), autoincrement=True)
+    project_id = Column(String(length=64))
+    item_id = Column(String(length=30))
+    action = Column(String(length=64))
+    data = Column(Text())
+    created_at = Column(DateTime())
+
+
+class InstanceMetadata(BASE, EC2Base):
+    __tablename__ = 'instance_metadata'
+    __table_args__ = (
+        PrimaryKeyConstraint('os_instance_id'),
+    )
+    os_instance_id = Column(String(length=36))
+    project_id = Column(String(length=64))
+    data = Column(Text())
+    created_at = Column(DateTime())
+
+
+class ImageJob(BASE, EC2Base):
+    __tablename__ = 'image_jobs'
+    __table_args__ = (
+        PrimaryKeyConstraint('id'),
+        Index('image_jobs_lease_expires_idx', 'lease_expires'),
+    )
+    id = Column(Integer(), autoincrement=True)
+    project_id = Column(String(length=64))
+    user_id = Column(String(length=64))
+    action = Column(String(length=64))
+    data = Column(Text())
+    lease_expires = Column(DateTime())
+    created_at = Column(DateTime())
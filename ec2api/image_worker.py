@@ -0,0 +1,178 @@
+# Copyright 2014
+# The Cloudscaling Group, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Worker of asynchronous image jobs.
+
+RegisterImage of S3 bundles and CreateImage of running instances complete
+images asynchronously. Such jobs are stored in EC2 API DB and are run by
+a bounded pool of green threads. A worker leases jobs it runs and renews
+the leases while it is alive, so that jobs of a dead worker are resumed by
+others after the lease expiration.
+
+S3 bundles are imported by API workers, unless use_image_worker option is
+set. In this case they are imported by the image worker service. CreateImage
+jobs are always run by the API worker which has got the request, because they
+need user credentials. If they are resumed, they are failed.
+"""
+
+import eventlet
+from eventlet import queue
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from ec2api import context as ec2_context
+from ec2api.db import api as db_api
+from ec2api.i18n import _LE, _LI
+from ec2api.openstack.common import service
+
+LOG = logging.getLogger(__name__)
+
+image_worker_opts = [
+    cfg.BoolOpt('use_image_worker',
+                default=False,
+                help='Import S3 image bundles by ec2-api-image-worker '
+                     'service instead of API workers'),
+    cfg.IntOpt('image_worker_concurrency',
+               default=2,
+               help='Maximum number of image jobs run at the same time by '
+                    'a worker process'),
+    cfg.IntOpt('image_worker_interval',
+               default=10,
+               help='Interval in seconds between checks for image jobs to '
+                    'run or to resume'),
+    cfg.IntOpt('image_job_lease_time',
+               default=300,
+               help='Time in seconds after which a job of a dead worker is '
+                    'resumed by others'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(image_worker_opts)
+
+ACTION_S3_IMPORT = 's3_import'
+ACTION_CREATE_IMAGE = 'create_image'
+
+
+class ImageWorker(object):
+    """Runs image jobs by a bounded pool of green threads."""
+
+    def __init__(self):
+        self._queue = queue.LightQueue()
+        self._job_ids = set()
+
+    def start(self, resume_jobs=True):
+        for _i in range(CONF.image_worker_concurrency):
+            eventlet.spawn_n(self._run_jobs)
+        eventlet.spawn_n(self._renew_leases)
+        if resume_jobs:
+            eventlet.spawn_n(self._resume_jobs)
+
+    def add_job(self, context, action, data):
+        job = db_api.add_image_job(context, action, data,
+                                   lease_time=CONF.image_job_lease_time)
+        self._hold_job(job, context)
+
+    def _hold_job(self, job, context):
+        self._job_ids.add(job['id'])
+        self._queue.put((job, context))
+
+    def _run_jobs(self):
+        while True:
+            job, context = self._queue.get()
+            try:
+                _run_job(context, job)
+            finally:
+                self._job_ids.discard(job['id'])
+
+    def _renew_leases(self):
+        admin_context = ec2_context.get_os_admin_context()
+        while True:
+            eventlet.sleep(CONF.image_job_lease_time / 3.0)
+            try:
+                db_api.renew_image_jobs(admin_context, list(self._job_ids),
+                                        CONF.image_job_lease_time)
+            except Exception:
+                LOG.exception(_LE('Failed to renew leases of image jobs'))
+
+    def _resume_jobs(self):
+        admin_context = ec2_context.get_os_admin_context()
+        while True:
+            try:
+                # NOTE(ft): jobs are claimed up to free capacity only to let
+                # other workers run the rest of them
+                limit = CONF.image_worker_concurrency - len(self._job_ids)
+                if limit > 0:
+                    jobs = db_api.claim_image_jobs(
+                        admin_context, CONF.image_job_lease_time, limit)
+                    for job in jobs:
+                        LOG.info(_LI('Claimed image job %(action)s %(id)s '
+                                     'of project %(project_id)s'), job)
+                        self._hold_job(
+                            job, _get_job_context(job, admin_context))
+            except Exception:
+                LOG.exception(_LE('Failed to resume image jobs'))
+            eventlet.sleep(CONF.image_worker_interval)
+
+
+_api_worker = None
+
+
+def start_api_worker():
+    """Start the worker of image jobs in an API worker process."""
+    global _api_worker
+    if not _api_worker:
+        _api_worker = ImageWorker()
+        _api_worker.start(resume_jobs=not CONF.use_image_worker)
+    return _api_worker
+
+
+def add_job(context, action, data):
+    """Register an image job and run it if it's not run by the service."""
+    if CONF.use_image_worker and action != ACTION_CREATE_IMAGE:
+        db_api.add_image_job(context, action, data)
+    else:
+        start_api_worker().add_job(context, action, data)
+
+
+def _get_job_context(job, admin_context):
+    return ec2_context.RequestContext(
+        job['user_id'], job['project_id'],
+        session=admin_context.session,
+        is_os_admin=True,
+        overwrite=False)
+
+
+def _run_job(context, job):
+    # NOTE(ft): image API module imports this one
+    from ec2api.api import image as image_api
+
+    actions = {ACTION_S3_IMPORT: image_api._s3_import_job,
+               ACTION_CREATE_IMAGE: image_api._create_image_job}
+    context.update_store()
+    try:
+        actions[job['action']](context, job['data'])
+    except Exception:
+        LOG.exception(_LE('Failed to run image job %(action)s %(id)s'), job)
+    try:
+        db_api.delete_image_job(context, job['id'])
+    except Exception:
+        LOG.exception(_LE('Failed to delete image job %s'), job['id'])
+
+
+class ImageWorkerService(service.Service):
+    """Runs image jobs registered by API workers."""
+
+    def start(self):
+        super(ImageWorkerService, self).start()
+        ImageWorker().start()
@@ -16,6 +16,7 @@ import hashlib
 import hmac
 import posixpath
 
+from eventlet import pools
 import httplib2
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -58,18 +59,52 @@ metadata_opts = [
     cfg.StrOpt('nova_client_priv_key',
                default='',
                help=_("Private key of client certificate.")),
+    cfg.IntOpt('nova_metadata_pool_size',
+               default=10,
+               help=_("Maximum number of kept alive connections to Nova "
+                      "metadata server per metadata server worker.")),
+    cfg.IntOpt('nova_metadata_timeout',
+               default=30,
+               help=_("Timeout in seconds for requests to Nova metadata "
+                      "server.")),
     cfg.StrOpt('metadata_proxy_shared_secret',
                default='',
                help=_('Shared secret to sign instance-id request'),
                secret=True),
+    cfg.IntOpt('cache_expiration',
+               default=15,
+               help=_('Time in seconds to cache metadata of an instance. '
+                      '0 disables the cache.')),
+    cfg.IntOpt('cache_size',
+               default=1000,
+               help=_('Maximum number of instances, which metadata is '
+                      'cached by a metadata server worker.')),
+    cfg.IntOpt('requester_cache_expiration',
+               default=10,
+               help=_('Time in seconds to cache instances found by IP '
+                      'addresses of metadata requests. Unknown addresses '
+                      'are cached as well. 0 disables the cache.')),
 ]
 
 CONF.register_opts(metadata_opts, group='metadata')
 
 
+_NOT_FOUND = object()
+
+
 class MetadataRequestHandler(wsgi.Application):
     """Serve metadata."""
 
+    def __init__(self):
+        self._requester_cache = utils.ExpiringCache(
+            CONF.metadata.cache_size,
+            CONF.metadata.requester_cache_expiration)
+        # NOTE(ft): httplib2.Http keeps connections alive, but can not be
+        # used by several requests concurrently, so a pool of them is used
+        self._proxy_http_pool = pools.Pool(
+            max_size=CONF.metadata.nova_metadata_pool_size,
+            create=self._create_proxy_http)
+
     @webob.dec.wsgify(RequestClass=wsgi.Request)
     def __call__(self, req):
         LOG.debug('Request: %s', req)
@@ -77,7 +112,12 @@ class MetadataRequestHandler(wsgi.Application):
         path = req.path_info
         if path == '' or path[0] != '/':
             path = '/' + path
-        path = posixpath.normpath(path)
+        # NOTE(ft): regular paths don't need to be normalized, just trailing
+        # slash is cut off
+        if '//' in path or '/.' in path:
+            path = posixpath.normpath(path)
+        elif len(path) > 1:
+            path = path.rstrip('/')
         path_tokens = path.split('/')[1:]
         if path_tokens[0] == 'ec2':
             path_tokens = path_tokens[1:]
@@ -91,7 +131,10 @@ class MetadataRequestHandler(wsgi.Application):
             if path_tokens[0] == 'openstack':
                 return self._proxy_request(req, requester)
 
-            resp = self._get_metadata(path_tokens, requester)
+            resp, etag = self._get_metadata(path_tokens, requester)
+            if etag in req.if_none_match:
+                return webob.exc.HTTPNotModified(etag=etag)
+            req.response.etag = etag
             return self._add_response_data(req.response, resp)
 
         except exception.EC2MetadataNotFound:
@@ -114,18 +157,9 @@ class MetadataRequestHandler(wsgi.Application):
             req.query_string,
             ''))
 
-        h = httplib2.Http(
-            ca_certs=CONF.metadata.auth_ca_cert,
-            disable_ssl_certificate_validation=(
-                    CONF.metadata.nova_metadata_insecure)
-        )
-        if (CONF.metadata.nova_client_cert and
-                CONF.metadata.nova_client_priv_key):
-            h.add_certificate(CONF.metadata.nova_client_priv_key,
-                              CONF.metadata.nova_client_cert,
-                              nova_ip_port)
-        resp, content = h.request(url, method=req.method, headers=headers,
-                                  body=req.body)
+        with self._proxy_http_pool.item() as h:
+            resp, content = h.request(url, method=req.method,
+                                      headers=headers, body=req.body)
 
         if resp.status == 200:
             LOG.debug(str(resp))
@@ -154,6 +188,21 @@ class MetadataRequestHandler(wsgi.Application):
         else:
             raise Exception(_('Unexpected response code: %s') % resp.status)
 
+    def _create_proxy_http(self):
+        h = httplib2.Http(
+            ca_certs=CONF.metadata.auth_ca_cert,
+            disable_ssl_certificate_validation=(
+                    CONF.metadata.nova_metadata_insecure),
+            timeout=CONF.metadata.nova_metadata_timeout
+        )
+        if (CONF.metadata.nova_client_cert and
+                CONF.metadata.nova_client_priv_key):
+            h.add_certificate(CONF.metadata.nova_client_priv_key,
+                              CONF.metadata.nova_client_cert,
+                              '%s:%s' % (CONF.metadata.nova_metadata_ip,
+                                         CONF.metadata.nova_metadata_port))
+        return h
+
     def _build_proxy_request_headers(self, requester):
         signature = self._sign_instance_id(requester['os_instance_id'])
         return {
@@ -172,22 +221,49 @@ class MetadataRequestHandler(wsgi.Application):
     def _get_requester(self, req):
         if req.headers.get('X-Metadata-Provider'):
             provider_id, remote_ip = self._unpack_nsx_request(req)
-            context = ec2_context.get_os_admin_context()
             os_instance_id, project_id = (
-                api.get_os_instance_and_project_id_by_provider_id(
-                    context, provider_id, remote_ip))
+                self._find_requester(provider_id, remote_ip))
         elif req.headers.get('X-Instance-ID'):
             os_instance_id, project_id, remote_ip = (
                 self._unpack_neutron_request(req))
         else:
             remote_ip = self._unpack_nova_network_request(req)
-            context = ec2_context.get_os_admin_context()
             os_instance_id, project_id = (
-                api.get_os_instance_and_project_id(context, remote_ip))
+                self._find_requester(None, remote_ip))
         return {'os_instance_id': os_instance_id,
                 'project_id': project_id,
                 'private_ip': remote_ip}
 
+    def _find_requester(self, provider_id, remote_ip):
+        # NOTE(ft): a booting instance requests metadata many times, so
+        # found instances are cached to not search them for each request.
+        # Negative results are cached too to not let unknown addresses load
+        # OpenStack services by repeated requests.
+        use_cache = CONF.metadata.requester_cache_expiration > 0
+        cache_key = (provider_id, remote_ip)
+        if use_cache:
+            cached = self._requester_cache.get(cache_key)
+            if cached is _NOT_FOUND:
+                raise exception.EC2MetadataNotFound()
+            elif cached:
+                return cached
+
+        context = ec2_context.get_os_admin_context()
+        try:
+            if provider_id:
+                result = api.get_os_instance_and_project_id_by_provider_id(
+                    context, provider_id, remote_ip)
+            else:
+                result = api.get_os_instance_and_project_id(context,
+                                                            remote_ip)
+        except exception.EC2MetadataNotFound:
+            if use_cache:
+                self._requester_cache.set(cache_key, _NOT_FOUND)
+            raise
+        if use_cache:
+            self._requester_cache.set(cache_key, result)
+        return result
+
     def _unpack_nova_network_request(self, req):
         remote_ip = req.remote_addr
         if CONF.use_forwarded_for:
@@ -268,9 +344,9 @@ class MetadataRequestHandler(wsgi.Application):
         # It doesn't affect operations via OpenStack's clients because
         # these clients use auth_token field only
         context.project_id = requester['project_id']
-        return api.get_metadata_item(context, path_tokens,
-                                     requester['os_instance_id'],
-                                     requester['private_ip'])
+        return api.get_metadata_entry(context, path_tokens,
+                                      requester['os_instance_id'],
+                                      requester['private_ip'])
 
     def _add_response_data(self, response, data):
         if isinstance(data, six.text_type):
@@ -13,18 +13,27 @@
 # limitations under the License.
 
 import base64
+import hashlib
 import itertools
 
+from cinderclient import exceptions as cinder_exception
 from novaclient import exceptions as nova_exception
+from oslo_config import cfg
 from oslo_log import log as logging
 import six
 
 from ec2api.api import clients
 from ec2api.api import ec2utils
 from ec2api.api import instance as instance_api
+from ec2api import context as ec2_context
+from ec2api.db import api as db_api
 from ec2api import exception
-from ec2api.i18n import _
+from ec2api.i18n import _, _LE
+from ec2api import utils
 
+CONF = cfg.CONF
+CONF.import_opt('ec2_private_dns_show_ip', 'ec2api.api.instance')
+CONF.import_opt('prebuild_instance_metadata', 'ec2api.api.instance')
 LOG = logging.getLogger(__name__)
 
 VERSIONS = [
@@ -107,91 +116,193 @@ def get_os_instance_and_project_id_by_provider_id(context, provider_id,
 
 
 def get_metadata_item(context, path_tokens, os_instance_id, remote_ip):
-    version = path_tokens[0]
-    if version == "latest":
-        version = VERSIONS[-1]
-    elif version not in VERSIONS:
+    return get_metadata_entry(context, path_tokens, os_instance_id,
+                              remote_ip)[0]
+
+
+def get_metadata_entry(context, path_tokens, os_instance_id, remote_ip):
+    """Get rendered metadata item and its ETag."""
+    if path_tokens[0] == "latest":
+        path_tokens = [VERSIONS[-1]] + list(path_tokens[1:])
+    index = _get_metadata_index(context, os_instance_id, remote_ip)
+    try:
+        return index['/'.join(path_tokens)]
+    except KeyError:
         raise exception.EC2MetadataNotFound()
 
-    ec2_instance, ec2_reservation = (
-        _get_ec2_instance_and_reservation(context, os_instance_id))
+
+_metadata_cache = None
+
+
+def _get_metadata_cache():
+    global _metadata_cache
+    if _metadata_cache is None:
+        _metadata_cache = utils.ExpiringCache(CONF.metadata.cache_size,
+                                              CONF.metadata.cache_expiration)
+    return _metadata_cache
+
+
+def _get_metadata_index(context, os_instance_id, remote_ip):
+    # NOTE(ft): cloud-init requests dozens of items at instance boot, so
+    # built metadata is cached to not build it for each of them.
+    # Since instances are modified by other processes, the cache is not
+    # invalidated explicitly, but its entries expire shortly.
+    use_cache = CONF.metadata.cache_expiration > 0
+    cache_key = (os_instance_id, remote_ip)
+    if use_cache:
+        cached = _get_metadata_cache().get(cache_key)
+        if cached:
+            owner_id, index = cached
+            _check_instance_owner(context, owner_id, os_instance_id)
+            return index
+
+    try:
+        os_instance = clients.nova(context).servers.get(os_instance_id)
+    except nova_exception.NotFound:
+        LOG.error(_('Failed to get metadata for instance id: %s'),
+                  os_instance_id)
+        raise exception.EC2MetadataNotFound()
+    _check_instance_owner(context, os_instance.tenant_id, os_instance_id)
+
+    metadata = _build_metadata(context, os_instance, remote_ip)
+    index = _build_metadata_index(metadata)
+    if use_cache:
+        _get_metadata_cache().set(cache_key, (os_instance.tenant_id, index))
+    return index
+
+
+def _build_metadata_index(metadata):
+    # NOTE(ft): all items of all versions are rendered once, so a request is
+    # served by a lookup of its path in the index
+    index = {}
+    etags = {}
+
+    def add_items(path, data):
+        text = _format_metadata_item(data)
+        etag = etags.get(text)
+        if etag is None:
+            etag = hashlib.md5(text.encode('utf-8')).hexdigest()
+            etags[text] = etag
+        index[path] = (text, etag)
+        if isinstance(data, dict):
+            for key, value in six.iteritems(data):
+                if key != '_name':
+                    add_items(path + '/' + key, value)
+
+    for version in VERSIONS:
+        add_items(version, _cut_down_to_version(metadata, version))
+    return index
+
+
+def _check_instance_owner(context, owner_id, os_instance_id):
     # NOTE(ft): check for case of Neutron metadata proxy.
     # It sends project_id as X-Tenant-ID HTTP header. We make sure it's correct
-    if context.project_id != ec2_reservation['ownerId']:
+    if context.project_id != owner_id:
         LOG.warning(_('Tenant_id %(tenant_id)s does not match tenant_id '
                       'of instance %(instance_id)s.'),
                     {'tenant_id': context.project_id,
                      'instance_id': os_instance_id})
         raise exception.EC2MetadataNotFound()
 
-    metadata = _build_metadata(context, ec2_instance, ec2_reservation,
-                               os_instance_id, remote_ip)
-    # TODO(ft): cache built metadata
-    metadata = _cut_down_to_version(metadata, version)
-    metadata_item = _find_path_in_tree(metadata, path_tokens[1:])
-    return _format_metadata_item(metadata_item)
 
+def _get_db_instance(context, os_instance):
+    ids = db_api.get_items_ids(context, 'i', item_os_ids=(os_instance.id,))
+    instance = db_api.get_item_by_id(context, ids[0][0]) if ids else None
+    if not instance:
+        instance = ec2utils.auto_create_db_item(context, 'i', os_instance.id,
+                                                os_instance=os_instance)
+    return instance
 
-def _get_ec2_instance_and_reservation(context, os_instance_id):
-    instance_id = ec2utils.os_id_to_ec2_id(context, 'i', os_instance_id)
-    try:
-        ec2_reservations = instance_api.describe_instances(
-                context, [instance_id])
-    except exception.InvalidInstanceIDNotFound:
-        ec2_reservations = instance_api.describe_instances(
-                context, filter=[{'name': 'instance-id',
-                                  'value': [instance_id]}])
-    if (len(ec2_reservations['reservationSet']) != 1 or
-            len(ec2_reservations['reservationSet'][0]['instancesSet']) != 1):
-        LOG.error(_('Failed to get metadata for instance id: %s'),
-                  os_instance_id)
-        raise exception.EC2MetadataNotFound()
 
-    ec2_reservation = ec2_reservations['reservationSet'][0]
-    ec2_instance = ec2_reservation['instancesSet'][0]
+def prebuild_metadata(context, instances):
+    """Build and store static metadata of just launched instances.
 
-    return ec2_instance, ec2_reservation
+    Metadata server uses stored metadata and builds dynamic part of it only.
+    """
+    admin_context = ec2_context.get_os_admin_context()
+    admin_context.project_id = context.project_id
+    nova = clients.nova(admin_context)
+    for instance in instances:
+        try:
+            os_instance = nova.servers.get(instance['os_id'])
+            metadata = _build_static_metadata(admin_context, instance,
+                                              os_instance)
+            db_api.add_instance_metadata(admin_context, instance['os_id'],
+                                         {'instance': instance,
+                                          'metadata': metadata})
+        except Exception:
+            LOG.exception(_LE('Failed to prebuild metadata for instance '
+                              '%s'), instance['id'])
+
+
+def _build_metadata(context, os_instance, remote_ip):
+    # NOTE(ft): metadata is built from the instance directly to avoid
+    # describing of all project objects, which describe_instances does
+    prebuilt = (db_api.get_instance_metadata(context, os_instance.id)
+                if CONF.prebuild_instance_metadata else None)
+    if prebuilt:
+        instance = prebuilt['instance']
+        full_metadata = prebuilt['metadata']
+    else:
+        instance = _get_db_instance(context, os_instance)
+        full_metadata = _build_static_metadata(context, instance, os_instance)
+
+    metadata = full_metadata['meta-data']
+    private_ip, public_ip, public_dns_name = (
+        _get_ip_info(context, instance, os_instance))
+    # NOTE(ft): Nova EC2 metadata returns instance's hostname with
+    # dhcp_domain suffix if it's set in config.
+    # But i don't see any reason to return a hostname differs from EC2
+    # describe output one. If we need to consider dhcp_domain suffix
+    # then we should do it in the describe operation
+    hostname = (private_ip if CONF.ec2_private_dns_show_ip else
+                getattr(os_instance, 'OS-EXT-SRV-ATTR:hostname', None))
+    metadata.update({
+        'block-device-mapping': _build_block_device_mappings(context,
+                                                             os_instance),
+        'hostname': hostname,
+        'local-hostname': hostname,
+        'local-ipv4': private_ip or remote_ip,
+        'placement': {
+            'availability-zone': getattr(os_instance,
+                                         'OS-EXT-AZ:availability_zone', None)
+        },
+        'public-hostname': public_dns_name,
+        'public-ipv4': public_ip or '',
+    })
+    return full_metadata
 
 
-def _build_metadata(context, ec2_instance, ec2_reservation,
-                    os_instance_id, remote_ip):
+def _build_static_metadata(context, instance, os_instance):
+    nova = clients.nova(context)
+    try:
+        instance_type = nova.flavors.get(os_instance.flavor['id']).name
+    except nova_exception.NotFound:
+        instance_type = 'unknown'
     metadata = {
-        'ami-id': ec2_instance['imageId'],
-        'ami-launch-index': ec2_instance['amiLaunchIndex'],
+        'ami-id': (ec2utils.os_id_to_ec2_id(context, 'ami',
+                                            os_instance.image['id'])
+                   if os_instance.image else None),
+        'ami-launch-index': instance['launch_index'],
         # NOTE (ft): the fake value as it is in Nova EC2 metadata
         'ami-manifest-path': 'FIXME',
         # NOTE (ft): empty value as it is in Nova EC2 metadata
         'ancestor-ami-ids': [],
-        'block-device-mapping': _build_block_device_mappings(context,
-                                                             ec2_instance,
-                                                             os_instance_id),
-        # NOTE(ft): Nova EC2 metadata returns instance's hostname with
-        # dhcp_domain suffix if it's set in config.
-        # But i don't see any reason to return a hostname differs from EC2
-        # describe output one. If we need to consider dhcp_domain suffix
-        # then we should do it in the describe operation
-        'hostname': ec2_instance['privateDnsName'],
         # NOTE (ft): the fake value as it is in Nova EC2 metadata
         'instance-action': 'none',
-        'instance-id': ec2_instance['instanceId'],
-        'instance-type': ec2_instance['instanceType'],
-        'local-hostname': ec2_instance['privateDnsName'],
-        'local-ipv4': ec2_instance['privateIpAddress'] or remote_ip,
-        'placement': {
-            'availability-zone': ec2_instance['placement']['availabilityZone']
-        },
+        'instance-id': instance['id'],
+        'instance-type': instance_type,
         # NOTE (ft): empty value as it is in Nova EC2 metadata
         'product-codes': [],
-        'public-hostname': ec2_instance['dnsName'],
-        'public-ipv4': ec2_instance.get('ipAddress', ''),
-        'reservation-id': ec2_reservation['reservationId'],
-        'security-groups': [sg['groupName']
-                            for sg in ec2_reservation.get('groupSet', [])],
+        'reservation-id': instance['reservation_id'],
+        'security-groups': _get_security_group_names(instance, os_instance),
     }
-    if 'kernelId' in ec2_instance:
-        metadata['kernel-id'] = ec2_instance['kernelId']
-    if 'ramdiskId' in ec2_instance:
-        metadata['ramdisk-id'] = ec2_instance['ramdiskId']
+    kernel_id = instance_api._cloud_format_kernel_id(context, os_instance)
+    if kernel_id:
+        metadata['kernel-id'] = kernel_id
+    ramdisk_id = instance_api._cloud_format_ramdisk_id(context, os_instance)
+    if ramdisk_id:
+        metadata['ramdisk-id'] = ramdisk_id
     # public keys are strangely rendered in ec2 metadata service
     #  meta-data/public-keys/ returns '0=keyname' (with no trailing /)
     # and only if there is a public key given.
@@ -201,15 +312,13 @@ def _build_metadata(context, ec2_instance, ec2_reservation,
     # meta-data/public-keys/ : '0=%s' % keyname
     # meta-data/public-keys/0/ : 'openssh-key'
     # meta-data/public-keys/0/openssh-key : '%s' % publickey
-    if ec2_instance['keyName']:
+    if os_instance.key_name:
         metadata['public-keys'] = {
-            '0': {'_name': "0=" + ec2_instance['keyName']}}
-        nova = clients.nova(context)
-        os_instance = nova.servers.get(os_instance_id)
+            '0': {'_name': "0=" + os_instance.key_name}}
         try:
             keypair = nova.keypairs._get(
                 '/%s/%s?user_id=%s' % (nova.keypairs.keypair_prefix,
-                                       ec2_instance['keyName'],
+                                       os_instance.key_name,
                                        os_instance.user_id),
                 'keypair')
         except nova_exception.NotFound:
@@ -219,10 +328,8 @@ def _build_metadata(context, ec2_instance, ec2_reservation,
 
     full_metadata = {'meta-data': metadata}
 
-    userdata = instance_api.describe_instance_attribute(
-                    context, ec2_instance['instanceId'], 'userData')
-    if 'userData' in userdata:
-        userdata = userdata['userData']['value']
+    userdata = getattr(os_instance, 'OS-EXT-SRV-ATTR:user_data', None)
+    if userdata:
         userdata = base64.b64decode(userdata)
         userdata = userdata.decode("utf-8")
         full_metadata['user-data'] = userdata
@@ -230,25 +337,76 @@ def _build_metadata(context, ec2_instance, ec2_reservation,
     return full_metadata
 
 
-def _build_block_device_mappings(context, ec2_instance, os_instance_id):
-    mappings = {'root': ec2_instance.get('rootDeviceName', ''),
-                'ami': ec2utils.block_device_strip_dev(
-                            ec2_instance.get('rootDeviceName', ''))}
-    if 'blockDeviceMapping' in ec2_instance:
-        # NOTE(yamahata): I'm not sure how ebs device should be numbered.
-        #                 Right now sort by device name for deterministic
-        #                 result.
-        ebs_devices = [ebs['deviceName']
-                       for ebs in ec2_instance['blockDeviceMapping']]
-        ebs_devices.sort()
-        ebs_devices = {'ebs%d' % num: ebs
-                       for num, ebs in enumerate(ebs_devices)}
-        mappings.update(ebs_devices)
+def _get_ip_info(context, instance, os_instance):
+    if not instance.get('vpc_id'):
+        fixed_ip, _fixed_ip6, floating_ip = (
+            instance_api._get_ip_info_for_instance(os_instance))
+        return fixed_ip, floating_ip, floating_ip
+
+    network_interface = next((eni for eni in db_api.get_items(context, 'eni')
+                              if (eni.get('instance_id') == instance['id'] and
+                                  eni.get('device_index') == 0)),
+                             None)
+    if not network_interface:
+        return None, None, None
+    fixed_ip = network_interface['private_ip_address']
+    address = next((addr for addr in db_api.get_items(context, 'eipalloc')
+                    if (addr.get('network_interface_id') ==
+                        network_interface['id'] and
+                        addr.get('private_ip_address') == fixed_ip)),
+                   None)
+    # NOTE(ft): public DNS names are not supported in VPC
+    return fixed_ip, address['public_ip'] if address else None, None
+
+
+def _get_security_group_names(instance, os_instance):
+    # NOTE(ft): describe_instances reports security groups of a reservation
+    # for EC2 Classic instances only
+    if instance.get('vpc_id'):
+        return []
+    names = []
+    for os_group in getattr(os_instance, 'security_groups', None) or []:
+        if os_group['name'] not in names:
+            names.append(os_group['name'])
+    return names
+
+
+def _build_block_device_mappings(context, os_instance):
+    root_device_name = getattr(os_instance,
+                               'OS-EXT-SRV-ATTR:root_device_name', None) or ''
+    mappings = {'root': root_device_name,
+                'ami': ec2utils.block_device_strip_dev(root_device_name)}
+    # NOTE(yamahata): I'm not sure how ebs device should be numbered.
+    #                 Right now sort by device name for deterministic
+    #                 result.
+    ebs_devices = sorted(_get_ebs_device_names(context, os_instance))
+    ebs_devices = {'ebs%d' % num: ebs
+                   for num, ebs in enumerate(ebs_devices)}
+    mappings.update(ebs_devices)
 
     # TODO(ft): extend Nova API to get ephemerals and swap
     return mappings
 
 
+def _get_ebs_device_names(context, os_instance):
+    volumes_attached = getattr(os_instance,
+                               'os-extended-volumes:volumes_attached', [])
+    if not volumes_attached:
+        return []
+    cinder = clients.cinder(context)
+    device_names = []
+    for volume_attached in volumes_attached:
+        try:
+            os_volume = cinder.volumes.get(volume_attached['id'])
+        except cinder_exception.NotFound:
+            continue
+        os_attachment = next((a for a in os_volume.attachments
+                              if a.get('server_id') == os_instance.id), {})
+        if os_attachment.get('device'):
+            device_names.append(os_attachment['device'])
+    return device_names
+
+
 def _cut_down_to_version(metadata, version):
     version_number = VERSIONS.index(version) + 1
     if version_number == len(VERSIONS):
@@ -279,18 +437,3 @@ def _format_metadata_item(data):
         return '\n'.join(data)
     else:
         return six.text_type(data)
-
-
-def _find_path_in_tree(data, path_tokens):
-    # given a dict/list tree, and a path in that tree, return data found there.
-    for i in range(0, len(path_tokens)):
-        if isinstance(data, dict) or isinstance(data, list):
-            if path_tokens[i] in data:
-                data = data[path_tokens[i]]
-            else:
-                raise exception.EC2MetadataNotFound()
-        else:
-            if i != len(path_tokens) - 1:
-                raise exception.EC2MetadataNotFound()
-            data = data[path_tokens[i]]
-    return data
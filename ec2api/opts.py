@@ -15,7 +15,10 @@ import itertools
 import ec2api.clients
 import ec2api.db.api
 import ec2api.exception
+import ec2api.image_worker
+import ec2api.os_state_cache
 import ec2api.paths
+import ec2api.reconciler
 import ec2api.service
 import ec2api.utils
 import ec2api.wsgi
@@ -28,7 +31,10 @@ def list_opts():
              ec2api.clients.ec2_opts,
              ec2api.db.api.tpool_opts,
              ec2api.exception.exc_log_opts,
+             ec2api.image_worker.image_worker_opts,
+             ec2api.os_state_cache.os_state_cache_opts,
              ec2api.paths.path_opts,
+             ec2api.reconciler.reconciler_opts,
              ec2api.service.service_opts,
              ec2api.utils.utils_opts,
              ec2api.wsgi.wsgi_opts,
@@ -0,0 +1,227 @@
+# Copyright 2014
+# The Cloudscaling Group, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache of OpenStack objects state fed by OpenStack notifications.
+
+The cache is filled by a notification listener service, which receives
+Nova, Neutron and Cinder notifications, and periodically resynchronized with
+the services in full. Describe operations may read OpenStack objects from the
+cache instead of listing them from the services, while the cache is not stale.
+"""
+
+from cinderclient import exceptions as cinder_exception
+from novaclient import exceptions as nova_exception
+from oslo_config import cfg
+from oslo_log import log as logging
+import oslo_messaging as messaging
+from oslo_utils import timeutils
+
+from ec2api import clients
+from ec2api import context as ec2_context
+from ec2api.db import api as db_api
+from ec2api.i18n import _LE, _LI
+from ec2api.openstack.common import service
+
+LOG = logging.getLogger(__name__)
+
+os_state_cache_opts = [
+    cfg.BoolOpt('use_os_state_cache',
+                default=False,
+                help='Read OpenStack objects in describe operations from '
+                     'the cache maintained by ec2-api-os-state-listener '
+                     'service'),
+    cfg.IntOpt('os_state_cache_resync_interval',
+               default=600,
+               help='Interval in seconds between full resynchronizations '
+                    'of OpenStack objects cache'),
+    cfg.IntOpt('os_state_cache_max_age',
+               default=1200,
+               help='Maximum age in seconds of the last full '
+                    'resynchronization, after which OpenStack objects cache '
+                    'is considered stale and is not used'),
+    cfg.StrOpt('os_state_notification_topic',
+               default='notifications',
+               help='Topic of OpenStack notifications to listen'),
+    cfg.ListOpt('os_state_notification_exchanges',
+                default=['nova', 'neutron', 'cinder'],
+                help='Exchanges of OpenStack notifications to listen'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(os_state_cache_opts)
+
+SERVER = 'server'
+PORT = 'port'
+FLOATING_IP = 'floatingip'
+VOLUME = 'volume'
+
+
+def get_os_servers(context, nova):
+    states = _get_os_states(context, SERVER)
+    if states is None:
+        return None
+    return [nova.servers.resource_class(nova.servers, state, loaded=True)
+            for state in states]
+
+
+def get_os_volumes(context, cinder):
+    states = _get_os_states(context, VOLUME)
+    if states is None:
+        return None
+    return [cinder.volumes.resource_class(cinder.volumes, state, loaded=True)
+            for state in states]
+
+
+def get_os_ports(context):
+    return _get_os_states(context, PORT)
+
+
+def get_os_floating_ips(context):
+    return _get_os_states(context, FLOATING_IP)
+
+
+def _get_os_states(context, kind):
+    if not CONF.use_os_state_cache or not context.project_id:
+        return None
+    synced_at = db_api.get_os_states_sync_time(context, kind)
+    if (not synced_at or
+            timeutils.is_older_than(synced_at, CONF.os_state_cache_max_age)):
+        return None
+    return db_api.get_os_states(context, kind)
+
+
+class NotificationEndpoint(object):
+    """Updates cached state of OpenStack objects by their notifications."""
+
+    def info(self, ctxt, publisher_id, event_type, payload, metadata):
+        try:
+            if event_type.startswith('compute.instance.'):
+                self._process_server(event_type, payload)
+            elif event_type.startswith('port.'):
+                self._process_neutron_item(PORT, event_type, payload)
+            elif event_type.startswith('floatingip.'):
+                self._process_neutron_item(FLOATING_IP, event_type, payload)
+            elif event_type.startswith('volume.'):
+                self._process_volume(event_type, payload)
+        except Exception:
+            LOG.exception(_LE('Failed to process %s notification'),
+                          event_type)
+
+    def _process_server(self, event_type, payload):
+        context = ec2_context.get_os_admin_context()
+        os_id = payload['instance_id']
+        if event_type != 'compute.instance.delete.end':
+            try:
+                os_instance = clients.nova(context).servers.get(os_id)
+            except nova_exception.NotFound:
+                pass
+            else:
+                db_api.update_os_state(context, SERVER, os_id,
+                                       os_instance.tenant_id,
+                                       os_instance.to_dict())
+                return
+        db_api.delete_os_state(context, SERVER, os_id)
+
+    def _process_volume(self, event_type, payload):
+        context = ec2_context.get_os_admin_context()
+        os_id = payload['volume_id']
+        if event_type != 'volume.delete.end':
+            try:
+                os_volume = clients.cinder(context).volumes.get(os_id)
+            except cinder_exception.NotFound:
+                pass
+            else:
+                db_api.update_os_state(context, VOLUME, os_id,
+                                       payload['tenant_id'],
+                                       os_volume.to_dict())
+                return
+        db_api.delete_os_state(context, VOLUME, os_id)
+
+    def _process_neutron_item(self, kind, event_type, payload):
+        context = ec2_context.get_os_admin_context()
+        if event_type == '%s.delete.end' % kind:
+            db_api.delete_os_state(context, kind, payload['%s_id' % kind])
+        elif event_type.endswith('.end') and kind in payload:
+            os_item = payload[kind]
+            db_api.update_os_state(context, kind, os_item['id'],
+                                   os_item['tenant_id'], os_item)
+
+
+def resync_os_states():
+    """Replace cached state of all OpenStack objects by their actual state."""
+    context = ec2_context.get_os_admin_context()
+    loaders = {
+        SERVER: _load_os_servers,
+        PORT: _load_os_ports,
+        FLOATING_IP: _load_os_floating_ips,
+        VOLUME: _load_os_volumes,
+    }
+    for kind, loader in loaders.items():
+        try:
+            db_api.reset_os_states(context, kind, loader(context))
+        except Exception:
+            LOG.exception(_LE('Failed to resynchronize %s cache'), kind)
+
+
+def _load_os_servers(context):
+    os_instances = clients.nova(context).servers.list(
+        search_opts={'all_tenants': True})
+    return [(i.id, i.tenant_id, i.to_dict()) for i in os_instances]
+
+
+def _load_os_volumes(context):
+    os_volumes = clients.cinder(context).volumes.list(
+        search_opts={'all_tenants': True})
+    return [(v.id, getattr(v, 'os-vol-tenant-attr:tenant_id'), v.to_dict())
+            for v in os_volumes]
+
+
+def _load_os_ports(context):
+    os_ports = clients.neutron(context).list_ports()['ports']
+    return [(p['id'], p['tenant_id'], p) for p in os_ports]
+
+
+def _load_os_floating_ips(context):
+    os_floating_ips = (
+        clients.neutron(context).list_floatingips()['floatingips'])
+    return [(f['id'], f['tenant_id'], f) for f in os_floating_ips]
+
+
+class OSStateListenerService(service.Service):
+    """Listens OpenStack notifications and keeps the cache up to date."""
+
+    def __init__(self):
+        super(OSStateListenerService, self).__init__()
+        self.listener = None
+
+    def start(self):
+        super(OSStateListenerService, self).start()
+        transport = messaging.get_transport(CONF)
+        targets = [messaging.Target(topic=CONF.os_state_notification_topic,
+                                    exchange=exchange)
+                   for exchange in CONF.os_state_notification_exchanges]
+        self.listener = messaging.get_notification_listener(
+            transport, targets, [NotificationEndpoint()], executor='eventlet')
+        self.listener.start()
+        LOG.info(_LI('Listening OpenStack notifications on %s'),
+                 ', '.join(CONF.os_state_notification_exchanges))
+        self.tg.add_timer(CONF.os_state_cache_resync_interval,
+                          resync_os_states, initial_delay=0)
+
+    def stop(self, graceful=False):
+        if self.listener:
+            self.listener.stop()
+            self.listener.wait()
+            self.listener = None
+        super(OSStateListenerService, self).stop(graceful)
@@ -0,0 +1,226 @@
+# Copyright 2014
+# The Cloudscaling Group, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reconciler of EC2 API DB with OpenStack state.
+
+If use_reconciler option is set, describe operations do not modify DB, but
+register found inconsistencies. The reconciler service periodically picks
+registered inconsistencies, checks them against actual state of OpenStack
+objects and repairs DB.
+"""
+
+import collections
+
+from cinderclient import exceptions as cinder_exception
+from glanceclient.common import exceptions as glance_exception
+from neutronclient.common import exceptions as neutron_exception
+from novaclient import exceptions as nova_exception
+from oslo_config import cfg
+from oslo_log import log as logging
+
+from ec2api.api import address as address_api
+from ec2api.api import common
+from ec2api.api import ec2utils
+from ec2api.api import instance as instance_api
+from ec2api.api import security_group as security_group_api
+from ec2api import clients
+from ec2api import context as ec2_context
+from ec2api.db import api as db_api
+from ec2api import exception
+from ec2api.i18n import _LE, _LI
+from ec2api.openstack.common import service
+
+LOG = logging.getLogger(__name__)
+
+reconciler_opts = [
+    cfg.IntOpt('reconciler_interval',
+               default=60,
+               help='Interval in seconds between reconciler runs'),
+    cfg.IntOpt('reconciler_batch_size',
+               default=500,
+               help='Maximum number of inconsistencies repaired by '
+                    'a reconciler run'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(reconciler_opts)
+
+_NOT_FOUND_EXCEPTIONS = (nova_exception.NotFound,
+                         cinder_exception.NotFound,
+                         neutron_exception.NotFound,
+                         glance_exception.HTTPNotFound)
+
+
+def reconcile():
+    """Repair a batch of registered DB inconsistencies."""
+    admin_context = ec2_context.get_os_admin_context()
+    reconciliations = db_api.get_reconciliations(
+        admin_context, limit=CONF.reconciler_batch_size)
+    projects = collections.defaultdict(list)
+    for reconciliation in reconciliations:
+        projects[reconciliation['project_id']].append(reconciliation)
+    for project_id, project_reconciliations in projects.items():
+        context = ec2_context.RequestContext(
+            None, project_id,
+            session=admin_context.session,
+            is_os_admin=True,
+            overwrite=False)
+        for reconciliation in project_reconciliations:
+            action = _RECONCILE_ACTIONS.get(reconciliation['action'])
+            try:
+                if action:
+                    action(context, reconciliation)
+            except Exception:
+                LOG.exception(_LE('Failed to reconcile %(action)s for '
+                                  '%(item_id)s'), reconciliation)
+        db_api.delete_reconciliations(
+            admin_context, [r['id'] for r in project_reconciliations])
+        LOG.info(_LI('%(count)s inconsistencies of project %(project)s '
+                     'were reconciled'),
+                 {'count': len(project_reconciliations),
+                  'project': project_id})
+
+
+def _delete_obsolete_item(context, reconciliation):
+    item = db_api.get_item_by_id(context, reconciliation['item_id'])
+    if not item or not item['os_id'] or _is_os_item_alive(context, item):
+        return
+    LOG.info(_LI('Deleting obsolete item %(item)s') % {'item': str(item)})
+    if ec2utils.get_ec2_id_kind(item['id']) == 'i':
+        instance_api._remove_instances(context, [item])
+    else:
+        db_api.delete_item(context, item['id'])
+
+
+def _is_os_item_alive(context, item):
+    kind = ec2utils.get_ec2_id_kind(item['id'])
+    os_id = item['os_id']
+    try:
+        if kind == 'i':
+            clients.nova(context).servers.get(os_id)
+        elif kind == 'vol':
+            clients.cinder(context).volumes.get(os_id)
+        elif kind == 'snap':
+            clients.cinder(context).volume_snapshots.get(os_id)
+        elif kind in ('ami', 'ari', 'aki'):
+            os_image = clients.glance(context).images.get(os_id)
+            return (not getattr(os_image, 'deleted', False) and
+                    os_image.status not in ('deleted', 'killed'))
+        elif kind == 'sg' and not CONF.full_vpc_support:
+            clients.nova(context).security_groups.get(os_id)
+        elif kind == 'sg':
+            clients.neutron(context).show_security_group(os_id)
+        elif kind == 'eni':
+            clients.neutron(context).show_port(os_id)
+        elif kind == 'eipalloc':
+            clients.neutron(context).show_floatingip(os_id)
+        elif kind == 'subnet':
+            neutron = clients.neutron(context)
+            os_subnet = neutron.show_subnet(os_id)['subnet']
+            neutron.show_network(os_subnet['network_id'])
+        else:
+            # NOTE(ft): unknown kinds are never considered as obsolete
+            return True
+    except _NOT_FOUND_EXCEPTIONS:
+        return False
+    return True
+
+
+def _create_default_security_group(context, reconciliation):
+    vpc = db_api.get_item_by_id(context, reconciliation['item_id'])
+    if not vpc or vpc.get('default_group_verified'):
+        return
+    neutron = clients.neutron(context)
+    os_groups = neutron.list_security_groups(
+        tenant_id=context.project_id)['security_groups']
+    db_groups = db_api.get_items(context, 'sg')
+    if not security_group_api._get_vpcs_without_default_group(
+            [vpc], os_groups, db_groups):
+        security_group_api._set_default_group_verified(context, vpc)
+        return
+    # NOTE(ft): the reconciler works with admin credentials, so the group is
+    # created by Neutron API to be able to specify its owner explicitly
+    os_group = neutron.create_security_group(
+        {'security_group': {'name': vpc['id'],
+                            'description': 'Default VPC security group',
+                            'tenant_id': context.project_id}})
+    os_group = os_group['security_group']
+    try:
+        with common.OnCrashCleaner() as cleaner:
+            cleaner.addCleanup(neutron.delete_security_group, os_group['id'])
+            db_api.restore_item(context, 'sg',
+                                {'id': ec2utils.change_ec2_id_kind(vpc['id'],
+                                                                   'sg'),
+                                 'vpc_id': vpc['id'],
+                                 'os_id': os_group['id']})
+    except exception.EC2DBDuplicateEntry:
+        # NOTE(ft): the default group has been created concurrently
+        pass
+    security_group_api._set_default_group_verified(context, vpc)
+
+
+def _update_image_visibility(context, reconciliation):
+    os_id = reconciliation['data'].get('os_id')
+    try:
+        os_image = clients.glance(context).images.get(os_id)
+    except glance_exception.HTTPNotFound:
+        return
+    if os_image.owner != context.project_id:
+        return
+    image = db_api.get_item_by_id(context, reconciliation['item_id'])
+    if image:
+        if image.get('is_public') != os_image.is_public:
+            image['is_public'] = os_image.is_public
+            db_api.update_item(context, image)
+    else:
+        # NOTE(ft): this is an id mapping, which doesn't belong to the project
+        # (see ImageDescriber.auto_update_db)
+        kind = ec2utils.get_ec2_id_kind(reconciliation['item_id'])
+        db_api.add_item(context, kind,
+                        {'id': reconciliation['item_id'],
+                         'os_id': os_id,
+                         'is_public': os_image.is_public})
+
+
+def _disassociate_address(context, reconciliation):
+    address = db_api.get_item_by_id(context, reconciliation['item_id'])
+    if not address or 'network_interface_id' not in address:
+        return
+    try:
+        os_floating_ip = clients.neutron(context).show_floatingip(
+            address['os_id'])['floatingip']
+    except neutron_exception.NotFound:
+        return
+    if (not os_floating_ip.get('port_id') or
+            os_floating_ip['fixed_ip_address'] !=
+            address['private_ip_address']):
+        address_api._disassociate_address_item(context, address)
+
+
+_RECONCILE_ACTIONS = {
+    common.RECONCILE_DELETE_OBSOLETE_ITEM: _delete_obsolete_item,
+    common.RECONCILE_CREATE_DEFAULT_SECURITY_GROUP:
+        _create_default_security_group,
+    common.RECONCILE_UPDATE_IMAGE_VISIBILITY: _update_image_visibility,
+    common.RECONCILE_DISASSOCIATE_ADDRESS: _disassociate_address,
+}
+
+
+class ReconcilerService(service.Service):
+    """Periodically repairs DB inconsistencies found by describers."""
+
+    def start(self):
+        super(ReconcilerService, self).start()
+        self.tg.add_timer(CONF.reconciler_interval, reconcile,
+                          initial_delay=0)
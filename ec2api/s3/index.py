@@ -0,0 +1,93 @@
+# Copyright 2014
+# The Cloudscaling Group, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sorted index of objects of an S3 server bucket.
+
+The index is a SQLite database, which keeps names, sizes, modification times
+and ETags of bucket objects. It is updated by object uploads and deletions,
+and lets bucket listings seek a key range instead of walking the whole bucket
+directory tree.
+"""
+
+import sqlite3
+
+import six
+
+
+class BucketIndex(object):
+    """Index of objects of a bucket."""
+
+    def __init__(self, path):
+        # NOTE(ft): the S3 server runs in green threads of one OS thread
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS objects ('
+            'name TEXT PRIMARY KEY, '
+            'size INTEGER NOT NULL, '
+            'mtime REAL NOT NULL, '
+            'etag TEXT)')
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def add(self, name, size, mtime, etag=None):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?)',
+            (_to_text(name), size, mtime, etag))
+        self._connection.commit()
+
+    def delete(self, name):
+        self._connection.execute('DELETE FROM objects WHERE name = ?',
+                                 (_to_text(name),))
+        self._connection.commit()
+
+    def get(self, name):
+        """Get (size, mtime, etag) of an object or None if it's absent."""
+        return self._connection.execute(
+            'SELECT size, mtime, etag FROM objects WHERE name = ?',
+            (_to_text(name),)).fetchone()
+
+    def list(self, prefix=u'', marker=u'', limit=None):
+        """List (name, size, mtime) of objects in the name order.
+
+        Objects whose names are greater than marker and start with prefix
+        are listed.
+        """
+        prefix = _to_text(prefix)
+        cursor = self._connection.execute(
+            'SELECT name, size, mtime FROM objects '
+            'WHERE name > ? AND name >= ? ORDER BY name LIMIT ?',
+            (_to_text(marker), prefix, -1 if limit is None else limit))
+        result = []
+        for row in cursor:
+            if not row[0].startswith(prefix):
+                break
+            result.append(row)
+        return result
+
+    def reset(self, objects):
+        """Replace the index content by (name, size, mtime) of objects."""
+        with self._connection:
+            self._connection.execute('DELETE FROM objects')
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, NULL)',
+                ((_to_text(name), size, mtime)
+                 for name, size, mtime in objects))
+
+
+def _to_text(value):
+    if isinstance(value, six.binary_type):
+        return value.decode('utf-8')
+    return value
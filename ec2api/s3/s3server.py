@@ -32,9 +32,17 @@ S3 client with this module::
 
 """
 
-import bisect
+import calendar
 import datetime
+import hashlib
+import json
 import os.path
+import re
+import shutil
+import tempfile
+import uuid
+
+from lxml import etree
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -42,9 +50,11 @@ import routes
 import six
 from six.moves.urllib import parse
 import webob
+from webob import static
 
 from ec2api.openstack.common import fileutils
 from ec2api import paths
+from ec2api.s3 import index
 from ec2api import utils
 from ec2api import wsgi
 
@@ -65,6 +75,9 @@ CONF = cfg.CONF
 CONF.register_opts(s3_opts)
 LOG = logging.getLogger(__name__)
 
+CHUNK_SIZE = 64 * 1024
+MAX_PART_NUMBER = 10000
+
 
 def get_wsgi_server():
     return wsgi.Server("S3 Objectstore",
@@ -98,9 +111,58 @@ class S3Application(wsgi.Router):
                 requirements={'bucket_name': '[^/]+/?'})
         self.directory = os.path.abspath(root_directory)
         fileutils.ensure_tree(self.directory)
+        # NOTE(ft): these are not buckets, since bucket names can't start
+        # with a period
+        self.temp_directory = os.path.join(self.directory, '.tmp')
+        fileutils.ensure_tree(self.temp_directory)
+        self.index_directory = os.path.join(self.directory, '.index')
+        fileutils.ensure_tree(self.index_directory)
+        self.uploads_directory = os.path.join(self.directory, '.uploads')
+        fileutils.ensure_tree(self.uploads_directory)
         self.bucket_depth = bucket_depth
+        self._bucket_indexes = {}
         super(S3Application, self).__init__(mapper)
 
+    def get_bucket_index(self, bucket_name):
+        """Get index of bucket objects, build it if it doesn't exist."""
+        bucket_name = bucket_name.rstrip('/')
+        bucket_index = self._bucket_indexes.get(bucket_name)
+        if bucket_index:
+            return bucket_index
+        path = self._bucket_index_path(bucket_name)
+        exists = os.path.exists(path)
+        bucket_index = index.BucketIndex(path)
+        if not exists:
+            bucket_index.reset(self._walk_bucket(bucket_name))
+        self._bucket_indexes[bucket_name] = bucket_index
+        return bucket_index
+
+    def rebuild_bucket_index(self, bucket_name):
+        """Rebuild index of bucket objects from bucket directory."""
+        bucket_index = self.get_bucket_index(bucket_name)
+        bucket_index.reset(self._walk_bucket(bucket_name))
+
+    def delete_bucket_index(self, bucket_name):
+        bucket_name = bucket_name.rstrip('/')
+        bucket_index = self._bucket_indexes.pop(bucket_name, None)
+        if bucket_index:
+            bucket_index.close()
+        fileutils.delete_if_exists(self._bucket_index_path(bucket_name))
+
+    def _bucket_index_path(self, bucket_name):
+        return os.path.join(self.index_directory, bucket_name + '.sqlite')
+
+    def _walk_bucket(self, bucket_name):
+        path = os.path.join(self.directory, bucket_name)
+        skip = len(path) + 1
+        for i in range(self.bucket_depth):
+            skip += 2 * (i + 1) + 1
+        for root, _dirs, files in os.walk(path):
+            for file_name in files:
+                object_path = os.path.join(root, file_name)
+                info = os.stat(object_path)
+                yield object_path[skip:], info.st_size, info.st_mtime
+
 
 class BaseRequestHandler(object):
     """Base class emulating Tornado's web framework pattern in WSGI.
@@ -147,6 +209,13 @@ class BaseRequestHandler(object):
             self.response = webob.Response()
             params = request.environ['wsgiorg.routing_args'][1]
             del params['controller']
+            # NOTE(ft): internal directories of the server start with a
+            # period, which is not allowed for bucket names
+            bucket_name = params.get('bucket_name') or params.get('bucket')
+            if bucket_name and bucket_name.startswith('.'):
+                self.set_error(400, "InvalidBucketName",
+                               "The specified bucket is not valid")
+                return self.response
             f(**params)
         except Exception:
             # TODO(andrey-mp): improve this block
@@ -169,11 +238,15 @@ class BaseRequestHandler(object):
         self.response.status = status_code
 
     def set_404(self):
+        self.set_error(404, "NoSuchKey",
+                       "The resource you requested does not exist")
+
+    def set_error(self, status_code, code, message):
         self.render_xml({"Error": {
-            "Code": "NoSuchKey",
-            "Message": "The resource you requested does not exist"
+            "Code": code,
+            "Message": message
         }})
-        self.set_status(404)
+        self.set_status(status_code)
 
     def finish(self, body=''):
         if isinstance(body, six.binary_type):
@@ -234,6 +307,8 @@ class RootHandler(BaseRequestHandler):
         names = os.listdir(self.application.directory)
         buckets = []
         for name in names:
+            if name.startswith('.'):
+                continue
             path = os.path.join(self.application.directory, name)
             info = os.stat(path)
             buckets.append({
@@ -258,38 +333,17 @@ class BucketHandler(BaseRequestHandler):
                 not os.path.isdir(path)):
             self.set_404()
             return
-        object_names = []
-        for root, _dirs, files in os.walk(path):
-            for file_name in files:
-                object_names.append(os.path.join(root, file_name))
-        skip = len(path) + 1
-        for i in range(self.application.bucket_depth):
-            skip += 2 * (i + 1) + 1
-        object_names = [n[skip:] for n in object_names]
-        object_names.sort()
+        bucket_index = self.application.get_bucket_index(bucket_name)
+        objects = bucket_index.list(prefix, marker, max_keys + 1)
+        truncated = len(objects) > max_keys
         contents = []
-
-        start_pos = 0
-        if marker:
-            start_pos = bisect.bisect_right(object_names, marker, start_pos)
-        if prefix:
-            start_pos = bisect.bisect_left(object_names, prefix, start_pos)
-
-        truncated = False
-        for object_name in object_names[start_pos:]:
-            if not object_name.startswith(prefix):
-                break
-            if len(contents) >= max_keys:
-                truncated = True
-                break
-            object_path = self._object_path(bucket_name, object_name)
+        for object_name, size, mtime in objects[:max_keys]:
             c = {"Key": object_name}
             if not terse:
-                info = os.stat(object_path)
                 c.update({
                     "LastModified": datetime.datetime.utcfromtimestamp(
-                        info.st_mtime),
-                    "Size": info.st_size,
+                        mtime),
+                    "Size": size,
                 })
             contents.append(c)
             marker = object_name
@@ -310,6 +364,7 @@ class BucketHandler(BaseRequestHandler):
             self.set_status(403)
             return
         fileutils.ensure_tree(path)
+        self.application.get_bucket_index(bucket_name)
         self.finish()
 
     def delete(self, bucket_name):
@@ -323,6 +378,7 @@ class BucketHandler(BaseRequestHandler):
             self.set_status(403)
             return
         os.rmdir(path)
+        self.application.delete_bucket_index(bucket_name)
         self.set_status(204)
         self.finish()
 
@@ -337,52 +393,312 @@ class BucketHandler(BaseRequestHandler):
         self.finish()
 
 
+_UPLOAD_ID_RE = re.compile('^[0-9a-f]{32}$')
+
+
+class _InvalidPart(Exception):
+    pass
+
+
 class ObjectHandler(BaseRequestHandler):
     def get(self, bucket, object_name):
         object_name = parse.unquote(object_name)
+        if 'uploadId' in self.request.GET:
+            self._list_parts(bucket, object_name)
+            return
         path = self._object_path(bucket, object_name)
         if (not path.startswith(self.application.directory) or
                 not os.path.isfile(path)):
             self.set_404()
             return
         info = os.stat(path)
+        etag = self._get_etag(bucket, object_name, info)
         self.set_header("Content-Type", "application/unknown")
-        self.set_header("Last-Modified", datetime.datetime.utcfromtimestamp(
-            info.st_mtime))
+        self.response.last_modified = info.st_mtime
+        self.set_header("ETag", '"%s"' % etag)
+        self.set_header("Accept-Ranges", "bytes")
+        if self._is_not_modified(etag, info):
+            self.set_status(304)
+            return
+
+        object_range = None
+        if self.request.range:
+            object_range = self.request.range.range_for_length(info.st_size)
+            if object_range is None:
+                self.set_header("Content-Range", "bytes */%s" % info.st_size)
+                self.set_status(416)
+                return
+
         object_file = open(path, "rb")
-        try:
-            self.finish(object_file.read())
-        finally:
-            object_file.close()
+        if object_range:
+            start, end = object_range
+            self.set_status(206)
+            self.set_header("Content-Range", "bytes %s-%s/%s" %
+                            (start, end - 1, info.st_size))
+            self.response.app_iter = static.FileIter(
+                object_file).app_iter_range(start, end, CHUNK_SIZE)
+            self.response.content_length = end - start
+            return
+        # NOTE(ft): the object is streamed by chunks, and by sendfile if the
+        # WSGI server provides a file wrapper
+        file_wrapper = self.request.environ.get('wsgi.file_wrapper')
+        if file_wrapper:
+            self.response.app_iter = file_wrapper(object_file, CHUNK_SIZE)
+        else:
+            self.response.app_iter = static.FileIter(
+                object_file).app_iter_range(block_size=CHUNK_SIZE)
+        self.response.content_length = info.st_size
+
+    def head(self, bucket, object_name):
+        # NOTE(ft): webob drops the body of HEAD responses, keeping headers
+        self.get(bucket, object_name)
+
+    def _is_not_modified(self, etag, info):
+        # NOTE(ft): If-Modified-Since is ignored if If-None-Match is
+        # specified, as RFC 7232 requires
+        if 'If-None-Match' in self.request.headers:
+            return etag in self.request.if_none_match
+        if_modified_since = self.request.if_modified_since
+        return bool(if_modified_since and
+                    int(info.st_mtime) <=
+                    calendar.timegm(if_modified_since.utctimetuple()))
 
     def put(self, bucket, object_name):
         object_name = parse.unquote(object_name)
-        bucket_dir = os.path.abspath(os.path.join(
-            self.application.directory, bucket))
-        if (not bucket_dir.startswith(self.application.directory) or
-                not os.path.isdir(bucket_dir)):
-            self.set_404()
+        if 'uploadId' in self.request.GET:
+            self._upload_part(bucket, object_name)
             return
-        path = self._object_path(bucket, object_name)
-        if not path.startswith(bucket_dir) or os.path.isdir(path):
-            self.set_status(403)
+        path = self._get_new_object_path(bucket, object_name)
+        if not path:
             return
-        directory = os.path.dirname(path)
-        fileutils.ensure_tree(directory)
-        object_file = open(path, "wb")
-        object_file.write(self.request.body)
-        object_file.close()
-        self.set_header('ETag',
-                        '"%s"' % utils.get_hash_str(self.request.body))
+        etag = self._write_file(path, self._read_body())
+        self._add_object(bucket, object_name, path, etag)
+        self.set_header('ETag', '"%s"' % etag)
         self.finish()
 
+    def post(self, bucket, object_name):
+        object_name = parse.unquote(object_name)
+        if 'uploads' in self.request.GET:
+            self._initiate_upload(bucket, object_name)
+        elif 'uploadId' in self.request.GET:
+            self._complete_upload(bucket, object_name)
+
     def delete(self, bucket, object_name):
         object_name = parse.unquote(object_name)
+        if 'uploadId' in self.request.GET:
+            self._abort_upload(bucket, object_name)
+            return
         path = self._object_path(bucket, object_name)
         if (not path.startswith(self.application.directory) or
                 not os.path.isfile(path)):
             self.set_404()
             return
         os.unlink(path)
+        self.application.get_bucket_index(bucket).delete(object_name)
         self.set_status(204)
         self.finish()
+
+    def _initiate_upload(self, bucket, object_name):
+        if not self._get_new_object_path(bucket, object_name):
+            return
+        upload_id = uuid.uuid4().hex
+        upload_dir = os.path.join(self.application.uploads_directory,
+                                  upload_id)
+        fileutils.ensure_tree(upload_dir)
+        with open(os.path.join(upload_dir, 'upload'), 'w') as f:
+            json.dump({'bucket': bucket, 'key': object_name}, f)
+        self.render_xml({"InitiateMultipartUploadResult": {
+            "Bucket": bucket,
+            "Key": object_name,
+            "UploadId": upload_id,
+        }})
+
+    def _upload_part(self, bucket, object_name):
+        upload_dir = self._get_upload_dir(bucket, object_name)
+        if not upload_dir:
+            return
+        part_number = self.get_argument('partNumber', '')
+        if (not part_number.isdigit() or
+                not 1 <= int(part_number) <= MAX_PART_NUMBER):
+            self.set_error(400, "InvalidArgument",
+                           "Part number must be an integer between 1 and "
+                           "%s" % MAX_PART_NUMBER)
+            return
+        part_path = os.path.join(upload_dir, str(int(part_number)))
+        etag = self._write_file(part_path, self._read_body())
+        # NOTE(ft): ETag of a part is kept to list parts, Complete operation
+        # checks ETags of parts against their data
+        self._write_file(part_path + '.etag', [etag.encode('ascii')])
+        self.set_header('ETag', '"%s"' % etag)
+        self.finish()
+
+    def _list_parts(self, bucket, object_name):
+        upload_dir = self._get_upload_dir(bucket, object_name)
+        if not upload_dir:
+            return
+        parts = []
+        for part_number in sorted(int(name) for name in os.listdir(upload_dir)
+                                  if name.isdigit()):
+            part_path = os.path.join(upload_dir, str(part_number))
+            try:
+                info = os.stat(part_path)
+                with open(part_path + '.etag') as f:
+                    etag = f.read()
+            except (IOError, OSError):
+                continue
+            parts.append({
+                "PartNumber": part_number,
+                "LastModified": datetime.datetime.utcfromtimestamp(
+                    info.st_mtime),
+                "ETag": '"%s"' % etag,
+                "Size": info.st_size,
+            })
+        self.render_xml({"ListPartsResult": {
+            "Bucket": bucket,
+            "Key": object_name,
+            "UploadId": self.get_argument('uploadId', ''),
+            "IsTruncated": False,
+            "Part": parts,
+        }})
+
+    def _complete_upload(self, bucket, object_name):
+        upload_dir = self._get_upload_dir(bucket, object_name)
+        if not upload_dir:
+            return
+        path = self._get_new_object_path(bucket, object_name)
+        if not path:
+            return
+        try:
+            parts = self._parse_upload_parts(self.request.body)
+        except Exception:
+            parts = None
+        part_numbers = [n for n, _etag in parts or []]
+        if not parts or part_numbers != sorted(set(part_numbers)):
+            self.set_error(400, "InvalidPartOrder",
+                           "The list of parts is not valid")
+            return
+        if not all(os.path.isfile(os.path.join(upload_dir, str(n)))
+                   for n, _etag in parts):
+            self.set_error(400, "InvalidPart",
+                           "One or more of the specified parts could not "
+                           "be found")
+            return
+
+        part_md5s = []
+
+        def read_parts():
+            for part_number, part_etag in parts:
+                md5 = hashlib.md5()
+                with open(os.path.join(upload_dir, str(part_number)),
+                          'rb') as part_file:
+                    for chunk in iter(lambda: part_file.read(CHUNK_SIZE),
+                                      b''):
+                        md5.update(chunk)
+                        yield chunk
+                if md5.hexdigest() != part_etag:
+                    raise _InvalidPart()
+                part_md5s.append(md5.digest())
+
+        # NOTE(ft): ETags of parts are checked while they are concatenated
+        # to not read them twice
+        try:
+            self._write_file(path, read_parts())
+        except _InvalidPart:
+            self.set_error(400, "InvalidPart",
+                           "One or more of the specified parts could not "
+                           "be found")
+            return
+        etag = '%s-%s' % (hashlib.md5(b''.join(part_md5s)).hexdigest(),
+                          len(part_md5s))
+        self._add_object(bucket, object_name, path, etag)
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        self.render_xml({"CompleteMultipartUploadResult": {
+            "Location": self.request.path_url,
+            "Bucket": bucket,
+            "Key": object_name,
+            "ETag": '"%s"' % etag,
+        }})
+
+    def _abort_upload(self, bucket, object_name):
+        upload_dir = self._get_upload_dir(bucket, object_name)
+        if not upload_dir:
+            return
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        self.set_status(204)
+        self.finish()
+
+    def _get_upload_dir(self, bucket, object_name):
+        upload_id = self.get_argument('uploadId', '')
+        upload_dir = os.path.join(self.application.uploads_directory,
+                                  upload_id)
+        try:
+            if not _UPLOAD_ID_RE.match(upload_id):
+                raise ValueError()
+            with open(os.path.join(upload_dir, 'upload')) as f:
+                upload = json.load(f)
+        except (ValueError, IOError, OSError):
+            upload = None
+        if upload != {'bucket': bucket, 'key': object_name}:
+            self.set_error(404, "NoSuchUpload",
+                           "The specified upload does not exist")
+            return None
+        return upload_dir
+
+    @staticmethod
+    def _parse_upload_parts(body):
+        parts = []
+        for element in etree.fromstring(body):
+            if etree.QName(element).localname != 'Part':
+                continue
+            part = {etree.QName(e).localname: e.text for e in element}
+            parts.append((int(part['PartNumber']),
+                          part['ETag'].strip().strip('"')))
+        return parts
+
+    def _get_new_object_path(self, bucket, object_name):
+        bucket_dir = os.path.abspath(os.path.join(
+            self.application.directory, bucket))
+        if (not bucket_dir.startswith(self.application.directory) or
+                not os.path.isdir(bucket_dir)):
+            self.set_404()
+            return None
+        path = self._object_path(bucket, object_name)
+        if not path.startswith(bucket_dir) or os.path.isdir(path):
+            self.set_status(403)
+            return None
+        return path
+
+    def _read_body(self):
+        body_file = self.request.body_file
+        return iter(lambda: body_file.read(CHUNK_SIZE), b'')
+
+    def _write_file(self, path, chunks):
+        # NOTE(ft): data is streamed into a temporary file by chunks to
+        # not keep it in memory, then the file replaces the target atomically
+        fileutils.ensure_tree(os.path.dirname(path))
+        md5 = hashlib.md5()
+        temp_fd, temp_path = tempfile.mkstemp(
+            dir=self.application.temp_directory)
+        with fileutils.remove_path_on_error(temp_path):
+            with os.fdopen(temp_fd, "wb") as temp_file:
+                for chunk in chunks:
+                    md5.update(chunk)
+                    temp_file.write(chunk)
+            os.rename(temp_path, path)
+        return md5.hexdigest()
+
+    def _add_object(self, bucket, object_name, path, etag):
+        info = os.stat(path)
+        self.application.get_bucket_index(bucket).add(
+            object_name, info.st_size, info.st_mtime, etag)
+
+    def _get_etag(self, bucket, object_name, info):
+        indexed = self.application.get_bucket_index(bucket).get(object_name)
+        if (indexed and indexed[2] and
+                indexed[:2] == (info.st_size, info.st_mtime)):
+            return indexed[2]
+        # NOTE(ft): MD5 hash of an object which was not uploaded by this
+        # server (e.g. the object was modified directly or the index was
+        # rebuilt) is not known, and its calculation requires to read
+        # the whole object, so the object's ETag is built from its stats
+        return '%x-%x' % (int(info.st_mtime * 1000000), info.st_size)
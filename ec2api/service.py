@@ -21,6 +21,7 @@ from oslo_utils import importutils
 
 from ec2api import exception
 from ec2api.i18n import _
+from ec2api import image_worker
 from ec2api.openstack.common import service
 from ec2api import wsgi
 
@@ -140,6 +141,9 @@ class WSGIService(object):
         self.server.start()
         if self.manager:
             self.manager.post_start_hook()
+        if self.name == 'ec2api':
+            # NOTE(ft): the worker resumes image jobs of dead API workers
+            image_worker.start_api_worker()
 
     def stop(self):
         """Stop serving this API.
@@ -173,6 +173,8 @@ class ApiTestCase(BaseTestCase):
         self.mock_all_os()
         self.db_api = self.mock_db()
         self.isotime = self.mock('ec2api.openstack.common.timeutils.isotime')
+        # NOTE(ft): cached Glance images would leak between tests
+        self.configure(image_catalog_ttl=0)
 
     def execute(self, action, args):
         status_code, response = self._execute(action, args)
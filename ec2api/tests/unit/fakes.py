@@ -380,11 +380,13 @@ DB_VPC_1 = {'id': ID_EC2_VPC_1,
             'os_id': ID_OS_ROUTER_1,
             'vpc_id': None,
             'cidr_block': CIDR_VPC_1,
-            'route_table_id': ID_EC2_ROUTE_TABLE_1}
+            'route_table_id': ID_EC2_ROUTE_TABLE_1,
+            'default_group_verified': True}
 DB_VPC_2 = {'id': ID_EC2_VPC_2,
             'os_id': ID_OS_ROUTER_2,
             'vpc_id': None,
-            'cidr_block': CIDR_VPC_2}
+            'cidr_block': CIDR_VPC_2,
+            'default_group_verified': True}
 
 EC2_VPC_1 = {'vpcId': ID_EC2_VPC_1,
              'cidrBlock': CIDR_VPC_1,
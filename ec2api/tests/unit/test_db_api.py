@@ -121,6 +121,21 @@ class DbApiTestCase(base.DbTestCase):
         item_id2 = db_api.add_item_id(self.context, 'fake', os_id)
         self.assertEqual(item_id1, item_id2)
 
+    def test_ensure_item_ids(self):
+        os_id = fakes.random_os_id()
+        item_id = db_api.add_item_id(self.context, 'fake', os_id)
+        new_os_id = fakes.random_os_id()
+        ids = dict((i_os_id, i_id)
+                   for i_id, i_os_id in db_api.ensure_item_ids(
+                       self.context, 'fake', [os_id, new_os_id]))
+        self.assertEqual(item_id, ids[os_id])
+        self.assertTrue(validator.validate_ec2_id(ids[new_os_id], '',
+                                                  ['fake']))
+        self.assertEqual([(ids[new_os_id], new_os_id)],
+                         db_api.get_items_ids(self.context, 'fake',
+                                              item_os_ids=[new_os_id]))
+        self.assertEqual([], db_api.ensure_item_ids(self.context, 'fake', []))
+
     def test_restore_item(self):
         os_id = fakes.random_os_id()
         item = {'os_id': os_id, 'key': 'val1'}
@@ -182,6 +197,144 @@ class DbApiTestCase(base.DbTestCase):
         item = db_api.get_item_by_id(self.context, item['id'])
         self.assertIsNotNone(item)
 
+    def test_delete_items(self):
+        item1 = db_api.add_item(self.context, 'fake', {})
+        item2 = db_api.add_item(self.context, 'fake', {})
+        item3 = db_api.add_item(self.context, 'fake', {})
+        other_item = db_api.add_item(self.other_context, 'fake', {})
+        db_api.add_tags(self.context, [{'item_id': item1['id'],
+                                        'key': 'key',
+                                        'value': 'val'}])
+
+        db_api.delete_items(self.context,
+                            [item1['id'], item2['id'], other_item['id']])
+        items = db_api.get_items(self.context, 'fake')
+        self.assertEqual([item3['id']], [i['id'] for i in items])
+        self.assertEqual([], db_api.get_tags(self.context))
+        self.assertIsNotNone(db_api.get_item_by_id(self.other_context,
+                                                   other_item['id']))
+
+        # NOTE(ft): delete nothing should pass quitely
+        db_api.delete_items(self.context, [])
+
+    def test_os_states(self):
+        os_id_1 = fakes.random_os_id()
+        os_id_2 = fakes.random_os_id()
+        self.assertIsNone(db_api.get_os_states_sync_time(self.context,
+                                                         'fake'))
+
+        db_api.reset_os_states(
+            self.context, 'fake',
+            [(os_id_1, self.context.project_id, {'id': os_id_1}),
+             (os_id_2, self.other_context.project_id, {'id': os_id_2})])
+        self.assertIsNotNone(db_api.get_os_states_sync_time(self.context,
+                                                            'fake'))
+        self.assertEqual([{'id': os_id_1}],
+                         db_api.get_os_states(self.context, 'fake'))
+        self.assertEqual([], db_api.get_os_states(self.context, 'fake1'))
+
+        db_api.update_os_state(self.context, 'fake', os_id_1,
+                               self.context.project_id,
+                               {'id': os_id_1, 'attr': 'value'})
+        os_id_3 = fakes.random_os_id()
+        db_api.update_os_state(self.context, 'fake', os_id_3,
+                               self.context.project_id, {'id': os_id_3})
+        self.assertThat(db_api.get_os_states(self.context, 'fake'),
+                        matchers.ListMatches([{'id': os_id_1,
+                                               'attr': 'value'},
+                                              {'id': os_id_3}],
+                                             orderless_lists=True))
+
+        db_api.delete_os_state(self.context, 'fake', os_id_1)
+        self.assertEqual([{'id': os_id_3}],
+                         db_api.get_os_states(self.context, 'fake'))
+
+        db_api.reset_os_states(self.context, 'fake', [])
+        self.assertEqual([], db_api.get_os_states(self.context, 'fake'))
+        self.assertEqual([], db_api.get_os_states(self.other_context,
+                                                  'fake'))
+
+    def test_reconciliations(self):
+        item_id = fakes.random_ec2_id('fake')
+        db_api.add_reconciliations(
+            self.context,
+            [{'item_id': item_id, 'action': 'fake_action',
+              'data': {'os_id': 'fake_os_id'}},
+             {'item_id': item_id, 'action': 'fake_action1'}])
+        # NOTE(ft): registered inconsistencies are not duplicated
+        db_api.add_reconciliations(
+            self.context,
+            [{'item_id': item_id, 'action': 'fake_action'}])
+        db_api.add_reconciliations(
+            self.other_context,
+            [{'item_id': item_id, 'action': 'fake_action'}])
+
+        reconciliations = db_api.get_reconciliations(self.context)
+        self.assertEqual(3, len(reconciliations))
+        self.assertThat(reconciliations[0],
+                        matchers.DictMatches(
+                            {'id': mock.ANY,
+                             'project_id': self.context.project_id,
+                             'item_id': item_id,
+                             'action': 'fake_action',
+                             'data': {'os_id': 'fake_os_id'}}))
+        self.assertEqual({}, reconciliations[1]['data'])
+        self.assertEqual(self.other_context.project_id,
+                         reconciliations[2]['project_id'])
+        self.assertEqual(reconciliations[:2],
+                         db_api.get_reconciliations(self.context, limit=2))
+
+        db_api.delete_reconciliations(
+            self.context, [r['id'] for r in reconciliations[:2]])
+        self.assertEqual(reconciliations[2:],
+                         db_api.get_reconciliations(self.context))
+
+    def test_instance_metadata(self):
+        os_id = fakes.random_os_id()
+        db_api.add_instance_metadata(self.context, os_id,
+                                     {'metadata': {'fake': 'fake_value'}})
+        self.assertEqual({'metadata': {'fake': 'fake_value'}},
+                         db_api.get_instance_metadata(self.context, os_id))
+        self.assertIsNone(db_api.get_instance_metadata(self.other_context,
+                                                       os_id))
+
+        # NOTE(ft): stored metadata is replaced
+        db_api.add_instance_metadata(self.context, os_id, {'metadata': {}})
+        self.assertEqual({'metadata': {}},
+                         db_api.get_instance_metadata(self.context, os_id))
+
+        db_api.delete_instance_metadata(self.other_context, [os_id])
+        self.assertIsNotNone(db_api.get_instance_metadata(self.context,
+                                                          os_id))
+        db_api.delete_instance_metadata(self.context, [os_id])
+        self.assertIsNone(db_api.get_instance_metadata(self.context, os_id))
+
+    def test_image_jobs(self):
+        self.context.user_id = fakes.ID_OS_USER
+        job = db_api.add_image_job(self.context, 'fake_action',
+                                   {'key': 'value'}, lease_time=100)
+        self.assertThat(job, matchers.DictMatches(
+            {'id': mock.ANY,
+             'project_id': self.context.project_id,
+             'user_id': fakes.ID_OS_USER,
+             'action': 'fake_action',
+             'data': {'key': 'value'}}))
+        free_job = db_api.add_image_job(self.context, 'fake_action', {})
+
+        # NOTE(ft): leased jobs are not claimed until the lease expiration
+        jobs = db_api.claim_image_jobs(self.context, 100, 10)
+        self.assertEqual([free_job['id']], [j['id'] for j in jobs])
+        self.assertEqual([], db_api.claim_image_jobs(self.context, 100, 10))
+
+        db_api.renew_image_jobs(self.context, [job['id']], -1)
+        jobs = db_api.claim_image_jobs(self.context, 100, 10)
+        self.assertEqual([job], jobs)
+
+        db_api.delete_image_job(self.context, job['id'])
+        db_api.renew_image_jobs(self.context, [job['id'], free_job['id']], -1)
+        jobs = db_api.claim_image_jobs(self.context, 100, 10)
+        self.assertEqual([free_job['id']], [j['id'] for j in jobs])
+
     def _setup_items(self):
         db_api.add_item(self.context, 'fake', {})
         db_api.add_item(self.context, 'fake', {'is_public': True})
@@ -200,6 +353,8 @@ class DbApiTestCase(base.DbTestCase):
         self.assertEqual(2, len(items))
         items = db_api.get_items(self.context, 'fake0')
         self.assertEqual(0, len(items))
+        items = db_api.get_items(self.context, ('fake', 'fake1'))
+        self.assertEqual(3, len(items))
 
     def test_get_item_by_id(self):
         self._setup_items()
@@ -275,6 +430,9 @@ class DbApiTestCase(base.DbTestCase):
         items_ids = db_api.get_items_ids(self.context, 'fake',
                                          item_ids=[item['id']])
         self.assertEqual(0, len(items_ids))
+        items_ids = db_api.get_items_ids(self.context, ('fake', 'fake1'),
+                                         item_ids=[item['id']])
+        self.assertEqual([(item['id'], item['os_id'])], items_ids)
 
     def test_get_public_items(self):
         self._setup_items()
@@ -298,6 +456,8 @@ class DbApiTestCase(base.DbTestCase):
         self.assertEqual(0, len(items))
         items = db_api.get_public_items(self.context, 'fake0', [])
         self.assertEqual(0, len(items))
+        items = db_api.get_public_items(self.context, ('fake', 'fake1'))
+        self.assertEqual(2, len(items))
 
     def test_add_tags(self):
         item1_id = fakes.random_ec2_id('fake')
@@ -13,12 +13,13 @@
 # limitations under the License.
 
 import copy
+import io
 import json
 import os
-import tempfile
+import tarfile
 
 from cinderclient import exceptions as cinder_exception
-import eventlet
+from eventlet.green import subprocess
 import mock
 
 from ec2api.api import image as image_api
@@ -92,8 +93,10 @@ FILE_MANIFEST_XML = """<?xml version="1.0" ?>
 
 class ImageTestCase(base.ApiTestCase):
 
+    @mock.patch('ec2api.image_worker.add_job')
     @mock.patch('ec2api.api.instance._is_ebs_instance')
-    def _test_create_image(self, instance_status, no_reboot, is_ebs_instance):
+    def _test_create_image(self, instance_status, no_reboot, is_ebs_instance,
+                           add_image_job):
         self.set_mock_db_items(fakes.DB_INSTANCE_2)
         os_instance = mock.MagicMock()
         os_instance.configure_mock(id=fakes.ID_OS_INSTANCE_2,
@@ -130,15 +133,23 @@ class ImageTestCase(base.ApiTestCase):
             expected_image['os_id'] = os_image_id
         self.db_api.add_item.assert_called_once_with(
             mock.ANY, 'ami', expected_image)
-        if not no_reboot:
-            eventlet.sleep()
-        if not no_reboot:
-            os_instance.stop.assert_called_once_with()
-            os_instance.get.assert_called_once_with()
-            os_instance.start.assert_called_once_with()
         if no_reboot:
             os_instance.create_image.assert_called_once_with('fake_name')
+            self.assertFalse(add_image_job.called)
         else:
+            add_image_job.assert_called_once_with(
+                mock.ANY, 'create_image',
+                {'image_id': image_id,
+                 'instance_id': fakes.ID_EC2_INSTANCE_2,
+                 'os_instance_id': fakes.ID_OS_INSTANCE_2,
+                 'name': 'fake_name'})
+            self.add_mock_db_items(dict(expected_image, id=image_id,
+                                        vpc_id=None))
+            image_api._create_image_job(base.create_context(),
+                                        add_image_job.call_args[0][2])
+            os_instance.stop.assert_called_once_with()
+            os_instance.get.assert_called_once_with()
+            os_instance.start.assert_called_once_with()
             os_instance.create_image.assert_called_once_with(
                 'fake_name', metadata={'ec2_id': image_id})
             self.db_api.update_item.assert_called_once_with(
@@ -151,6 +162,27 @@ class ImageTestCase(base.ApiTestCase):
         self.db_api.reset_mock()
         self.nova.servers.reset_mock()
 
+    def test_resume_create_image(self):
+        image_id = fakes.random_ec2_id('ami')
+        self.set_mock_db_items({'id': image_id,
+                                'is_public': False})
+        os_instance = mock.MagicMock()
+        self.nova_admin.servers.get.return_value = os_instance
+        admin_context = base.create_context(is_os_admin=True)
+
+        image_api._create_image_job(
+            admin_context,
+            {'image_id': image_id,
+             'instance_id': fakes.ID_EC2_INSTANCE_2,
+             'os_instance_id': fakes.ID_OS_INSTANCE_2,
+             'name': 'fake_name'})
+        self.assertFalse(os_instance.create_image.called)
+        self.db_api.update_item.assert_called_once_with(
+            mock.ANY, {'id': image_id,
+                       'is_public': False,
+                       'state': 'failed'})
+        os_instance.start.assert_called_once_with()
+
     def test_create_image(self):
         self._test_create_image('ACTIVE', False)
         self._test_create_image('SHUTOFF', True)
@@ -337,9 +369,9 @@ class ImageTestCase(base.ApiTestCase):
                 orderless_lists=True),
             verbose=True)
 
-        self.db_api.get_items.assert_any_call(mock.ANY, 'ami')
-        self.db_api.get_items.assert_any_call(mock.ANY, 'aki')
-        self.db_api.get_items.assert_any_call(mock.ANY, 'ari')
+        self.db_api.get_items.assert_any_call(mock.ANY, ('ami', 'ari', 'aki'))
+        self.db_api.get_public_items.assert_called_once_with(
+            mock.ANY, ('ami', 'ari', 'aki'), None)
 
         self.db_api.get_items_by_ids = tools.CopyingMock(
             side_effect=self.db_api.get_items_by_ids.side_effect)
@@ -375,6 +407,74 @@ class ImageTestCase(base.ApiTestCase):
             fakes.ID_EC2_IMAGE_1, 'imageId',
             ('ami', 'ari', 'aki'))
 
+    def test_describe_images_of_other_projects(self):
+        self._setup_model()
+        self.set_mock_db_items(fakes.DB_IMAGE_1,
+                               fakes.DB_SNAPSHOT_1, fakes.DB_SNAPSHOT_2,
+                               fakes.DB_IMAGE_AKI_1, fakes.DB_IMAGE_ARI_1,
+                               fakes.DB_VOLUME_1, fakes.DB_VOLUME_2)
+        os_image_2 = dict(fakes.OS_IMAGE_2, owner=fakes.random_os_id())
+        self.glance.images.list.side_effect = (
+            lambda: [fakes.OSImage(fakes.OS_IMAGE_1),
+                     fakes.OSImage(os_image_2)])
+        self.db_api.ensure_item_ids.return_value = [
+            (fakes.ID_EC2_IMAGE_2, fakes.ID_OS_IMAGE_2)]
+
+        resp = self.execute('DescribeImages', {})
+        self.assertEqual(set([fakes.ID_EC2_IMAGE_1, fakes.ID_EC2_IMAGE_2]),
+                         set(i['imageId'] for i in resp['imagesSet']))
+        self.db_api.ensure_item_ids.assert_called_once_with(
+            mock.ANY, 'ami', [fakes.ID_OS_IMAGE_2])
+        self.assertFalse(self.db_api.add_item_id.called)
+
+    def test_describe_images_by_catalog(self):
+        self.configure(image_catalog_ttl=60, image_catalog_cache_size=1)
+        image_catalogs_patcher = mock.patch(
+            'ec2api.api.image._image_catalogs', None)
+        image_catalogs_patcher.start()
+        self.addCleanup(image_catalogs_patcher.stop)
+        self._setup_model()
+        os_image_1 = fakes.OSImage(fakes.OS_IMAGE_1)
+        os_image_1.updated_at = '2015-01-01T00:00:00'
+        os_image_2 = fakes.OSImage(fakes.OS_IMAGE_2)
+        os_image_2.updated_at = '2015-01-02T00:00:00'
+        self.glance.images.list.side_effect = None
+        self.glance.images.list.return_value = [os_image_1, os_image_2]
+
+        resp = self.execute('DescribeImages', {})
+        self.assertEqual(2, len(resp['imagesSet']))
+        self.glance.images.list.assert_called_once_with(page_size=mock.ANY)
+
+        # NOTE(ft): only images changed since the last request are listed
+        os_image_2.deleted = True
+        os_image_2.updated_at = '2015-01-03T00:00:00'
+        self.glance.images.list.return_value = [os_image_2]
+        resp = self.execute('DescribeImages', {})
+        self.assertEqual([fakes.ID_EC2_IMAGE_1],
+                         [i['imageId'] for i in resp['imagesSet']])
+        self.glance.images.list.assert_called_with(
+            page_size=mock.ANY,
+            filters={'changes-since': '2015-01-02T00:00:00'})
+
+        # NOTE(ft): own image modifications invalidate the catalog
+        self.execute('ResetImageAttribute',
+                     {'ImageId': fakes.ID_EC2_IMAGE_1,
+                      'Attribute': 'launchPermission'})
+        self.glance.images.list.return_value = [os_image_1]
+        self.glance.images.list.reset_mock()
+        self.execute('DescribeImages', {})
+        self.glance.images.list.assert_called_once_with(page_size=mock.ANY)
+
+        # NOTE(ft): catalogs of other projects are evicted over the cache size
+        self.execute('DescribeImages', {})
+        self.assertEqual(1, self.glance.images.list.call_count)
+        other_context = base.create_context()
+        other_context.project_id = fakes.random_os_id()
+        image_api._get_os_images(other_context)
+        self.glance.images.list.reset_mock()
+        self.execute('DescribeImages', {})
+        self.glance.images.list.assert_called_once_with(page_size=mock.ANY)
+
     def test_describe_images_invalid_parameters(self):
         self._setup_model()
 
@@ -466,7 +566,7 @@ class ImageTestCase(base.ApiTestCase):
         self.set_mock_db_items(fakes.DB_IMAGE_1, fakes.DB_IMAGE_2,
                                fakes.DB_SNAPSHOT_1, fakes.DB_SNAPSHOT_2,
                                fakes.DB_IMAGE_AKI_1, fakes.DB_IMAGE_ARI_1,
-                               fakes.DB_VOLUME_1, fakes. DB_VOLUME_2)
+                               fakes.DB_VOLUME_1, fakes.DB_VOLUME_2)
         self.db_api.get_public_items.return_value = []
 
         # NOTE(ft): glance.image.list returns an iterator, not just a list
@@ -812,26 +912,47 @@ class S3TestCase(base.BaseTestCase):
 
     @mock.patch.object(fakes.OSImage, 'update', autospec=True)
     def test_s3_create_image_locations(self, osimage_update):
-        self.configure(image_decryption_dir=None)
         glance = self.mock_glance()
-        _handle, tempf = tempfile.mkstemp()
         fake_context = base.create_context()
-
-        @mock.patch('ec2api.api.image._s3_untarzip_image')
-        @mock.patch('ec2api.api.image._s3_decrypt_image')
-        @mock.patch('ec2api.api.image._s3_download_file')
+        image_data = b'fake image data' * 10000
+        tarball = io.BytesIO()
+        with tarfile.open(fileobj=tarball, mode='w:gz') as tar_file:
+            tar_info = tarfile.TarInfo('image')
+            tar_info.size = len(image_data)
+            tar_file.addfile(tar_info, io.BytesIO(image_data))
+        uploaded_data = []
+
+        def update(image, **kwargs):
+            if 'data' in kwargs:
+                uploaded_data.append(kwargs['data'].read())
+
+        osimage_update.side_effect = update
+        popen = subprocess.Popen
+
+        @mock.patch('ec2api.image_worker.add_job',
+                    side_effect=(lambda context, action, data:
+                                 image_api._s3_import_job(context, data)))
+        @mock.patch('ec2api.api.image.subprocess.Popen')
+        @mock.patch('ec2api.api.image._s3_decrypt_key')
         @mock.patch('ec2api.api.image._s3_conn')
-        def do_test(s3_conn, s3_download_file, s3_decrypt_image,
-                    s3_untarzip_image):
-            (s3_conn.return_value.
-             get_bucket.return_value.
-             get_key.return_value.
-             get_contents_as_string.return_value) = FILE_MANIFEST_XML
-            s3_download_file.return_value = tempf
-            s3_untarzip_image.return_value = tempf
+        def do_test(s3_conn, s3_decrypt_key, decryptor_popen, add_image_job):
+            manifest_key = mock.Mock()
+            manifest_key.get_contents_as_string.return_value = (
+                FILE_MANIFEST_XML)
+            part_key = mock.Mock()
+            part_key.get_contents_as_string.return_value = tarball.getvalue()
+            bucket = s3_conn.return_value.get_bucket.return_value
+            bucket.get_key.side_effect = (
+                lambda name: part_key if name == 'foo' else manifest_key)
+            s3_decrypt_key.return_value = ('key', 'iv')
+            # NOTE(ft): the fake bundle is not encrypted
+            decryptor_popen.side_effect = (
+                lambda args, **kwargs: popen(['cat'], **kwargs))
             (glance.images.create.return_value) = (
                 fakes.OSImage({'id': fakes.random_os_id(),
                                'status': 'queued'}))
+            glance.images.get.return_value = (
+                glance.images.create.return_value)
 
             data = [
                 ({'properties': {
@@ -840,30 +961,38 @@ class S3TestCase(base.BaseTestCase):
                 ({'properties': {
                     'image_location': '/testbucket_2/test.img.manifest.xml'}},
                  'testbucket_2', 'test.img.manifest.xml')]
-            for mdata, bucket, manifest in data:
+            for mdata, bucket_name, manifest in data:
+                del uploaded_data[:]
                 image = image_api._s3_create(fake_context, mdata)
-                eventlet.sleep()
-                osimage_update.assert_called_with(
-                    image, properties={'image_state': 'available'})
+                self.assertEqual(
+                    ['downloading', 'uploading', 'available'],
+                    [c[1]['properties']['image_state']
+                     for c in osimage_update.call_args_list[-4:]
+                     if 'properties' in c[1]])
                 osimage_update.assert_any_call(
-                    image, data=mock.ANY)
-                s3_conn.return_value.get_bucket.assert_called_with(bucket)
-                (s3_conn.return_value.get_bucket.return_value.
-                 get_key.assert_called_with(manifest))
-                (s3_conn.return_value.get_bucket.return_value.
-                 get_key.return_value.
-                 get_contents_as_string.assert_called_with())
-                s3_download_file.assert_called_with(
-                    s3_conn.return_value.get_bucket.return_value,
-                    'foo', mock.ANY)
-                s3_decrypt_image.assert_called_with(
-                    fake_context, mock.ANY, 'foo', 'foo', mock.ANY)
-                s3_untarzip_image.assert_called_with(mock.ANY, mock.ANY)
-
-            do_test()
-
-    @mock.patch('ec2api.api.image.eventlet.spawn_n')
-    def test_s3_create_bdm(self, spawn_n):
+                    image, data=mock.ANY, size=len(image_data))
+                self.assertEqual([image_data], uploaded_data)
+                s3_conn.return_value.get_bucket.assert_called_with(
+                    bucket_name)
+                bucket.get_key.assert_any_call(manifest)
+                bucket.get_key.assert_called_with('foo')
+                add_image_job.assert_called_with(
+                    fake_context, 's3_import',
+                    {'os_image_id': image.id,
+                     'image_location': bucket_name + '/' + manifest,
+                     'image_parts': ['foo'],
+                     'encrypted_key': 'foo',
+                     'encrypted_iv': 'foo'})
+                s3_decrypt_key.assert_called_with(fake_context, 'foo', 'foo')
+                decryptor_popen.assert_called_with(
+                    ['openssl', 'enc', '-d', '-aes-128-cbc',
+                     '-K', 'key', '-iv', 'iv'],
+                    stdin=mock.ANY, stdout=mock.ANY, stderr=mock.ANY)
+
+        do_test()
+
+    @mock.patch('ec2api.image_worker.add_job')
+    def test_s3_create_bdm(self, add_image_job):
         glance = self.mock_glance()
         metadata = {'properties': {
                         'image_location': 'fake_bucket/fake_manifest',
@@ -902,11 +1031,9 @@ class S3TestCase(base.BaseTestCase):
                             'image_location': 'fake_bucket/fake_manifest'})
 
     def test_s3_malicious_tarballs(self):
-        self.assertRaises(
-            exception.EC2InvalidException,
-            image_api._s3_test_for_malicious_tarball,
-            "/unused", os.path.join(os.path.dirname(__file__), 'abs.tar.gz'))
-        self.assertRaises(
-            exception.EC2InvalidException,
-            image_api._s3_test_for_malicious_tarball,
-            "/unused", os.path.join(os.path.dirname(__file__), 'rel.tar.gz'))
+        for tarball in ('abs.tar.gz', 'rel.tar.gz'):
+            path = os.path.join(os.path.dirname(__file__), tarball)
+            with open(path, 'rb') as f:
+                tar_file = tarfile.open(fileobj=f, mode='r|gz')
+                self.assertRaises(exception.EC2InvalidException,
+                                  image_api._s3_untarzip_image, tar_file)
@@ -0,0 +1,60 @@
+# Copyright 2014
+# The Cloudscaling Group, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mock
+
+from ec2api import image_worker
+from ec2api.tests.unit import base
+
+
+class ImageWorkerTestCase(base.ApiTestCase):
+
+    @mock.patch('ec2api.image_worker.start_api_worker')
+    def test_add_job(self, start_api_worker):
+        context = base.create_context()
+        api_worker = start_api_worker.return_value
+
+        image_worker.add_job(context, 's3_import', {'fake': 'data'})
+        api_worker.add_job.assert_called_once_with(
+            context, 's3_import', {'fake': 'data'})
+        self.assertFalse(self.db_api.add_image_job.called)
+
+        self.configure(use_image_worker=True)
+        api_worker.add_job.reset_mock()
+        image_worker.add_job(context, 's3_import', {'fake': 'data'})
+        self.db_api.add_image_job.assert_called_once_with(
+            context, 's3_import', {'fake': 'data'}, None)
+        self.assertFalse(api_worker.add_job.called)
+
+        # NOTE(ft): image creation needs user credentials, which are
+        # available in the API worker only
+        image_worker.add_job(context, 'create_image', {'fake': 'data'})
+        api_worker.add_job.assert_called_once_with(
+            context, 'create_image', {'fake': 'data'})
+
+    @mock.patch('ec2api.api.image._s3_import_job')
+    def test_run_job(self, s3_import_job):
+        context = base.create_context()
+        job = {'id': 1, 'action': 's3_import', 'data': {'fake': 'data'}}
+
+        image_worker._run_job(context, job)
+        s3_import_job.assert_called_once_with(context, {'fake': 'data'})
+        self.db_api.delete_image_job.assert_called_once_with(context, 1)
+
+        # NOTE(ft): failed jobs are not retried, the failure is reflected in
+        # the image state
+        s3_import_job.side_effect = Exception()
+        self.db_api.delete_image_job.reset_mock()
+        image_worker._run_job(context, job)
+        self.db_api.delete_image_job.assert_called_once_with(context, 1)
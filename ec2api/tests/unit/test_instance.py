@@ -618,6 +618,28 @@ class InstanceTestCase(base.ApiTestCase):
                                      'InstanceId.2': fakes.ID_EC2_INSTANCE_2})
         self.assertEqual(0, os_instance_operation.call_count)
 
+    @mock.patch('ec2api.api.instance._get_os_instances_by_instances')
+    @mock.patch.object(fakes.OSInstance, 'stop', autospec=True)
+    def test_stop_instances_partial_failure(self, os_instance_stop,
+                                            get_os_instances_by_instances):
+        os_instance_1 = fakes.OSInstance(fakes.OS_INSTANCE_1)
+        os_instance_2 = fakes.OSInstance(fakes.OS_INSTANCE_2)
+        for inst in (os_instance_1, os_instance_2):
+            setattr(inst, 'OS-EXT-STS:vm_state', instance_api.vm_states_ACTIVE)
+        self.set_mock_db_items(fakes.DB_INSTANCE_1, fakes.DB_INSTANCE_2)
+        get_os_instances_by_instances.return_value = [os_instance_1,
+                                                      os_instance_2]
+        os_instance_stop.side_effect = [
+            nova_exception.Conflict(409), None]
+
+        self.assert_execution_error(self.ANY_EXECUTE_ERROR, 'StopInstances',
+                                    {'InstanceId.1': fakes.ID_EC2_INSTANCE_1,
+                                     'InstanceId.2': fakes.ID_EC2_INSTANCE_2})
+        # NOTE(ft): the failure of the first instance must not prevent
+        # the operation on the second one
+        self.assertEqual([mock.call(os_instance_1), mock.call(os_instance_2)],
+                         os_instance_stop.mock_calls)
+
     @mock.patch.object(fakes.OSInstance, 'start', autospec=True)
     def test_start_instances(self, os_instance_start):
         self._test_instances_operation('StartInstances', os_instance_start,
@@ -1946,6 +1968,8 @@ class InstancePrivateTestCase(test_base.BaseTestCase):
         for eni in network_interfaces_to_delete:
             delete_network_interface.assert_any_call(fake_context,
                                                      eni['id'])
+        db_api.delete_items.assert_called_once_with(
+            fake_context, set(inst['id'] for inst in instances_to_remove))
 
     @mock.patch('cinderclient.client.Client')
     def test_get_os_volumes(self, cinder):
@@ -34,16 +34,20 @@ class ProxyTestCase(test_base.BaseTestCase):
     def setUp(self):
         super(ProxyTestCase, self).setUp()
         self.handler = metadata.MetadataRequestHandler()
-        conf = self.useFixture(config_fixture.Config())
-        conf.config(group='metadata',
+        metadata_cache_patcher = mock.patch(
+            'ec2api.metadata.api._metadata_cache', None)
+        metadata_cache_patcher.start()
+        self.addCleanup(metadata_cache_patcher.stop)
+        self.conf = self.useFixture(config_fixture.Config())
+        self.conf.config(group='metadata',
                     nova_metadata_ip='9.9.9.9',
-                    nova_metadata_port=8775,
-                    nova_metadata_protocol='http',
-                    nova_metadata_insecure=True,
-                    auth_ca_cert=None,
-                    nova_client_cert='nova_cert',
-                    nova_client_priv_key='nova_priv_key',
-                    metadata_proxy_shared_secret='secret')
+                         nova_metadata_port=8775,
+                         nova_metadata_protocol='http',
+                         nova_metadata_insecure=True,
+                         auth_ca_cert=None,
+                         nova_client_cert='nova_cert',
+                         nova_client_priv_key='nova_priv_key',
+                         metadata_proxy_shared_secret='secret')
 
     @mock.patch('ec2api.metadata.api.get_version_list')
     def test_callable(self, get_version_list):
@@ -71,15 +75,30 @@ class ProxyTestCase(test_base.BaseTestCase):
     @mock.patch.object(metadata.MetadataRequestHandler, '_get_requester')
     def test_version_root(self, get_requester, get_metadata):
         get_requester.return_value = mock.sentinel.requester
-        get_metadata.return_value = 'fake'
+        get_metadata.return_value = ('fake', 'fake_etag')
         request = webob.Request.blank('/latest')
         response = request.get_response(self.handler)
         self.assertEqual('fake', response.body.decode("utf-8"))
         response_ctype = response.headers['Content-Type']
         self.assertTrue(response_ctype.startswith("text/plain"))
+        self.assertEqual('"fake_etag"', response.headers['ETag'])
         get_requester.assert_called_with(mock.ANY)
         get_metadata.assert_called_with(['latest'], mock.sentinel.requester)
 
+        request = webob.Request.blank('/latest/')
+        request.if_none_match = 'fake_etag'
+        response = request.get_response(self.handler)
+        self.assertEqual(304, response.status_int)
+        self.assertEqual(b'', response.body)
+        get_metadata.assert_called_with(['latest'], mock.sentinel.requester)
+
+        request = webob.Request.blank('/latest//meta-data/../user-data')
+        request.if_none_match = 'other_etag'
+        response = request.get_response(self.handler)
+        self.assertEqual(200, response.status_int)
+        get_metadata.assert_called_with(['latest', 'user-data'],
+                                        mock.sentinel.requester)
+
         get_metadata.side_effect = exception.EC2MetadataNotFound()
         request = webob.Request.blank('/latest')
         response = request.get_response(self.handler)
@@ -156,20 +175,57 @@ class ProxyTestCase(test_base.BaseTestCase):
 
         do_test3()
 
-    @mock.patch('ec2api.metadata.api.get_metadata_item')
+    @mock.patch('ec2api.metadata.api.'
+                'get_os_instance_and_project_id_by_provider_id')
+    @mock.patch('ec2api.metadata.api.get_os_instance_and_project_id')
+    @mock.patch('ec2api.context.get_os_admin_context')
+    def test_requester_cache(self, get_context, get_ids,
+                             get_ids_by_provider):
+        get_context.return_value = base.create_context(is_os_admin=True)
+        get_ids.return_value = (mock.sentinel.os_instance_id,
+                                mock.sentinel.project_id)
+        get_ids_by_provider.return_value = (mock.sentinel.os_instance_id_2,
+                                            mock.sentinel.project_id)
+
+        for _ in range(2):
+            self.assertEqual(
+                (mock.sentinel.os_instance_id, mock.sentinel.project_id),
+                self.handler._find_requester(None, '10.0.0.1'))
+            self.assertEqual(
+                (mock.sentinel.os_instance_id_2, mock.sentinel.project_id),
+                self.handler._find_requester(mock.sentinel.provider_id,
+                                             '10.0.0.1'))
+        self.assertEqual(1, get_ids.call_count)
+        self.assertEqual(1, get_ids_by_provider.call_count)
+
+        # NOTE(ft): unknown addresses are cached too
+        get_ids.side_effect = exception.EC2MetadataNotFound()
+        for _ in range(2):
+            self.assertRaises(exception.EC2MetadataNotFound,
+                              self.handler._find_requester,
+                              None, '10.0.0.2')
+        self.assertEqual(2, get_ids.call_count)
+
+        # NOTE(ft): the cache is disabled
+        self.conf.config(requester_cache_expiration=0, group='metadata')
+        self.assertRaises(exception.EC2MetadataNotFound,
+                          self.handler._find_requester, None, '10.0.0.1')
+        self.assertEqual(3, get_ids.call_count)
+
+    @mock.patch('ec2api.metadata.api.get_metadata_entry')
     @mock.patch('ec2api.context.get_os_admin_context')
-    def test_get_metadata(self, get_context, get_metadata_item):
+    def test_get_metadata(self, get_context, get_metadata_entry):
         get_context.return_value = base.create_context(is_os_admin=True)
         requester = {'os_instance_id': mock.sentinel.os_instance_id,
                      'project_id': mock.sentinel.project_id,
                      'private_ip': mock.sentinel.private_ip}
-        get_metadata_item.return_value = 'fake_item'
+        get_metadata_entry.return_value = ('fake_item', 'fake_etag')
 
         retval = self.handler._get_metadata(['fake_ver', 'fake_attr'],
                                             requester)
-        self.assertEqual('fake_item', retval)
+        self.assertEqual(('fake_item', 'fake_etag'), retval)
         get_context.assert_called_with()
-        get_metadata_item.assert_called_with(
+        get_metadata_entry.assert_called_with(
             get_context.return_value, ['fake_ver', 'fake_attr'],
             mock.sentinel.os_instance_id, mock.sentinel.private_ip)
         self.assertEqual(mock.sentinel.project_id,
@@ -225,7 +281,8 @@ class ProxyTestCase(test_base.BaseTestCase):
 
             retval = self.handler._proxy_request(req, mock.sentinel.requester)
             mock_http.assert_called_once_with(
-                ca_certs=None, disable_ssl_certificate_validation=True)
+                ca_certs=None, disable_ssl_certificate_validation=True,
+                timeout=cfg.CONF.metadata.nova_metadata_timeout)
             mock_http.assert_has_calls([
                 mock.call().add_certificate(
                     cfg.CONF.metadata.nova_client_priv_key,
@@ -256,6 +313,24 @@ class ProxyTestCase(test_base.BaseTestCase):
         self.assertEqual(response.content_type, "text/plain")
         self.assertEqual(response.body, 'content')
 
+    @mock.patch.object(metadata.MetadataRequestHandler,
+                       '_build_proxy_request_headers')
+    def test_proxy_request_keep_alive(self, build_headers):
+        req = mock.Mock(path_info='/openstack', query_string='', headers={},
+                        method='GET', body='')
+        resp = mock.MagicMock(status=200)
+        req.response = resp
+        build_headers.return_value = {}
+        with mock.patch('httplib2.Http') as mock_http:
+            mock_http.return_value.request.return_value = (resp, 'content')
+            self.handler._proxy_request(req, mock.sentinel.requester)
+            self.handler._proxy_request(req, mock.sentinel.requester)
+            # NOTE(ft): connections to Nova metadata server are reused
+            mock_http.assert_called_once_with(
+                ca_certs=None, disable_ssl_certificate_validation=True,
+                timeout=cfg.CONF.metadata.nova_metadata_timeout)
+            self.assertEqual(2, mock_http.return_value.request.call_count)
+
     def test_proxy_request_400(self):
         self.assertIsInstance(
             self._proxy_request_test_helper(response_code=400),
@@ -398,24 +473,23 @@ class ProxyTestCase(test_base.BaseTestCase):
 
     @mock.patch('novaclient.client.Client')
     @mock.patch('ec2api.db.api.IMPL')
-    @mock.patch('ec2api.metadata.api.instance_api')
-    def test_get_metadata_items(self, instance_api, db_api, nova):
+    def test_get_metadata_items(self, db_api, nova):
         FAKE_USER_DATA = u'fake_user_data-' + six.unichr(1071)
+        userDataValue = base64.b64encode(FAKE_USER_DATA.encode('utf-8'))
         nova.return_value.fixed_ips.get.return_value = (
                 mock.Mock(hostname='fake_name'))
         nova.return_value.servers.list.return_value = [
             fakes.OSInstance(fakes.OS_INSTANCE_1)]
+        nova.return_value.servers.get.return_value = (
+            fakes.OSInstance_full(dict(fakes.OS_INSTANCE_1,
+                                       user_data=userDataValue)))
         keypair = mock.Mock(public_key=fakes.PUBLIC_KEY_KEY_PAIR)
         keypair.configure_mock(name=fakes.NAME_KEY_PAIR)
-        nova.return_value.keypairs.get.return_value = keypair
+        nova.return_value.keypairs._get.return_value = keypair
         db_api.get_items_ids.return_value = [
                 (fakes.ID_EC2_INSTANCE_1, fakes.ID_OS_INSTANCE_1)]
-        instance_api.describe_instances.return_value = {
-               'reservationSet': [fakes.EC2_RESERVATION_1]}
-        userDataValue = base64.b64encode(FAKE_USER_DATA.encode('utf-8'))
-        instance_api.describe_instance_attribute.return_value = {
-                'instanceId': fakes.ID_EC2_INSTANCE_1,
-                'userData': {'value': userDataValue}}
+        db_api.get_item_by_id.return_value = fakes.DB_INSTANCE_1
+        db_api.get_items.return_value = [fakes.DB_NETWORK_INTERFACE_2]
 
         def _test_metadata_path(relpath):
             # recursively confirm a http 200 from all meta-data elements
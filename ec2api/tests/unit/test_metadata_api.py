@@ -13,10 +13,11 @@
 # limitations under the License.
 
 import base64
-import copy
+import hashlib
 
 import mock
 from novaclient import exceptions as nova_exception
+from oslo_utils import timeutils
 import six
 
 from ec2api import exception
@@ -37,15 +38,26 @@ class MetadataApiTestCase(base.ApiTestCase):
 
     def setUp(self):
         super(MetadataApiTestCase, self).setUp()
-        self.instance_api = self.mock('ec2api.metadata.api.instance_api')
+        metadata_cache_patcher = mock.patch(
+            'ec2api.metadata.api._metadata_cache', None)
+        metadata_cache_patcher.start()
+        self.addCleanup(metadata_cache_patcher.stop)
+        self.configure(cache_expiration=0, group='metadata')
 
-        self.set_mock_db_items(fakes.DB_INSTANCE_1)
-        self.instance_api.describe_instances.return_value = {
-               'reservationSet': [fakes.EC2_RESERVATION_1]}
+        self.set_mock_db_items(
+            fakes.DB_INSTANCE_1, fakes.DB_INSTANCE_2,
+            fakes.DB_NETWORK_INTERFACE_1, fakes.DB_NETWORK_INTERFACE_2,
+            fakes.DB_ADDRESS_1, fakes.DB_ADDRESS_2,
+            fakes.DB_IMAGE_1, fakes.DB_IMAGE_AKI_1, fakes.DB_IMAGE_ARI_1)
         userDataValue = base64.b64encode(FAKE_USER_DATA.encode('utf-8'))
-        self.instance_api.describe_instance_attribute.return_value = {
-                'instanceId': fakes.ID_EC2_INSTANCE_1,
-                'userData': {'value': userDataValue}}
+        self.nova.servers.get.side_effect = tools.get_by_1st_arg_getter({
+            fakes.ID_OS_INSTANCE_1: fakes.OSInstance_full(
+                dict(fakes.OS_INSTANCE_1, user_data=userDataValue)),
+            fakes.ID_OS_INSTANCE_2: fakes.OSInstance_full(
+                fakes.OS_INSTANCE_2)},
+            notfound_exception=nova_exception.NotFound(404))
+        self.cinder.volumes.get.side_effect = tools.get_by_1st_arg_getter({
+            fakes.ID_OS_VOLUME_2: fakes.OSVolume(fakes.OS_VOLUME_2)})
 
         self.fake_context = base.create_context()
 
@@ -125,13 +137,13 @@ class MetadataApiTestCase(base.ApiTestCase):
               api.get_metadata_item, self.fake_context, ['9999-99-99'],
               fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
 
-        self.db_api.get_items_ids.assert_called_with(
-            self.fake_context, 'i', item_ids=None,
-            item_os_ids=(fakes.ID_OS_INSTANCE_1,))
-        self.instance_api.describe_instances.assert_called_with(
-            self.fake_context, [fakes.ID_EC2_INSTANCE_1])
-        self.instance_api.describe_instance_attribute.assert_called_with(
-            self.fake_context, fakes.ID_EC2_INSTANCE_1, 'userData')
+        self.nova.servers.get.assert_called_once_with(fakes.ID_OS_INSTANCE_1)
+        self.db_api.get_items_ids.assert_any_call(
+            self.fake_context, 'i', item_os_ids=(fakes.ID_OS_INSTANCE_1,))
+        # NOTE(ft): metadata is built without describing of project objects
+        self.assertFalse(self.nova.servers.list.called)
+        self.assertFalse(self.neutron.list_ports.called)
+        self.assertFalse(self.db_api.add_item.called)
 
     def test_invalid_path(self):
         self.assertRaises(exception.EC2MetadataNotFound,
@@ -145,14 +157,27 @@ class MetadataApiTestCase(base.ApiTestCase):
               exception.EC2MetadataNotFound,
               api.get_metadata_item, self.fake_context, ['2009-04-04'],
               fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
+        self.assertFalse(self.db_api.get_items_ids.called)
 
     def test_non_existing_instance(self):
-        self.instance_api.describe_instances.return_value = {
-               'reservationSet': []}
         self.assertRaises(
               exception.EC2MetadataNotFound,
               api.get_metadata_item, self.fake_context, ['2009-04-04'],
-              fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
+              fakes.random_os_id(), fakes.IP_NETWORK_INTERFACE_2)
+
+    def test_instance_without_db_item(self):
+        self.set_mock_db_items()
+        self.db_api.add_item.side_effect = (
+            tools.get_db_api_add_item(fakes.ID_EC2_INSTANCE_1))
+        retval = api.get_metadata_item(
+               self.fake_context, ['2009-04-04', 'meta-data', 'instance-id'],
+               fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
+        self.assertEqual(fakes.ID_EC2_INSTANCE_1, retval)
+        self.db_api.add_item.assert_called_once_with(
+            self.fake_context, 'i',
+            {'os_id': fakes.ID_OS_INSTANCE_1,
+             'reservation_id': mock.ANY,
+             'launch_index': 0})
 
     def test_user_data(self):
         retval = api.get_metadata_item(
@@ -161,8 +186,9 @@ class MetadataApiTestCase(base.ApiTestCase):
         self.assertEqual(FAKE_USER_DATA, retval)
 
     def test_no_user_data(self):
-        self.instance_api.describe_instance_attribute.return_value = {
-                'instanceId': fakes.ID_EC2_INSTANCE_1}
+        self.nova.servers.get.side_effect = None
+        self.nova.servers.get.return_value = (
+            fakes.OSInstance_full(fakes.OS_INSTANCE_1))
         self.assertRaises(
               exception.EC2MetadataNotFound,
               api.get_metadata_item, self.fake_context,
@@ -170,8 +196,6 @@ class MetadataApiTestCase(base.ApiTestCase):
               fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
 
     def test_security_groups(self):
-        self.instance_api.describe_instances.return_value = {
-               'reservationSet': [fakes.EC2_RESERVATION_2]}
         retval = api.get_metadata_item(
                self.fake_context,
                ['2009-04-04', 'meta-data', 'security-groups'],
@@ -194,14 +218,25 @@ class MetadataApiTestCase(base.ApiTestCase):
         self.assertEqual(fakes.IP_NETWORK_INTERFACE_2, retval)
 
     def test_local_ipv4_from_address(self):
-        self.instance_api.describe_instances.return_value = {
-               'reservationSet': [fakes.EC2_RESERVATION_2]}
         retval = api.get_metadata_item(
                self.fake_context,
                ['2009-04-04', 'meta-data', 'local-ipv4'],
                fakes.ID_OS_INSTANCE_2, fakes.IP_NETWORK_INTERFACE_1)
         self.assertEqual(fakes.IP_NETWORK_INTERFACE_1, retval)
 
+    def test_public_ipv4(self):
+        retval = api.get_metadata_item(
+               self.fake_context,
+               ['2009-04-04', 'meta-data', 'public-ipv4'],
+               fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
+        self.assertEqual(fakes.IP_ADDRESS_2, retval)
+
+        retval = api.get_metadata_item(
+               self.fake_context,
+               ['2009-04-04', 'meta-data', 'public-ipv4'],
+               fakes.ID_OS_INSTANCE_2, fakes.IP_NETWORK_INTERFACE_1)
+        self.assertEqual(fakes.IP_ADDRESS_NOVA_1, retval)
+
     def test_pubkey_name(self):
         retval = api.get_metadata_item(
                self.fake_context,
@@ -210,8 +245,6 @@ class MetadataApiTestCase(base.ApiTestCase):
         self.assertEqual('0=%s' % fakes.NAME_KEY_PAIR, retval)
 
     def test_pubkey(self):
-        self.nova.servers.get.return_value = (
-               fakes.OSInstance(fakes.OS_INSTANCE_1))
         self.nova.keypairs.keypair_prefix = 'os_keypairs'
         self.nova.keypairs._get.return_value = (
                fakes.NovaKeyPair(fakes.OS_KEY_PAIR))
@@ -261,16 +294,108 @@ class MetadataApiTestCase(base.ApiTestCase):
               ['2007-08-29', 'meta-data', 'block-device-mapping'],
               fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
 
+    def test_metadata_entry(self):
+        text, etag = api.get_metadata_entry(
+            self.fake_context, ['latest', 'meta-data', 'instance-id'],
+            fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
+        self.assertEqual(fakes.ID_EC2_INSTANCE_1, text)
+        self.assertEqual(
+            hashlib.md5(fakes.ID_EC2_INSTANCE_1.encode('utf-8')).hexdigest(),
+            etag)
+        self.assertEqual(
+            (text, etag),
+            api.get_metadata_entry(
+                self.fake_context, ['2009-04-04', 'meta-data', 'instance-id'],
+                fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2))
+
+        self.assertRaises(
+            exception.EC2MetadataNotFound,
+            api.get_metadata_entry, self.fake_context,
+            ['latest', 'meta-data', 'instance-id', 'fake'],
+            fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
+        self.assertRaises(
+            exception.EC2MetadataNotFound,
+            api.get_metadata_entry, self.fake_context,
+            ['fake_version', 'meta-data'],
+            fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
+
+    def test_metadata_cache(self):
+        self.configure(cache_expiration=10, group='metadata')
+
+        def get_instance_id(os_instance_id, remote_ip, context=None):
+            return api.get_metadata_item(
+                context or self.fake_context,
+                ['2009-04-04', 'meta-data', 'instance-id'],
+                os_instance_id, remote_ip)
+
+        self.assertEqual(fakes.ID_EC2_INSTANCE_1,
+                         get_instance_id(fakes.ID_OS_INSTANCE_1,
+                                         fakes.IP_NETWORK_INTERFACE_2))
+        self.assertEqual(fakes.ID_EC2_INSTANCE_1,
+                         get_instance_id(fakes.ID_OS_INSTANCE_1,
+                                         fakes.IP_NETWORK_INTERFACE_2))
+        self.assertEqual(1, self.nova.servers.get.call_count)
+
+        # NOTE(ft): project of a request is checked for cached metadata too
+        other_context = base.create_context()
+        other_context.project_id = fakes.random_os_id()
+        self.assertRaises(exception.EC2MetadataNotFound,
+                          get_instance_id, fakes.ID_OS_INSTANCE_1,
+                          fakes.IP_NETWORK_INTERFACE_2, other_context)
+        self.assertEqual(1, self.nova.servers.get.call_count)
+
+        self.assertEqual(fakes.ID_EC2_INSTANCE_2,
+                         get_instance_id(fakes.ID_OS_INSTANCE_2,
+                                         fakes.IP_NETWORK_INTERFACE_1))
+        self.assertEqual(2, self.nova.servers.get.call_count)
+
+        # NOTE(ft): cached metadata expires
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        api._metadata_cache.clear()
+        get_instance_id(fakes.ID_OS_INSTANCE_2, fakes.IP_NETWORK_INTERFACE_1)
+        timeutils.advance_time_seconds(11)
+        get_instance_id(fakes.ID_OS_INSTANCE_2, fakes.IP_NETWORK_INTERFACE_1)
+        self.assertEqual(4, self.nova.servers.get.call_count)
+
+    def test_prebuilt_metadata(self):
+        self.configure(prebuild_instance_metadata=True)
+        self.db_api.get_instance_metadata.return_value = None
+        self.nova_admin.servers.get.return_value = fakes.OSInstance_full(
+            fakes.OS_INSTANCE_1)
+        api.prebuild_metadata(self.fake_context, [fakes.DB_INSTANCE_1])
+        self.db_api.add_instance_metadata.assert_called_once_with(
+            mock.ANY, fakes.ID_OS_INSTANCE_1,
+            {'instance': fakes.DB_INSTANCE_1, 'metadata': mock.ANY})
+        prebuilt = self.db_api.add_instance_metadata.call_args[0][2]
+        self.assertEqual(
+            fakes.ID_EC2_INSTANCE_1,
+            prebuilt['metadata']['meta-data']['instance-id'])
+        self.assertNotIn('local-ipv4', prebuilt['metadata']['meta-data'])
+
+        self.db_api.get_instance_metadata.return_value = prebuilt
+        self.nova.flavors.get.reset_mock()
+        self.nova.keypairs._get.reset_mock()
+        retval = api.get_metadata_item(
+            self.fake_context, ['2009-04-04', 'meta-data'],
+            fakes.ID_OS_INSTANCE_1, fakes.IP_NETWORK_INTERFACE_2)
+        self.assertIn('instance-id', retval)
+        self.assertIn('local-ipv4', retval)
+        self.db_api.get_instance_metadata.assert_called_once_with(
+            mock.ANY, fakes.ID_OS_INSTANCE_1)
+        self.assertFalse(self.nova.flavors.get.called)
+        self.assertFalse(self.nova.keypairs._get.called)
+
     def test_format_instance_mapping(self):
         retval = api._build_block_device_mappings(
-                'fake_context', fakes.EC2_INSTANCE_1, fakes.ID_OS_INSTANCE_1)
+                self.fake_context, fakes.OSInstance_full(fakes.OS_INSTANCE_1))
         self.assertThat(retval,
                         matchers.DictMatches(
                              {'ami': 'vda',
                               'root': fakes.ROOT_DEVICE_NAME_INSTANCE_1}))
 
         retval = api._build_block_device_mappings(
-                'fake_context', fakes.EC2_INSTANCE_2, fakes.ID_OS_INSTANCE_2)
+                self.fake_context, fakes.OSInstance_full(fakes.OS_INSTANCE_2))
         expected = {'ami': 'sdb1',
                     'root': fakes.ROOT_DEVICE_NAME_INSTANCE_2}
         expected.update(fakes.EC2_BDM_METADATA_INSTANCE_2)
@@ -283,10 +408,14 @@ class MetadataApiIntegralTestCase(base.ApiTestCase):
     # fake context are. ApiTestCase should be split to some classes to use
     # its feature optimally
 
-    @mock.patch('ec2api.api.instance.security_group_api')
-    @mock.patch('ec2api.api.instance.network_interface_api')
-    def test_get_metadata_integral(self, network_interface_api,
-                                   security_group_api):
+    def setUp(self):
+        super(MetadataApiIntegralTestCase, self).setUp()
+        metadata_cache_patcher = mock.patch(
+            'ec2api.metadata.api._metadata_cache', None)
+        metadata_cache_patcher.start()
+        self.addCleanup(metadata_cache_patcher.stop)
+
+    def test_get_metadata_integral(self):
         fake_context = base.create_context(is_os_admin=True)
 
         self.set_mock_db_items(
@@ -295,26 +424,14 @@ class MetadataApiIntegralTestCase(base.ApiTestCase):
             fakes.DB_IMAGE_1, fakes.DB_IMAGE_2,
             fakes.DB_IMAGE_ARI_1, fakes.DB_IMAGE_AKI_1,
             fakes.DB_VOLUME_1, fakes.DB_VOLUME_2, fakes.DB_VOLUME_3)
-        self.nova_admin.servers.list.return_value = [
-            fakes.OSInstance_full(fakes.OS_INSTANCE_1),
-            fakes.OSInstance_full(fakes.OS_INSTANCE_2)]
         self.nova_admin.servers.get.side_effect = tools.get_by_1st_arg_getter({
             fakes.ID_OS_INSTANCE_1: fakes.OSInstance_full(fakes.OS_INSTANCE_1),
             fakes.ID_OS_INSTANCE_2: fakes.OSInstance_full(fakes.OS_INSTANCE_2)
         })
         self.nova_admin.keypairs._get.return_value = (
                fakes.NovaKeyPair(fakes.OS_KEY_PAIR))
-        self.cinder.volumes.list.return_value = [
-            fakes.OSVolume(fakes.OS_VOLUME_1),
-            fakes.OSVolume(fakes.OS_VOLUME_2),
-            fakes.OSVolume(fakes.OS_VOLUME_3)]
-        network_interface_api.describe_network_interfaces.side_effect = (
-            lambda *args, **kwargs: copy.deepcopy({
-                'networkInterfaceSet': [fakes.EC2_NETWORK_INTERFACE_1,
-                                        fakes.EC2_NETWORK_INTERFACE_2]}))
-        security_group_api.describe_security_groups.return_value = {
-            'securityGroupInfo': [fakes.EC2_SECURITY_GROUP_1,
-                                  fakes.EC2_SECURITY_GROUP_3]}
+        self.cinder.volumes.get.side_effect = tools.get_by_1st_arg_getter({
+            fakes.ID_OS_VOLUME_2: fakes.OSVolume(fakes.OS_VOLUME_2)})
 
         retval = api.get_metadata_item(
                fake_context, ['latest', 'meta-data', 'instance-id'],
@@ -325,3 +442,9 @@ class MetadataApiIntegralTestCase(base.ApiTestCase):
                fake_context, ['latest', 'meta-data', 'instance-id'],
                fakes.ID_OS_INSTANCE_2, '10.200.1.15')
         self.assertEqual(fakes.ID_EC2_INSTANCE_2, retval)
+
+        retval = api.get_metadata_item(
+               fake_context, ['latest', 'meta-data', 'block-device-mapping',
+                              'ebs0'],
+               fakes.ID_OS_INSTANCE_2, '10.200.1.15')
+        self.assertEqual(fakes.ROOT_DEVICE_NAME_INSTANCE_2, retval)
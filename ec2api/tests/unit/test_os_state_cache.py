@@ -0,0 +1,217 @@
+# Copyright 2014
+# The Cloudscaling Group, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+import datetime
+
+import mock
+from novaclient import exceptions as nova_exception
+from oslo_utils import timeutils
+
+from ec2api.api import address
+from ec2api import os_state_cache
+from ec2api.tests.unit import base
+from ec2api.tests.unit import fakes
+from ec2api.tests.unit import matchers
+
+
+OS_PORT_1 = dict(fakes.OS_PORT_1, tenant_id=fakes.ID_OS_PROJECT)
+
+
+class OSStateCacheTestCase(base.ApiTestCase):
+
+    def setUp(self):
+        super(OSStateCacheTestCase, self).setUp()
+        self.context = base.create_context()
+        self.endpoint = os_state_cache.NotificationEndpoint()
+
+    def _notify(self, event_type, payload):
+        self.endpoint.info({}, 'fake_publisher', event_type, payload, {})
+
+    def test_get_os_ports(self):
+        self.db_api.get_os_states.return_value = [OS_PORT_1]
+        self.db_api.get_os_states_sync_time.return_value = timeutils.utcnow()
+
+        # NOTE(ft): the cache is disabled
+        self.assertIsNone(os_state_cache.get_os_ports(self.context))
+        self.assertFalse(self.db_api.get_os_states.called)
+
+        self.configure(use_os_state_cache=True)
+        self.assertEqual([OS_PORT_1],
+                         os_state_cache.get_os_ports(self.context))
+        self.db_api.get_os_states.assert_called_once_with(
+            self.context, os_state_cache.PORT)
+
+        # NOTE(ft): the cache is not synchronized yet
+        self.db_api.get_os_states.reset_mock()
+        self.db_api.get_os_states_sync_time.return_value = None
+        self.assertIsNone(os_state_cache.get_os_ports(self.context))
+
+        # NOTE(ft): the cache is stale
+        self.db_api.get_os_states_sync_time.return_value = (
+            timeutils.utcnow() - datetime.timedelta(hours=1))
+        self.assertIsNone(os_state_cache.get_os_ports(self.context))
+        self.assertFalse(self.db_api.get_os_states.called)
+
+    def test_describe_network_interfaces_from_cache(self):
+        self.configure(use_os_state_cache=True)
+        self.set_mock_db_items(fakes.DB_NETWORK_INTERFACE_1,
+                               fakes.DB_SECURITY_GROUP_1)
+        self.db_api.get_os_states_sync_time.return_value = timeutils.utcnow()
+        self.db_api.get_os_states.side_effect = (
+            lambda context, kind: ([OS_PORT_1]
+                                   if kind == os_state_cache.PORT else []))
+        self.neutron.list_security_groups.return_value = (
+            {'security_groups': [copy.deepcopy(fakes.OS_SECURITY_GROUP_1)]})
+
+        resp = self.execute('DescribeNetworkInterfaces', {})
+        self.assertEqual([fakes.ID_EC2_NETWORK_INTERFACE_1],
+                         [eni['networkInterfaceId']
+                          for eni in resp['networkInterfaceSet']])
+        self.assertFalse(self.neutron.list_ports.called)
+
+    def test_describe_network_interfaces_not_cached_yet(self):
+        self.configure(use_os_state_cache=True)
+        self.set_mock_db_items(fakes.DB_NETWORK_INTERFACE_1,
+                               fakes.DB_NETWORK_INTERFACE_2,
+                               fakes.DB_SECURITY_GROUP_1)
+        self.db_api.get_os_states_sync_time.return_value = timeutils.utcnow()
+        self.db_api.get_os_states.side_effect = (
+            lambda context, kind: ([OS_PORT_1]
+                                   if kind == os_state_cache.PORT else []))
+        self.neutron.list_ports.return_value = (
+            {'ports': [OS_PORT_1, fakes.OS_PORT_2]})
+        self.neutron.list_security_groups.return_value = (
+            {'security_groups': [copy.deepcopy(fakes.OS_SECURITY_GROUP_1)]})
+
+        # NOTE(ft): an item unknown to the cache is checked live and is
+        # not deleted as obsolete one
+        resp = self.execute('DescribeNetworkInterfaces', {})
+        self.assertEqual([fakes.ID_EC2_NETWORK_INTERFACE_1,
+                          fakes.ID_EC2_NETWORK_INTERFACE_2],
+                         sorted(eni['networkInterfaceId']
+                                for eni in resp['networkInterfaceSet']))
+        self.neutron.list_ports.assert_called_once_with(
+            tenant_id=fakes.ID_OS_PROJECT)
+        self.assertFalse(self.db_api.delete_item.called)
+        self.assertFalse(self.db_api.add_reconciliations.called)
+
+    def test_describe_addresses_not_cached_yet(self):
+        self.configure(use_os_state_cache=True)
+        address_engine_patcher = mock.patch(
+            'ec2api.api.address.address_engine',
+            address.AddressEngineNeutron())
+        address_engine_patcher.start()
+        self.addCleanup(address_engine_patcher.stop)
+        self.set_mock_db_items(fakes.DB_ADDRESS_1, fakes.DB_ADDRESS_2,
+                               fakes.DB_INSTANCE_1,
+                               fakes.DB_NETWORK_INTERFACE_2)
+        self.db_api.get_os_states_sync_time.return_value = timeutils.utcnow()
+        self.db_api.get_os_states.return_value = [
+            fakes.OS_FLOATING_IP_1,
+            dict(fakes.OS_FLOATING_IP_2, port_id=None,
+                 fixed_ip_address=None)]
+        self.neutron.list_floatingips.return_value = (
+            {'floatingips': [fakes.OS_FLOATING_IP_1,
+                             fakes.OS_FLOATING_IP_2]})
+        self.neutron.list_ports.return_value = (
+            {'ports': [fakes.OS_PORT_1, fakes.OS_PORT_2]})
+
+        # NOTE(ft): an association unknown to the cache is checked live and
+        # the address is not disassociated
+        resp = self.execute('DescribeAddresses', {})
+        self.assertThat(resp['addressesSet'],
+                        matchers.ListMatches([fakes.EC2_ADDRESS_1,
+                                              fakes.EC2_ADDRESS_2]))
+        self.neutron.list_floatingips.assert_called_once_with(
+            tenant_id=fakes.ID_OS_PROJECT)
+        self.assertFalse(self.db_api.update_item.called)
+        self.assertFalse(self.db_api.add_reconciliations.called)
+
+    def test_process_server_notification(self):
+        os_instance = mock.Mock(tenant_id=fakes.ID_OS_PROJECT)
+        os_instance.to_dict.return_value = {'id': fakes.ID_OS_INSTANCE_1}
+        self.nova_admin.servers.get.return_value = os_instance
+
+        self._notify('compute.instance.create.end',
+                     {'instance_id': fakes.ID_OS_INSTANCE_1,
+                      'tenant_id': fakes.ID_OS_PROJECT})
+        self.nova_admin.servers.get.assert_called_once_with(
+            fakes.ID_OS_INSTANCE_1)
+        self.db_api.update_os_state.assert_called_once_with(
+            mock.ANY, os_state_cache.SERVER, fakes.ID_OS_INSTANCE_1,
+            fakes.ID_OS_PROJECT, {'id': fakes.ID_OS_INSTANCE_1})
+
+        self.nova_admin.servers.get.side_effect = nova_exception.NotFound(404)
+        self._notify('compute.instance.power_off.end',
+                     {'instance_id': fakes.ID_OS_INSTANCE_1,
+                      'tenant_id': fakes.ID_OS_PROJECT})
+        self.db_api.delete_os_state.assert_called_once_with(
+            mock.ANY, os_state_cache.SERVER, fakes.ID_OS_INSTANCE_1)
+
+        self.nova_admin.servers.get.reset_mock()
+        self.db_api.delete_os_state.reset_mock()
+        self._notify('compute.instance.delete.end',
+                     {'instance_id': fakes.ID_OS_INSTANCE_1,
+                      'tenant_id': fakes.ID_OS_PROJECT})
+        self.assertFalse(self.nova_admin.servers.get.called)
+        self.db_api.delete_os_state.assert_called_once_with(
+            mock.ANY, os_state_cache.SERVER, fakes.ID_OS_INSTANCE_1)
+
+    def test_process_port_notification(self):
+        self._notify('port.update.start', {'port': OS_PORT_1})
+        self.assertFalse(self.db_api.update_os_state.called)
+
+        self._notify('port.update.end', {'port': OS_PORT_1})
+        self.db_api.update_os_state.assert_called_once_with(
+            mock.ANY, os_state_cache.PORT, fakes.ID_OS_PORT_1,
+            fakes.ID_OS_PROJECT, OS_PORT_1)
+
+        self._notify('port.delete.end', {'port_id': fakes.ID_OS_PORT_1})
+        self.db_api.delete_os_state.assert_called_once_with(
+            mock.ANY, os_state_cache.PORT, fakes.ID_OS_PORT_1)
+
+    def test_process_notification_failure(self):
+        self.db_api.update_os_state.side_effect = Exception()
+        # NOTE(ft): errors must not break the listener
+        self._notify('floatingip.create.end',
+                     {'floatingip': {'id': fakes.ID_OS_FLOATING_IP_1,
+                                     'tenant_id': fakes.ID_OS_PROJECT}})
+        self.assertTrue(self.db_api.update_os_state.called)
+
+    def test_resync_os_states(self):
+        os_instance = mock.Mock(id=fakes.ID_OS_INSTANCE_1,
+                                tenant_id=fakes.ID_OS_PROJECT)
+        os_instance.to_dict.return_value = {'id': fakes.ID_OS_INSTANCE_1}
+        self.nova_admin.servers.list.return_value = [os_instance]
+        self.neutron.list_ports.return_value = {'ports': [OS_PORT_1]}
+        self.neutron.list_floatingips.side_effect = Exception()
+        self.cinder.volumes.list.return_value = []
+
+        os_state_cache.resync_os_states()
+
+        self.nova_admin.servers.list.assert_called_once_with(
+            search_opts={'all_tenants': True})
+        self.db_api.reset_os_states.assert_any_call(
+            mock.ANY, os_state_cache.SERVER,
+            [(fakes.ID_OS_INSTANCE_1, fakes.ID_OS_PROJECT,
+              {'id': fakes.ID_OS_INSTANCE_1})])
+        self.db_api.reset_os_states.assert_any_call(
+            mock.ANY, os_state_cache.PORT,
+            [(fakes.ID_OS_PORT_1, fakes.ID_OS_PROJECT,
+              OS_PORT_1)])
+        self.db_api.reset_os_states.assert_any_call(
+            mock.ANY, os_state_cache.VOLUME, [])
+        # NOTE(ft): a failed kind must not prevent other kinds to be synced
+        self.assertEqual(3, self.db_api.reset_os_states.call_count)
@@ -0,0 +1,118 @@
+# Copyright 2014
+# The Cloudscaling Group, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+
+import mock
+from neutronclient.common import exceptions as neutron_exception
+
+from ec2api.api import common
+from ec2api import reconciler
+from ec2api.tests.unit import base
+from ec2api.tests.unit import fakes
+from ec2api.tests.unit import tools
+
+
+class ReconcilerTestCase(base.ApiTestCase):
+
+    def _reconcile(self, action, item_id, data=None):
+        self.db_api.get_reconciliations.return_value = [
+            {'id': 1, 'project_id': fakes.ID_OS_PROJECT,
+             'item_id': item_id, 'action': action,
+             'data': data or {}}]
+        reconciler.reconcile()
+        self.db_api.delete_reconciliations.assert_called_once_with(
+            mock.ANY, [1])
+        self.db_api.delete_reconciliations.reset_mock()
+
+    def test_describe_registers_inconsistencies(self):
+        self.configure(use_reconciler=True)
+        self.set_mock_db_items(fakes.DB_SUBNET_1, fakes.DB_SUBNET_2)
+        self.neutron.list_subnets.return_value = (
+            {'subnets': [fakes.OS_SUBNET_1]})
+        self.neutron.list_networks.return_value = (
+            {'networks': [fakes.OS_NETWORK_1]})
+
+        resp = self.execute('DescribeSubnets', {})
+        self.assertEqual([fakes.ID_EC2_SUBNET_1],
+                         [s['subnetId'] for s in resp['subnetSet']])
+        self.assertFalse(self.db_api.delete_item.called)
+        self.db_api.add_reconciliations.assert_called_once_with(
+            mock.ANY,
+            [{'item_id': fakes.ID_EC2_SUBNET_2,
+              'action': common.RECONCILE_DELETE_OBSOLETE_ITEM,
+              'data': {'os_id': fakes.ID_OS_SUBNET_2}}])
+
+    def test_delete_obsolete_item(self):
+        self.set_mock_db_items(fakes.DB_SUBNET_1)
+        self.neutron.show_subnet.return_value = (
+            {'subnet': fakes.OS_SUBNET_1})
+        self._reconcile(common.RECONCILE_DELETE_OBSOLETE_ITEM,
+                        fakes.ID_EC2_SUBNET_1)
+        self.assertFalse(self.db_api.delete_item.called)
+
+        self.neutron.show_subnet.side_effect = neutron_exception.NotFound()
+        self._reconcile(common.RECONCILE_DELETE_OBSOLETE_ITEM,
+                        fakes.ID_EC2_SUBNET_1)
+        self.db_api.delete_item.assert_called_once_with(
+            mock.ANY, fakes.ID_EC2_SUBNET_1)
+
+    def test_create_default_security_group(self):
+        vpc = tools.purge_dict(fakes.DB_VPC_1, ('default_group_verified',))
+        self.set_mock_db_items(vpc)
+        self.neutron.list_security_groups.return_value = (
+            {'security_groups': []})
+        self.neutron.create_security_group.return_value = (
+            {'security_group': copy.deepcopy(fakes.OS_SECURITY_GROUP_1)})
+
+        self._reconcile(common.RECONCILE_CREATE_DEFAULT_SECURITY_GROUP,
+                        fakes.ID_EC2_VPC_1)
+        self.neutron.list_security_groups.assert_called_once_with(
+            tenant_id=fakes.ID_OS_PROJECT)
+        self.neutron.create_security_group.assert_called_once_with(
+            {'security_group': {'name': fakes.ID_EC2_VPC_1,
+                                'description': 'Default VPC security group',
+                                'tenant_id': fakes.ID_OS_PROJECT}})
+        self.db_api.restore_item.assert_called_once_with(
+            mock.ANY, 'sg',
+            {'id': fakes.ID_EC2_VPC_1.replace('vpc', 'sg'),
+             'vpc_id': fakes.ID_EC2_VPC_1,
+             'os_id': fakes.ID_OS_SECURITY_GROUP_1})
+        self.db_api.update_item.assert_called_once_with(
+            mock.ANY, fakes.DB_VPC_1)
+
+        self.neutron.reset_mock()
+        self.set_mock_db_items(fakes.DB_VPC_1)
+        self._reconcile(common.RECONCILE_CREATE_DEFAULT_SECURITY_GROUP,
+                        fakes.ID_EC2_VPC_1)
+        self.assertFalse(self.neutron.list_security_groups.called)
+
+    def test_update_image_visibility(self):
+        self.set_mock_db_items(fakes.DB_IMAGE_1)
+        self.glance.images.get.return_value = fakes.OSImage(
+            dict(fakes.OS_IMAGE_1, is_public=True))
+
+        self._reconcile(common.RECONCILE_UPDATE_IMAGE_VISIBILITY,
+                        fakes.ID_EC2_IMAGE_1,
+                        {'os_id': fakes.ID_OS_IMAGE_1})
+        self.db_api.update_item.assert_called_once_with(
+            mock.ANY, dict(fakes.DB_IMAGE_1, is_public=True))
+
+    def test_reconcile_failure(self):
+        self.set_mock_db_items()
+        self.db_api.get_item_by_id.side_effect = Exception()
+        # NOTE(ft): a failed inconsistency must be removed from the queue to
+        # not block others
+        self._reconcile(common.RECONCILE_DELETE_OBSOLETE_ITEM,
+                        fakes.ID_EC2_SUBNET_1)
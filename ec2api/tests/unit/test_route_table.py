@@ -743,6 +743,10 @@ class RouteTableTestCase(base.ApiTestCase):
                                               fakes.EC2_ROUTE_TABLE_2,
                                               fakes.EC2_ROUTE_TABLE_3],
                                              orderless_lists=True))
+        self.db_api.get_items_ids.assert_called_once_with(
+            mock.ANY, 'i', item_ids=set([fakes.ID_EC2_INSTANCE_1]))
+        self.nova.servers.get.assert_called_once_with(fakes.ID_OS_INSTANCE_1)
+        self.assertFalse(self.db_api.get_item_by_id.called)
 
         resp = self.execute('DescribeRouteTables',
                             {'RouteTableId.1': fakes.ID_EC2_ROUTE_TABLE_1})
@@ -976,12 +980,13 @@ class RouteTableTestCase(base.ApiTestCase):
                 '_get_subnet_host_routes_and_gateway_ip')
     @mock.patch('ec2api.api.route_table._get_active_route_destinations')
     def test_update_host_routes(self, destinations_getter, routes_getter):
-        self.neutron.show_subnet.side_effect = tools.get_by_1st_arg_getter(
-            {fakes.ID_OS_SUBNET_1: {'subnet': fakes.OS_SUBNET_1},
-             fakes.ID_OS_SUBNET_2: {'subnet': fakes.OS_SUBNET_2}})
+        self.neutron.list_subnets.return_value = (
+            {'subnets': [fakes.OS_SUBNET_1, fakes.OS_SUBNET_2]})
+        fake_routes = [{'destination': '0.0.0.0/0',
+                        'nexthop': fakes.IP_GATEWAY_SUBNET_1}]
         routes_getter.side_effect = [
-            ('fake_routes', fakes.IP_GATEWAY_SUBNET_1),
-            ('fake_routes', None)]
+            (fake_routes, fakes.IP_GATEWAY_SUBNET_1),
+            (fake_routes, None)]
         destinations_getter.return_value = {'fake': 'objects'}
 
         route_table_api._update_host_routes(
@@ -990,6 +995,8 @@ class RouteTableTestCase(base.ApiTestCase):
 
         destinations_getter.assert_called_once_with(
             mock.ANY, fakes.DB_ROUTE_TABLE_1)
+        self.neutron.list_subnets.assert_called_once_with(
+            id=[fakes.ID_OS_SUBNET_1, fakes.ID_OS_SUBNET_2])
         self.assertEqual(2, routes_getter.call_count)
         routes_getter.assert_any_call(
             mock.ANY, fakes.DB_ROUTE_TABLE_1, fakes.CIDR_SUBNET_1,
@@ -1000,17 +1007,33 @@ class RouteTableTestCase(base.ApiTestCase):
         self.assertEqual(2, self.neutron.update_subnet.call_count)
         self.neutron.update_subnet.assert_any_call(
             fakes.ID_OS_SUBNET_1,
-            {'subnet': {'host_routes': 'fake_routes',
+            {'subnet': {'host_routes': fake_routes,
                         'gateway_ip': fakes.IP_GATEWAY_SUBNET_1}})
         self.neutron.update_subnet.assert_any_call(
             fakes.ID_OS_SUBNET_2,
-            {'subnet': {'host_routes': 'fake_routes',
+            {'subnet': {'host_routes': fake_routes,
+                        'gateway_ip': None}})
+
+        # NOTE(ft): subnets with actual host routes are not updated
+        self.neutron.update_subnet.reset_mock()
+        routes_getter.side_effect = [
+            (list(reversed(fakes.OS_SUBNET_1['host_routes'])),
+             fakes.IP_GATEWAY_SUBNET_1),
+            (fake_routes, None)]
+        route_table_api._update_host_routes(
+            base.create_context(), self.neutron, common.OnCrashCleaner(),
+            fakes.DB_ROUTE_TABLE_1, [fakes.DB_SUBNET_1, fakes.DB_SUBNET_2])
+        self.neutron.update_subnet.assert_called_once_with(
+            fakes.ID_OS_SUBNET_2,
+            {'subnet': {'host_routes': fake_routes,
                         'gateway_ip': None}})
 
         self.neutron.reset_mock()
 
+        self.neutron.list_subnets.return_value = (
+            {'subnets': [fakes.OS_SUBNET_1]})
         routes_getter.side_effect = None
-        routes_getter.return_value = ('fake_routes', fakes.IP_GATEWAY_SUBNET_2)
+        routes_getter.return_value = (fake_routes, fakes.IP_GATEWAY_SUBNET_2)
         try:
             with common.OnCrashCleaner() as cleaner:
                 route_table_api._update_host_routes(
@@ -1026,6 +1049,36 @@ class RouteTableTestCase(base.ApiTestCase):
             {'subnet': {'host_routes': fakes.OS_SUBNET_1['host_routes'],
                         'gateway_ip': fakes.IP_GATEWAY_SUBNET_1}})
 
+        # NOTE(ft): successfully updated subnets are rolled back if others
+        # fail
+        self.neutron.reset_mock()
+        self.neutron.list_subnets.return_value = (
+            {'subnets': [fakes.OS_SUBNET_1, fakes.OS_SUBNET_2]})
+
+        def update_subnet(os_id, body):
+            if (os_id == fakes.ID_OS_SUBNET_2 and
+                    body['subnet']['host_routes'] == fake_routes):
+                raise Exception('fake_exception')
+
+        self.neutron.update_subnet.side_effect = update_subnet
+        try:
+            with common.OnCrashCleaner() as cleaner:
+                route_table_api._update_host_routes(
+                    base.create_context(), self.neutron, cleaner,
+                    fakes.DB_ROUTE_TABLE_1,
+                    [fakes.DB_SUBNET_1, fakes.DB_SUBNET_2])
+        except Exception as ex:
+            if str(ex) != 'fake_exception':
+                raise
+        else:
+            self.fail('fake_exception is not raised')
+
+        self.assertEqual(3, self.neutron.update_subnet.call_count)
+        self.neutron.update_subnet.assert_called_with(
+            fakes.ID_OS_SUBNET_1,
+            {'subnet': {'host_routes': fakes.OS_SUBNET_1['host_routes'],
+                        'gateway_ip': fakes.IP_GATEWAY_SUBNET_1}})
+
     @mock.patch('ec2api.api.vpn_connection._update_vpn_routes')
     @mock.patch('ec2api.api.route_table._update_host_routes')
     def test_update_routes_in_associated_subnets(self, routes_updater,
@@ -16,6 +16,9 @@
 """
 Unittets for S3 objectstore clone.
 """
+import hashlib
+import os
+
 import boto
 from boto import exception as boto_exception
 from boto.s3 import connection as s3
@@ -23,6 +26,7 @@ import fixtures
 from oslo_config import cfg
 from oslo_config import fixture as config_fixture
 from oslotest import base as test_base
+import six
 
 from ec2api.s3 import s3server
 
@@ -111,6 +115,148 @@ class S3APITestCase(test_base.BaseTestCase):
 
         self._ensure_no_buckets(bucket.get_all_keys())
 
+    def test_get_key_by_chunks(self):
+        bucket_name = 'testbucket'
+        key_name = 'somekey'
+        key_contents = b'0123456789' * (s3server.CHUNK_SIZE // 4)
+
+        b = self.conn.create_bucket(bucket_name)
+        k = b.new_key(key_name)
+        k.set_contents_from_string(key_contents)
+
+        key = self.conn.get_bucket(bucket_name).get_key(key_name)
+        self.assertEqual(key_contents, key.get_contents_as_string())
+        self.assertEqual(len(key_contents), key.size)
+        self.assertEqual('"%s"' % hashlib.md5(key_contents).hexdigest(),
+                         key.etag)
+
+    def test_put_key_by_chunks(self):
+        bucket_name = 'testbucket'
+        key_name = 'somekey'
+        key_contents = b'0123456789' * (s3server.CHUNK_SIZE // 4)
+
+        b = self.conn.create_bucket(bucket_name)
+        k = b.new_key(key_name)
+        k.set_contents_from_string(key_contents)
+        self.assertEqual('"%s"' % hashlib.md5(key_contents).hexdigest(),
+                         k.etag)
+
+        # NOTE(ft): no temporary files are left and listed as buckets
+        self.assertEqual(
+            [], os.listdir(os.path.join(CONF.buckets_path, '.tmp')))
+        self._ensure_one_bucket(self.conn.get_all_buckets(), bucket_name)
+
+    def test_get_key_range_and_conditionally(self):
+        bucket_name = 'testbucket'
+        key_name = 'somekey'
+        key_contents = b'0123456789'
+
+        b = self.conn.create_bucket(bucket_name)
+        b.new_key(key_name).set_contents_from_string(key_contents)
+        key = b.get_key(key_name)
+
+        self.assertEqual(b'234', key.get_contents_as_string(
+            headers={'Range': 'bytes=2-4'}))
+        self.assertEqual(b'789', key.get_contents_as_string(
+            headers={'Range': 'bytes=-3'}))
+        error = self.assertRaises(
+            boto_exception.S3ResponseError, key.get_contents_as_string,
+            headers={'Range': 'bytes=20-30'})
+        self.assertEqual(416, error.status)
+
+        etag = '"%s"' % hashlib.md5(key_contents).hexdigest()
+        error = self.assertRaises(
+            boto_exception.S3ResponseError, key.get_contents_as_string,
+            headers={'If-None-Match': etag})
+        self.assertEqual(304, error.status)
+        self.assertEqual(key_contents, key.get_contents_as_string(
+            headers={'If-None-Match': '"fake"'}))
+
+        error = self.assertRaises(
+            boto_exception.S3ResponseError, key.get_contents_as_string,
+            headers={'If-Modified-Since': key.last_modified})
+        self.assertEqual(304, error.status)
+        self.assertEqual(key_contents, key.get_contents_as_string(
+            headers={'If-Modified-Since':
+                     'Thu, 01 Jan 2015 00:00:00 GMT'}))
+
+    def test_multipart_upload(self):
+        bucket_name = 'testbucket'
+        key_name = 'somekey'
+        b = self.conn.create_bucket(bucket_name)
+
+        upload = b.initiate_multipart_upload(key_name)
+        upload.upload_part_from_file(six.BytesIO(b'b' * 5), 2)
+        upload.upload_part_from_file(six.BytesIO(b'a' * 10), 1)
+        self.assertEqual([(1, 10), (2, 5)],
+                         [(p.part_number, p.size) for p in upload])
+        upload.complete_upload()
+
+        key = b.get_key(key_name)
+        self.assertEqual(b'a' * 10 + b'b' * 5, key.get_contents_as_string())
+        part_md5s = [hashlib.md5(b'a' * 10).digest(),
+                     hashlib.md5(b'b' * 5).digest()]
+        self.assertEqual(
+            '"%s-2"' % hashlib.md5(b''.join(part_md5s)).hexdigest(),
+            key.etag)
+        self.assertEqual([], os.listdir(os.path.join(CONF.buckets_path,
+                                                     '.uploads')))
+
+        upload = b.initiate_multipart_upload(key_name)
+        upload.upload_part_from_file(six.BytesIO(b'c'), 1)
+        upload.cancel_upload()
+        self.assertEqual([], os.listdir(os.path.join(CONF.buckets_path,
+                                                     '.uploads')))
+        self.assertRaises(boto_exception.S3ResponseError,
+                          upload.complete_upload)
+        self.assertEqual(b'a' * 10 + b'b' * 5,
+                         b.get_key(key_name).get_contents_as_string())
+
+    def test_list_keys(self):
+        bucket_name = 'testbucket'
+        b = self.conn.create_bucket(bucket_name)
+        for key_name in ('a-1', 'a-2', 'a-3', 'b-1', 'c'):
+            b.new_key(key_name).set_contents_from_string(key_name)
+        b.delete_key('a-2')
+
+        def list_keys(**kwargs):
+            keys = b.get_all_keys(**kwargs)
+            return [k.name for k in keys], keys.is_truncated
+
+        self.assertEqual((['a-1', 'a-3', 'b-1', 'c'], False), list_keys())
+        self.assertEqual((['a-1', 'a-3'], False), list_keys(prefix='a-'))
+        self.assertEqual((['a-3', 'b-1'], True),
+                         list_keys(marker='a-1', max_keys=2))
+        self.assertEqual((['b-1'], False),
+                         list_keys(prefix='b', marker='a-3'))
+        self.assertEqual(1, b.get_all_keys(prefix='c')[0].size)
+
+        # NOTE(ft): objects put into the bucket directly are listed after
+        # the index is rebuilt
+        with open(os.path.join(CONF.buckets_path, bucket_name, 'd'),
+                  'w') as f:
+            f.write('d')
+        self.assertEqual(4, len(list_keys()[0]))
+        s3server.S3Application(CONF.buckets_path).rebuild_bucket_index(
+            bucket_name)
+        self.assertEqual((['a-1', 'a-3', 'b-1', 'c', 'd'], False),
+                         list_keys())
+
+    def test_internal_directories(self):
+        self.conn.create_bucket('mybucket')
+        for bucket_name in ('.index', '.uploads', '.tmp'):
+            bucket = self.conn.get_bucket(bucket_name, validate=False)
+            self.assertRaises(boto_exception.S3ResponseError,
+                              bucket.get_all_keys)
+            self.assertRaises(boto_exception.S3ResponseError,
+                              bucket.get_key, 'mybucket.sqlite')
+            self.assertRaises(boto_exception.S3ResponseError,
+                              bucket.new_key('mybucket.sqlite').
+                              set_contents_from_string, b'fake')
+            self.assertRaises(boto_exception.S3ResponseError,
+                              self.conn.delete_bucket, bucket_name)
+        self.assertTrue(os.path.isdir(self.server.app.uploads_directory))
+
     def test_unknown_bucket(self):
         # NOTE(unicell): Since Boto v2.25.0, the underlying implementation
         # of get_bucket method changed from GET to HEAD.
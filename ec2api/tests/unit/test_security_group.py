@@ -319,7 +319,8 @@ class SecurityGroupTestCase(base.ApiTestCase):
         self.db_api.add_item.return_value = fakes.DB_SECURITY_GROUP_1
         self.nova.security_groups.create.return_value = (
             fakes.NovaSecurityGroup(fakes.OS_SECURITY_GROUP_1))
-        self.set_mock_db_items(fakes.DB_VPC_1,
+        vpc = tools.purge_dict(fakes.DB_VPC_1, ('default_group_verified',))
+        self.set_mock_db_items(vpc,
                                fakes.DB_SECURITY_GROUP_1,
                                fakes.DB_SECURITY_GROUP_2)
         self.neutron.list_security_groups.return_value = (
@@ -333,6 +334,37 @@ class SecurityGroupTestCase(base.ApiTestCase):
              'vpc_id': fakes.ID_EC2_VPC_1})
         self.nova.security_groups.create.assert_called_once_with(
             fakes.ID_EC2_VPC_1, 'Default VPC security group')
+        self.db_api.update_item.assert_called_once_with(
+            mock.ANY, fakes.DB_VPC_1)
+
+        # NOTE(ft): an existing default group of a not verified VPC is not
+        # recreated, but the VPC is marked as verified
+        self.db_api.reset_mock()
+        self.nova.security_groups.create.reset_mock()
+        self.set_mock_db_items(vpc,
+                               fakes.DB_SECURITY_GROUP_1,
+                               fakes.DB_SECURITY_GROUP_2)
+        self.neutron.list_security_groups.return_value = (
+            {'security_groups': [copy.deepcopy(fakes.OS_SECURITY_GROUP_1),
+                                 copy.deepcopy(fakes.OS_SECURITY_GROUP_2)]})
+        self.execute('DescribeSecurityGroups', {})
+        self.assertFalse(self.nova.security_groups.create.called)
+        self.db_api.update_item.assert_called_once_with(
+            mock.ANY, fakes.DB_VPC_1)
+
+        # NOTE(ft): default groups of verified VPCs are not checked
+        self.db_api.reset_mock()
+        self.neutron.list_security_groups.reset_mock()
+        self.set_mock_db_items(fakes.DB_VPC_1,
+                               fakes.DB_SECURITY_GROUP_2)
+        self.neutron.list_security_groups.return_value = (
+            {'security_groups': [fakes.OS_SECURITY_GROUP_2]})
+        self.execute('DescribeSecurityGroups', {})
+        self.assertFalse(self.nova.security_groups.create.called)
+        self.assertFalse(self.db_api.update_item.called)
+        self.assertEqual(1, self.neutron.list_security_groups.call_count)
+        self.db_api.get_items.assert_called_once_with(
+            mock.ANY, ('sg', 'vpc'))
 
     def test_authorize_security_group_invalid(self):
         security_group.security_group_engine = (
@@ -420,9 +452,9 @@ class SecurityGroupTestCase(base.ApiTestCase):
              'IpPermissions.1.IpProtocol': 'tcp',
              'IpPermissions.1.IpRanges.1.CidrIp': '192.168.1.0/24'})
         self.neutron.create_security_group_rule.assert_called_once_with(
-            {'security_group_rule':
-             tools.purge_dict(fakes.OS_SECURITY_GROUP_RULE_1,
-                              {'id', 'remote_group_id', 'tenant_id'})})
+            {'security_group_rules':
+             [tools.purge_dict(fakes.OS_SECURITY_GROUP_RULE_1,
+                               {'id', 'remote_group_id', 'tenant_id'})]})
         # NOTE(Alex): Openstack extension, AWS-incompability
         # IPv6 is not supported by Amazon.
         self.execute(
@@ -433,16 +465,35 @@ class SecurityGroupTestCase(base.ApiTestCase):
              'IpPermissions.1.IpProtocol': 'tcp',
              'IpPermissions.1.IpRanges.1.CidrIp': '::/0'})
         self.neutron.create_security_group_rule.assert_called_with(
-            {'security_group_rule':
-             tools.patch_dict(
+            {'security_group_rules':
+             [tools.patch_dict(
                  fakes.OS_SECURITY_GROUP_RULE_1, {'remote_ip_prefix': '::/0'},
-                 {'id', 'remote_group_id', 'tenant_id'})})
+                 {'id', 'remote_group_id', 'tenant_id'})]})
+
+        # NOTE(ft): all rules of a request are created by one bulk call
+        self.neutron.create_security_group_rule.reset_mock()
+        self.execute(
+            'AuthorizeSecurityGroupIngress',
+            {'GroupId': fakes.ID_EC2_SECURITY_GROUP_2,
+             'IpPermissions.1.FromPort': '10',
+             'IpPermissions.1.ToPort': '10',
+             'IpPermissions.1.IpProtocol': 'tcp',
+             'IpPermissions.1.IpRanges.1.CidrIp': '192.168.1.0/24',
+             'IpPermissions.1.IpRanges.2.CidrIp': '::/0'})
+        self.neutron.create_security_group_rule.assert_called_once_with(
+            {'security_group_rules':
+             [tools.purge_dict(fakes.OS_SECURITY_GROUP_RULE_1,
+                               {'id', 'remote_group_id', 'tenant_id'}),
+              tools.patch_dict(
+                  fakes.OS_SECURITY_GROUP_RULE_1,
+                  {'remote_ip_prefix': '::/0'},
+                  {'id', 'remote_group_id', 'tenant_id'})]})
 
     def test_authorize_security_group_ip_ranges_nova(self):
         security_group.security_group_engine = (
             security_group.SecurityGroupEngineNova())
         self.nova.security_group_rules.create.return_value = (
-            {'security_group_rule': [fakes.NOVA_SECURITY_GROUP_RULE_1]})
+            mock.Mock(id=fakes.NOVA_SECURITY_GROUP_RULE_1['id']))
         self.nova.security_groups.list.return_value = (
             [fakes.NovaSecurityGroup(fakes.NOVA_SECURITY_GROUP_1),
              fakes.NovaSecurityGroup(fakes.NOVA_SECURITY_GROUP_2)])
@@ -457,6 +508,21 @@ class SecurityGroupTestCase(base.ApiTestCase):
             str(fakes.ID_NOVA_OS_SECURITY_GROUP_2), 'tcp', 10, 10,
             '192.168.1.0/24', None)
 
+        # NOTE(ft): rules created before a failure are deleted
+        self.nova.security_group_rules.create.side_effect = [
+            mock.Mock(id=fakes.NOVA_SECURITY_GROUP_RULE_1['id']),
+            nova_exception.Conflict(409)]
+        self.assert_execution_error(
+            'InvalidPermission.Duplicate', 'AuthorizeSecurityGroupIngress',
+            {'GroupName': fakes.EC2_NOVA_SECURITY_GROUP_2['groupName'],
+             'IpPermissions.1.FromPort': '10',
+             'IpPermissions.1.ToPort': '10',
+             'IpPermissions.1.IpProtocol': 'tcp',
+             'IpPermissions.1.IpRanges.1.CidrIp': '192.168.1.0/24',
+             'IpPermissions.1.IpRanges.2.CidrIp': '192.168.2.0/24'})
+        self.nova.security_group_rules.delete.assert_called_once_with(
+            fakes.NOVA_SECURITY_GROUP_RULE_1['id'])
+
     def test_authorize_security_group_egress_groups(self):
         security_group.security_group_engine = (
             security_group.SecurityGroupEngineNeutron())
@@ -472,16 +538,16 @@ class SecurityGroupTestCase(base.ApiTestCase):
              'IpPermissions.1.Groups.1.GroupId':
              fakes.ID_EC2_SECURITY_GROUP_1})
         self.neutron.create_security_group_rule.assert_called_once_with(
-            {'security_group_rule':
-             tools.purge_dict(fakes.OS_SECURITY_GROUP_RULE_2,
-                              {'id', 'remote_ip_prefix', 'tenant_id',
-                               'port_range_max'})})
+            {'security_group_rules':
+             [tools.purge_dict(fakes.OS_SECURITY_GROUP_RULE_2,
+                               {'id', 'remote_ip_prefix', 'tenant_id',
+                                'port_range_max'})]})
 
     def test_authorize_security_group_groups_nova(self):
         security_group.security_group_engine = (
             security_group.SecurityGroupEngineNova())
         self.nova.security_group_rules.create.return_value = (
-            {'security_group_rule': [fakes.NOVA_SECURITY_GROUP_RULE_2]})
+            mock.Mock(id=fakes.NOVA_SECURITY_GROUP_RULE_2['id']))
         self.nova.security_groups.list.return_value = (
             [fakes.NovaSecurityGroup(fakes.NOVA_SECURITY_GROUP_1),
              fakes.NovaSecurityGroup(fakes.NOVA_SECURITY_GROUP_2)])
@@ -515,6 +581,17 @@ class SecurityGroupTestCase(base.ApiTestCase):
         self.neutron.delete_security_group_rule.assert_called_once_with(
             fakes.OS_SECURITY_GROUP_RULE_1['id'])
 
+        # NOTE(ft): an error of a concurrent rule deletion is raised
+        self.neutron.delete_security_group_rule.side_effect = (
+            neutron_exception.NotFound())
+        self.assert_execution_error(
+            self.ANY_EXECUTE_ERROR, 'RevokeSecurityGroupIngress',
+            {'GroupId': fakes.ID_EC2_SECURITY_GROUP_2,
+             'IpPermissions.1.FromPort': '10',
+             'IpPermissions.1.ToPort': '10',
+             'IpPermissions.1.IpProtocol': 'tcp',
+             'IpPermissions.1.IpRanges.1.CidrIp': '192.168.1.0/24'})
+
     def test_revoke_security_group_ingress_ip_ranges_nova(self):
         security_group.security_group_engine = (
             security_group.SecurityGroupEngineNova())
@@ -49,7 +49,8 @@ class VpcTestCase(base.ApiTestCase):
             self.db_api.add_item.assert_any_call(
                 mock.ANY, 'vpc',
                 tools.purge_dict(fakes.DB_VPC_1,
-                                 ('id', 'vpc_id', 'route_table_id')))
+                                 ('id', 'vpc_id', 'route_table_id',
+                                  'default_group_verified')))
             self.db_api.add_item.assert_any_call(
                 mock.ANY, 'rtb',
                 tools.purge_dict(fakes.DB_ROUTE_TABLE_1,
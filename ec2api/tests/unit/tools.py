@@ -68,7 +68,7 @@ def get_db_api_get_items(*items):
     def db_api_get_items(context, kind):
         return [copy.deepcopy(item)
                 for item in items
-                if ec2utils.get_ec2_id_kind(item['id']) == kind]
+                if _is_kind_of(item['id'], kind)]
     return db_api_get_items
 
 
@@ -99,12 +99,19 @@ def get_db_api_get_items_ids(*items):
     def db_api_get_items_ids(context, kind, item_ids=None, item_os_ids=None):
         return [(item['id'], item['os_id'])
                 for item in items
-                if (ec2utils.get_ec2_id_kind(item['id']) == kind and
+                if (_is_kind_of(item['id'], kind) and
                     (not item_ids or item['id'] in item_ids) and
                     (not item_os_ids or item['os_id'] in item_os_ids))]
     return db_api_get_items_ids
 
 
+def _is_kind_of(item_id, kind):
+    item_kind = ec2utils.get_ec2_id_kind(item_id)
+    if isinstance(kind, (list, tuple, set)):
+        return item_kind in kind
+    return item_kind == kind
+
+
 def get_neutron_create(kind, os_id, addon={}):
     """Generate Neutron create an object mock function."""
 
@@ -15,6 +15,7 @@
 
 """Utilities and helper functions."""
 
+import collections
 import contextlib
 import hashlib
 import hmac
@@ -22,14 +23,20 @@ import shutil
 import tempfile
 from xml.sax import saxutils
 
+import eventlet
 from oslo_config import cfg
 from oslo_log import log as logging
+from oslo_utils import timeutils
 
 from ec2api.i18n import _
 
 utils_opts = [
     cfg.StrOpt('tempdir',
                help='Explicitly specify the temporary working directory'),
+    cfg.IntOpt('os_requests_pool_size',
+               default=16,
+               help='Maximum number of concurrent requests to OpenStack '
+                    'services made by a single EC2 API operation'),
 ]
 CONF = cfg.CONF
 CONF.register_opts(utils_opts)
@@ -79,3 +86,58 @@ def xhtml_escape(value):
 
     """
     return saxutils.escape(value, {'"': '&quot;', "'": '&apos;'})
+
+
+def execute_concurrently(func, items, pool_size=None):
+    """Call func for every item on a bounded green pool.
+
+    Returns a list of (result, error) pairs in the order of items. An error
+    raised for an item is caught and returned in its pair, so that it does
+    not interrupt processing of other items.
+    """
+    pool = eventlet.GreenPool(pool_size or CONF.os_requests_pool_size)
+
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as ex:
+            return None, ex
+
+    return list(pool.imap(call, items))
+
+
+class ExpiringCache(object):
+    """Size bounded LRU cache, which entries expire after a timeout.
+
+    The cache is not protected by locks, so it's safe to use it with green
+    threads only.
+    """
+
+    def __init__(self, max_size, expiration):
+        self.max_size = max_size
+        self.expiration = expiration
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= timeutils.utcnow_ts(microsecond=True):
+            return None
+        self._entries[key] = entry
+        return value
+
+    def set(self, key, value):
+        self._entries.pop(key, None)
+        while self._entries and len(self._entries) >= self.max_size:
+            self._entries.popitem(last=False)
+        self._entries[key] = (
+            value, timeutils.utcnow_ts(microsecond=True) + self.expiration)
+
+    def pop(self, key):
+        entry = self._entries.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# Copyright 2014
+# The Cloudscaling Group, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load benchmark of EC2 API metadata server.
+
+Runs MetadataRequestHandler in-process against fake Nova, Cinder and EC2 API
+DB built from unit test fakes. A number of instances boot concurrently, each
+of them crawls metadata as cloud-init does. Requests are sent either as
+Nova-network does (the requester is found by its IP address in Nova), or as
+Neutron metadata proxy does (with signed X-Instance-ID headers).
+
+The tool reports request rate, latency percentiles and calls of OpenStack
+services and DB per instance. It measures one metadata server worker, so
+the whole server capacity is about the rate multiplied by metadata_workers.
+
+Usage (test requirements are needed):
+
+    python tools/metadata_benchmark.py --instances 200 \\
+        --backend-latency 0.02 --config-file /etc/ec2api/ec2api.conf
+
+Metadata server options (e.g. cache_expiration in [metadata] section) are
+read from the config file.
+"""
+
+from __future__ import print_function
+
+import base64
+import collections
+import sys
+import time
+import uuid
+
+import eventlet
+import mock
+from oslo_config import cfg
+import webob
+
+from ec2api import config
+from ec2api import context as ec2_context
+from ec2api import metadata
+from ec2api.tests.unit import fakes
+
+CONF = cfg.CONF
+
+benchmark_opts = [
+    cfg.IntOpt('instances',
+               default=100,
+               help='Number of booting instances'),
+    cfg.IntOpt('concurrency',
+               default=0,
+               help='Number of instances booting at the same time. '
+                    '0 means all of them'),
+    cfg.IntOpt('crawls',
+               default=1,
+               help='Number of metadata crawls per instance'),
+    cfg.FloatOpt('backend-latency',
+                 default=0.0,
+                 help='Time in seconds each call of OpenStack services '
+                      'and DB takes'),
+    cfg.BoolOpt('neutron-proxy',
+                default=False,
+                help='Send requests as Neutron metadata proxy does'),
+]
+
+CONF.register_cli_opts(benchmark_opts)
+
+_Flavor = collections.namedtuple('Flavor', ['name'])
+_FixedIp = collections.namedtuple('FixedIp', ['hostname'])
+_KeyPair = collections.namedtuple('KeyPair', ['public_key'])
+
+
+class _CallCounter(object):
+    """Count and delay calls of a fake client."""
+
+    def __init__(self, obj, name, calls):
+        self._obj = obj
+        self._name = name
+        self._calls = calls
+
+    def __getattr__(self, attr):
+        value = getattr(self._obj, attr)
+        name = '%s.%s' % (self._name, attr)
+        if callable(value):
+            def call(*args, **kwargs):
+                self._calls[name] += 1
+                if CONF.backend_latency:
+                    eventlet.sleep(CONF.backend_latency)
+                return value(*args, **kwargs)
+            return call
+        if isinstance(value, _FakeManager):
+            return _CallCounter(value, name, self._calls)
+        return value
+
+
+class _FakeManager(object):
+    pass
+
+
+class _FakeNova(object):
+
+    def __init__(self, cloud):
+        self.fixed_ips = _FakeManager()
+        self.fixed_ips.get = (
+            lambda ip: _FixedIp(cloud.os_instances_by_ip[ip]['hostname']))
+        self.servers = _FakeManager()
+        self.servers.list = (
+            lambda search_opts: [fakes.OSInstance(
+                cloud.os_instances_by_hostname[search_opts['hostname']])])
+        self.servers.get = (
+            lambda os_id: fakes.OSInstance_full(cloud.os_instances[os_id]))
+        self.flavors = _FakeManager()
+        self.flavors.get = lambda flavor_id: _Flavor('m1.small')
+        self.keypairs = _FakeManager()
+        self.keypairs.keypair_prefix = 'os-keypairs'
+        self.keypairs._get = (
+            lambda url, response_key: _KeyPair(fakes.PUBLIC_KEY_KEY_PAIR))
+
+
+class _FakeCinder(object):
+
+    def __init__(self, cloud):
+        self.volumes = _FakeManager()
+        self.volumes.get = lambda os_id: fakes.OSVolume(fakes.OS_VOLUME_2)
+
+
+class _FakeDB(object):
+
+    def __init__(self, cloud):
+        self._cloud = cloud
+
+    def get_items_ids(self, context, kind, item_ids=None, item_os_ids=None):
+        if kind == 'i':
+            return [(self._cloud.db_instances[os_id]['id'], os_id)
+                    for os_id in item_os_ids or []
+                    if os_id in self._cloud.db_instances]
+        return [(fakes.random_ec2_id(kind), os_id)
+                for os_id in item_os_ids or []]
+
+    def get_item_by_id(self, context, item_id):
+        return self._cloud.db_instances_by_id.get(item_id)
+
+    def get_items(self, context, kind):
+        return []
+
+    def add_item_id(self, context, kind, os_id, project_id=None):
+        return fakes.random_ec2_id(kind)
+
+    def get_instance_metadata(self, context, os_instance_id):
+        return None
+
+
+class _FakeCloud(object):
+
+    def __init__(self, instances_count):
+        self.calls = collections.Counter()
+        self.os_instances = {}
+        self.os_instances_by_ip = {}
+        self.os_instances_by_hostname = {}
+        self.db_instances = {}
+        self.db_instances_by_id = {}
+        user_data = base64.b64encode(b'#cloud-config\n')
+        for num in range(instances_count):
+            os_id = str(uuid.uuid4())
+            ip = '10.%s.%s.%s' % (num // 65536 % 256, num // 256 % 256,
+                                  num % 256)
+            os_instance = dict(
+                fakes.OS_INSTANCE_1,
+                id=os_id,
+                hostname='vm-%s' % num,
+                addresses={'private': [{'addr': ip,
+                                        'version': 4,
+                                        'OS-EXT-IPS:type': 'fixed'}]},
+                security_groups=[{'name': 'default'}],
+                user_data=user_data)
+            db_instance = {'id': 'i-%08x' % num,
+                           'os_id': os_id,
+                           'vpc_id': None,
+                           'reservation_id': 'r-%08x' % num,
+                           'launch_index': 0}
+            self.os_instances[os_id] = os_instance
+            self.os_instances_by_ip[ip] = os_instance
+            self.os_instances_by_hostname[os_instance['hostname']] = (
+                os_instance)
+            self.db_instances[os_id] = db_instance
+            self.db_instances_by_id[db_instance['id']] = db_instance
+        self.nova = _CallCounter(_FakeNova(self), 'nova', self.calls)
+        self.cinder = _CallCounter(_FakeCinder(self), 'cinder', self.calls)
+        self.db = _CallCounter(_FakeDB(self), 'db', self.calls)
+
+    def patch(self):
+        patchers = [
+            mock.patch('ec2api.clients.nova', lambda context: self.nova),
+            mock.patch('ec2api.clients.cinder', lambda context: self.cinder),
+            mock.patch('ec2api.db.api.IMPL', self.db),
+            mock.patch('ec2api.context.get_os_admin_context',
+                       lambda: ec2_context.RequestContext(
+                           None, None, is_os_admin=True,
+                           session=mock.sentinel.admin_session,
+                           overwrite=False)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+
+
+class _Stats(object):
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = collections.Counter()
+
+
+def _get(handler, path, os_instance, stats):
+    ip = os_instance['addresses']['private'][0]['addr']
+    request = webob.Request.blank(path, remote_addr=ip)
+    if CONF.neutron_proxy:
+        request.headers.update({
+            'X-Forwarded-For': ip,
+            'X-Instance-ID': os_instance['id'],
+            'X-Tenant-ID': fakes.ID_OS_PROJECT,
+            'X-Instance-ID-Signature': handler._sign_instance_id(
+                os_instance['id'])})
+    start = time.time()
+    response = request.get_response(handler)
+    stats.latencies.append(time.time() - start)
+    if response.status_int != 200:
+        stats.errors[response.status_int] += 1
+        return None
+    return response.body.decode('utf-8')
+
+
+def _walk(handler, path, os_instance, stats):
+    listing = _get(handler, path, os_instance, stats)
+    if not listing:
+        return
+    for item in listing.split('\n'):
+        if path.endswith('/public-keys/'):
+            # NOTE(ft): public keys are listed as '0=keyname'
+            item = item.split('=')[0] + '/'
+        if item.endswith('/'):
+            _walk(handler, path + item, os_instance, stats)
+        else:
+            _get(handler, path + item, os_instance, stats)
+
+
+def _boot(handler, os_instance, stats):
+    # NOTE(ft): cloud-init waits for metadata by requesting instance-id,
+    # then crawls meta-data tree and gets user-data
+    for _crawl in range(CONF.crawls):
+        _get(handler, '/', os_instance, stats)
+        _get(handler, '/2009-04-04/meta-data/instance-id', os_instance, stats)
+        _walk(handler, '/2009-04-04/meta-data/', os_instance, stats)
+        _get(handler, '/2009-04-04/user-data', os_instance, stats)
+
+
+def _percentile(values, percent):
+    return values[int(round(percent / 100.0 * (len(values) - 1)))]
+
+
+def main():
+    config.parse_args(sys.argv)
+
+    cloud = _FakeCloud(CONF.instances)
+    cloud.patch()
+    handler = metadata.MetadataRequestHandler()
+    stats = _Stats()
+
+    pool = eventlet.GreenPool(CONF.concurrency or CONF.instances)
+    start = time.time()
+    for os_instance in cloud.os_instances.values():
+        pool.spawn_n(_boot, handler, os_instance, stats)
+    pool.waitall()
+    duration = time.time() - start
+
+    latencies = sorted(stats.latencies)
+    print('Instances: %s, concurrency: %s, backend latency: %.3f s' %
+          (CONF.instances, CONF.concurrency or CONF.instances,
+           CONF.backend_latency))
+    print('Requests: %s in %.2f s (%.1f req/s), errors: %s' %
+          (len(latencies), duration, len(latencies) / duration,
+           dict(stats.errors) or 0))
+    if latencies:
+        print('Latency, ms: p50 %.2f, p90 %.2f, p99 %.2f, max %.2f' %
+              tuple(1000 * v for v in (_percentile(latencies, 50),
+                                       _percentile(latencies, 90),
+                                       _percentile(latencies, 99),
+                                       latencies[-1])))
+    print('Backend calls per instance:')
+    for name, count in sorted(cloud.calls.items()):
+        print('  %s: %.2f' % (name, float(count) / CONF.instances))
+
+
+if __name__ == '__main__':
+    main()